@@ -0,0 +1,2 @@
+# 扩展数据性能基准测试
+# 用法：python -m bench.run_bench --scale small
@@ -0,0 +1,306 @@
+# 扩展数据性能基准测试
+#
+# 用法：
+#   python -m bench.run_bench --scale small                     # 快速运行（500只股票）
+#   python -m bench.run_bench --scale full --output result.json  # 5500只股票 × 500条，另含4000条全历史文件
+#   python -m bench.run_bench --scale full --update-baseline     # 用本次结果更新基线
+#
+# 每个用例重复执行并记录最小耗时和中位数。绝对耗时随机器和负载波动，因此每次运行都先执行
+# 固定工作量的参照用例（reference），以 用例耗时 / 参照耗时 的相对耗时与bench/baseline.json中
+# 同规模的基线比较，相对耗时超过 基线 × threshold 时判定为性能回退，进程返回码为1。
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from bench import synthetic
+from tdx import extdata_util
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 1.3
+REFERENCE_CASE = 'reference'
+
+SCALES = {
+    'small': {'n_stocks': 500, 'n_records': 500, 'history_stocks': 200, 'history_records': 1000, 'merge_stocks': 100,
+              'info_records': 100, 'changed_stocks': 25},
+    # 全历史文件逐条解析为字典列表内存占用很大，只取部分股票
+    'full': {'n_stocks': 5500, 'n_records': 500, 'history_stocks': 1000, 'history_records': 4000,
+             'merge_stocks': 500, 'info_records': 300, 'changed_stocks': 300},
+}
+
+
+def _reference_workload() -> float:
+    """参照用例：固定工作量的numpy排序和纯Python循环，与被测函数的混合负载相近"""
+    values = np.random.default_rng(0).random(1_000_000)
+    np.sort(values)
+    total = 0.0
+    for value in values[:200_000].tolist():
+        total += value
+    return total
+
+
+class BenchCase:
+    """基准测试用例：setup在计时外执行一次，返回值作为run的参数"""
+
+    def __init__(self, name: str, run: Callable, setup: Optional[Callable] = None, repeat: int = 3):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.repeat = repeat
+
+
+def _quiet(func: Callable) -> Callable:
+    """屏蔽被测函数的print输出"""
+    def wrapper(*args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _get_all_stocks_ind_by_date() -> Callable:
+    """extdata_demo以脚本方式导入extdata_util，需要把tdx目录加入sys.path"""
+    tdx_dir = os.path.dirname(os.path.abspath(extdata_util.__file__))
+    if tdx_dir not in sys.path:
+        sys.path.insert(0, tdx_dir)
+    from extdata_demo import get_all_stocks_ind_by_date
+    return _quiet(get_all_stocks_ind_by_date)
+
+
+def build_cases(data_dir: str, scale: Dict[str, int]) -> List[BenchCase]:
+    """生成合成数据并构造用例列表"""
+    files = synthetic.generate_incremental_pair(os.path.join(data_dir, 'work'), os.path.join(data_dir, 'base'),
+                                                n_stocks=scale['n_stocks'], n_records=scale['n_records'])
+    work_idx, work_dat = files['work']
+    base_idx, base_dat = files['base']
+
+    history_dates = synthetic.trading_dates(count=scale['history_records'])
+    history_idx, history_dat = synthetic.write_extdata(
+        os.path.join(data_dir, 'history'), 1,
+        synthetic.generate_records(synthetic.stock_codes(scale['history_stocks']), history_dates,
+                                   scale['history_records'], seed=2))
+
+    info_path = synthetic.generate_info(os.path.join(data_dir, 'extdata.info'),
+                                        [f'指标{i}' for i in range(1, scale['info_records'] + 1)])
+
+    # 第二天的合并：大部分股票的增量数据与上次相同，比较校验和跳过与整文件合并
+    checksum_path = os.path.join(data_dir, 'rerun', 'checksum.csv')
+    rerun = synthetic.generate_rerun(files['work'], files['base'], os.path.join(data_dir, 'rerun'), checksum_path,
+                                     scale['changed_stocks'])
+    rerun_args = (*rerun['work'], *rerun['base'])
+
+    out_dir = os.path.join(data_dir, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+    out_idx, out_dat = extdata_util.extdata_file_paths(out_dir, 42)
+    target_date = int(synthetic.trading_dates(count=10)[0])
+
+    def load_pair():
+        work_idx_df = extdata_util.load_idx_data(work_idx)
+        base_idx_df = extdata_util.load_idx_data(base_idx)
+        return (work_idx_df, extdata_util.load_stock_data_optimized(work_dat, work_idx_df),
+                base_idx_df, extdata_util.load_stock_data_optimized(base_dat, base_idx_df))
+
+    def merge_inputs():
+        work_idx_df, work_data, base_idx_df, base_data = load_pair()
+        codes = [code for code in work_data if code in base_data][:scale['merge_stocks']]
+        return [(work_data[code], base_data[code]) for code in codes]
+
+    def merge_all(merge: Callable) -> Callable:
+        def run(pairs):
+            for old_data, new_data in pairs:
+                merge(old_data, new_data)
+        return run
+
+    def updated_data():
+        return extdata_util.process_incremental_update_optimized(*load_pair())
+
+    def load_idx(path):
+        return lambda: extdata_util.load_idx_data(path)
+
+    get_all_stocks_ind_by_date = _get_all_stocks_ind_by_date()
+
+    return [
+        BenchCase(REFERENCE_CASE, _reference_workload),
+        BenchCase('parse_file_info', lambda: extdata_util.parse_file_info(info_path)),
+        BenchCase('parse_file_idx', lambda: extdata_util.parse_file_idx(work_idx)),
+        BenchCase('parse_file_dat', lambda: extdata_util.parse_file_dat(work_dat)),
+        BenchCase('parse_file_dat_history', lambda: extdata_util.parse_file_dat(history_dat)),
+        BenchCase('load_idx_data', lambda: extdata_util.load_idx_data(work_idx)),
+        BenchCase('load_stock_data_optimized', lambda idx_df: extdata_util.load_stock_data_optimized(work_dat, idx_df),
+                  setup=load_idx(work_idx)),
+        BenchCase('load_stock_data_optimized_history',
+                  lambda idx_df: extdata_util.load_stock_data_optimized(history_dat, idx_df),
+                  setup=load_idx(history_idx)),
+        BenchCase('merge_stock_data', merge_all(extdata_util.merge_stock_data), setup=merge_inputs),
+        BenchCase('merge_stock_data_fast', merge_all(extdata_util.merge_stock_data_fast), setup=merge_inputs),
+        BenchCase('merge_stock_data_robust', merge_all(extdata_util.merge_stock_data_robust), setup=merge_inputs),
+        BenchCase('process_incremental_update_optimized',
+                  lambda args: extdata_util.process_incremental_update_optimized(*args), setup=load_pair),
+        BenchCase('process_incremental_update_files_bulk',
+                  lambda: extdata_util.process_incremental_update_files_bulk(work_idx, work_dat, base_idx, base_dat,
+                                                                             out_idx, out_dat)),
+        BenchCase('process_incremental_update_files_bulk_rerun',
+                  lambda: extdata_util.process_incremental_update_files_bulk(*rerun_args, out_idx, out_dat)),
+        BenchCase('process_incremental_update_files_bulk_checksum',
+                  lambda: extdata_util.process_incremental_update_files_bulk(*rerun_args, out_idx, out_dat,
+                                                                             checksum_path=checksum_path)),
+        BenchCase('generate_dat_file', lambda result: extdata_util.generate_dat_file(result[1], out_dat),
+                  setup=updated_data),
+        BenchCase('generate_idx_file', lambda result: extdata_util.generate_idx_file(result[0], out_idx),
+                  setup=updated_data),
+        BenchCase('get_all_stocks_ind_by_date', lambda: get_all_stocks_ind_by_date(work_idx, work_dat, target_date)),
+    ]
+
+
+def run_case(case: BenchCase) -> Dict[str, float]:
+    """执行用例，返回最小耗时、中位数（秒）和重复次数"""
+    arg = case.setup() if case.setup else None
+    timings = []
+    for _ in range(case.repeat):
+        start = time.perf_counter()
+        if case.setup:
+            case.run(arg)
+        else:
+            case.run()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings), 'repeat': case.repeat}
+
+
+def relative_timings(results: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """各用例最小耗时相对参照用例的倍数"""
+    reference = results[REFERENCE_CASE]['min']
+    return {name: result['min'] / reference for name, result in results.items() if name != REFERENCE_CASE}
+
+
+def compare_with_baseline(results: Dict[str, Dict[str, float]], baseline: Dict) -> Dict[str, Dict]:
+    """
+    按相对参照用例的耗时与基线比较
+
+    Returns:
+        Dict: 用例名 -> {'baseline', 'current', 'ratio', 'threshold', 'status'}，
+              baseline/current为相对耗时，ratio为 current / baseline，
+              status为 regression / improved / ok / new
+    """
+    comparison = {}
+    default_threshold = baseline.get('default_threshold', DEFAULT_THRESHOLD)
+    cases = baseline.get('cases', {})
+    for name, relative in relative_timings(results).items():
+        if 'relative' not in cases.get(name, {}):
+            # 新用例，或仍是绝对耗时的旧基线，需要 --update-baseline 重新校准
+            comparison[name] = {'current': relative, 'status': 'new'}
+            continue
+        base = cases[name]
+        threshold = base.get('threshold', default_threshold)
+        ratio = relative / base['relative'] if base['relative'] > 0 else float('inf')
+        if ratio > threshold:
+            status = 'regression'
+        elif ratio < 1 / threshold:
+            status = 'improved'
+        else:
+            status = 'ok'
+        comparison[name] = {'baseline': base['relative'], 'current': relative, 'ratio': ratio,
+                            'threshold': threshold, 'status': status}
+    return comparison
+
+
+def load_baseline(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def update_baseline(path: str, scale_name: str, results: Dict[str, Dict[str, float]]) -> None:
+    """用本次结果的相对耗时更新基线，保留已有用例的threshold"""
+    baseline_all = load_baseline(path)
+    baseline = baseline_all.setdefault(scale_name, {'default_threshold': DEFAULT_THRESHOLD, 'cases': {}})
+    cases = baseline.setdefault('cases', {})
+    for name, relative in relative_timings(results).items():
+        case = cases.setdefault(name, {})
+        case.pop('seconds', None)
+        case['relative'] = round(relative, 6)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline_all, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def print_report(comparison: Dict[str, Dict]) -> None:
+    print(f"{'用例':<40}{'基线':>10}{'本次':>10}{'倍数':>8}  状态（相对参照用例耗时）")
+    for name, item in comparison.items():
+        baseline = f"{item['baseline']:.4f}" if 'baseline' in item else '-'
+        ratio = f"{item['ratio']:.2f}" if 'ratio' in item else '-'
+        print(f"{name:<40}{baseline:>10}{item['current']:>10.4f}{ratio:>8}  {item['status']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="扩展数据性能基准测试")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="数据规模")
+    parser.add_argument('--cases', nargs='*', help="只运行指定的用例")
+    parser.add_argument('--repeat', type=int, default=3, help="每个用例的重复次数")
+    parser.add_argument('--output', help="结果JSON文件路径")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="基线JSON文件路径")
+    parser.add_argument('--update-baseline', action='store_true', help="用本次结果更新基线")
+    parser.add_argument('--data-dir', help="合成数据目录，默认使用临时目录")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    scale = SCALES[args.scale]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = args.data_dir or temp_dir
+        print(f"生成合成数据: {data_dir}，规模: {args.scale} {scale}")
+        cases = build_cases(data_dir, scale)
+        if args.cases:
+            # 参照用例总是执行
+            cases = [case for case in cases if case.name in args.cases or case.name == REFERENCE_CASE]
+
+        results = {}
+        for case in cases:
+            case.repeat = args.repeat
+            results[case.name] = run_case(case)
+            print(f"{case.name}: {results[case.name]['min']:.4f}s")
+
+    baseline = load_baseline(args.baseline).get(args.scale, {})
+    comparison = compare_with_baseline(results, baseline)
+    print_report(comparison)
+
+    report = {
+        'scale': args.scale,
+        'params': scale,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'results': results,
+        'comparison': comparison,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+    if args.update_baseline:
+        update_baseline(args.baseline, args.scale, results)
+        print(f"基线已更新: {args.baseline}")
+        return 0
+
+    regressions = [name for name, item in comparison.items() if item['status'] == 'regression']
+    if regressions:
+        print(f"性能回退: {regressions}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# 合成扩展数据生成器
+# 按固定随机种子生成与通达信extdata格式一致的idx/dat/info文件，用于性能基准测试
+
+import os
+import shutil
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tdx.extdata_util import (DAT_DTYPE, ExtDataIndex, build_idx_array, extdata_file_paths,
+                              process_incremental_update_files_bulk, write_dat_array, write_idx_array)
+
+
+def trading_dates(end_date: int = 20250829, count: int = 4000) -> np.ndarray:
+    """截止end_date的count个工作日（近似交易日），返回YYYYMMDD整数数组"""
+    end = np.datetime64(f"{str(end_date)[:4]}-{str(end_date)[4:6]}-{str(end_date)[6:]}")
+    days = np.arange(end - np.timedelta64(count * 2, 'D'), end + np.timedelta64(1, 'D'))
+    days = days[np.is_busday(days)][-count:]
+    return np.array([int(str(day).replace('-', '')) for day in days], dtype=np.int64)
+
+
+def stock_codes(count: int, offset: int = 0) -> List[str]:
+    """生成count个6位股票代码，沪深北交替；offset为编号偏移，用于生成不重复的新上市代码"""
+    prefixes = ('60', '00', '30', '68', '83')
+    return sorted(f"{prefixes[i % len(prefixes)]}{i // len(prefixes) + offset:04d}" for i in range(count))
+
+
+def generate_records(codes: List[str], dates: np.ndarray, n_records: int, seed: int = 0,
+                     gap_ratio: float = 0.02, value_scale: float = 100.0) -> Dict[str, np.ndarray]:
+    """
+    为每只股票生成最近n_records个交易日的记录
+
+    Args:
+        codes: 股票代码列表
+        dates: 交易日数组（升序）
+        n_records: 每只股票的最大记录数
+        seed: 随机种子
+        gap_ratio: 停牌缺失的记录比例
+        value_scale: 数值范围
+
+    Returns:
+        Dict: 股票代码 -> DAT_DTYPE结构化数组
+    """
+    rng = np.random.default_rng(seed)
+    window = dates[-n_records:]
+    result = {}
+    for code in codes:
+        # 部分股票上市较晚，记录数少于n_records
+        start = int(rng.integers(0, len(window) // 4)) if rng.random() < 0.1 else 0
+        keep = rng.random(len(window) - start) >= gap_ratio
+        stock_dates = window[start:][keep]
+        records = np.zeros(len(stock_dates), dtype=DAT_DTYPE)
+        records['date_int'] = stock_dates
+        records['value_f'] = rng.random(len(stock_dates)) * value_scale
+        result[code] = records
+    return result
+
+
+def write_extdata(extdata_dir: str, slot: int, stock_records: Dict[str, np.ndarray]) -> Tuple[str, str]:
+    """按股票代码顺序写出extdata_{slot}.idx/.dat，返回(idx路径, dat路径)"""
+    os.makedirs(extdata_dir, exist_ok=True)
+    idx_path, dat_path = extdata_file_paths(extdata_dir, slot)
+    codes = list(stock_records)
+    market_codes = [1 if code.startswith('6') else 0 for code in codes]
+    counts = [len(stock_records[code]) for code in codes]
+    write_idx_array(idx_path, build_idx_array(market_codes, codes, counts))
+    if codes:
+        write_dat_array(dat_path, np.concatenate([stock_records[code] for code in codes]))
+    else:
+        write_dat_array(dat_path, np.zeros(0, dtype=DAT_DTYPE))
+    return idx_path, dat_path
+
+
+def generate_incremental_pair(work_dir: str, base_dir: str, slot: int = 42, n_stocks: int = 5500,
+                              n_records: int = 500, new_days: int = 5, n_new: int = 20,
+                              n_delisted: int = 20, seed: int = 0) -> Dict[str, Tuple[str, str]]:
+    """
+    生成增量更新场景的work/base两组文件
+
+    work为截止new_days天前的全量数据；base为最近的数据窗口，最后new_days天有新数据，
+    其中n_new只股票为新上市代码（work中不存在），n_delisted只work中的股票在base中已退市。
+
+    Returns:
+        Dict: {'work': (idx, dat), 'base': (idx, dat)}
+    """
+    dates = trading_dates(count=n_records + new_days)
+    codes = stock_codes(n_stocks)
+    work_records = generate_records(codes, dates[:-new_days], n_records, seed=seed)
+
+    base_codes = codes[n_delisted:] + stock_codes(n_new, offset=n_stocks)
+    base_records = generate_records(sorted(base_codes), dates, n_records, seed=seed + 1)
+    return {
+        'work': write_extdata(work_dir, slot, work_records),
+        'base': write_extdata(base_dir, slot, base_records),
+    }
+
+
+def generate_rerun(work: Tuple[str, str], base: Tuple[str, str], rerun_dir: str, checksum_path: str,
+                   n_changed: int) -> Dict[str, Tuple[str, str]]:
+    """
+    模拟第二天的增量合并：复制work/base到rerun_dir，合并一次（保存校验和）并把输出复制回work，
+    再修改base中n_changed只股票最后一条记录的数值
+
+    Returns:
+        Dict: {'work': (idx, dat), 'base': (idx, dat)}
+    """
+    files = {}
+    for name, paths in (('work', work), ('base', base)):
+        os.makedirs(os.path.join(rerun_dir, name), exist_ok=True)
+        files[name] = tuple(shutil.copy(path, os.path.join(rerun_dir, name)) for path in paths)
+    output = tuple(os.path.join(rerun_dir, os.path.basename(path)) for path in work)
+    process_incremental_update_files_bulk(*files['work'], *files['base'], *output, checksum_path=checksum_path)
+    for src, dst in zip(output, files['work']):
+        shutil.copy(src, dst)
+
+    index = ExtDataIndex.from_file(files['base'][0])
+    records = np.memmap(files['base'][1], dtype=DAT_DTYPE, mode='r+')
+    last_rows = (index.cum_sum + index.record_count - 1)[index.record_count > 0][:n_changed]
+    records['value_f'][last_rows] += 1
+    records.flush()
+    del records
+    return files
+
+
+def generate_info(info_path: str, names: List[str], create_date: int = 20250829) -> str:
+    """生成extdata.info，每个指标一条记录"""
+    with open(info_path, 'wb') as f:
+        for seq, name in enumerate(names, start=1):
+            f.write(struct.pack('<H64sIII82xbII124x', seq, name.encode('gb2312'),
+                                create_date, 150000, 0, 0, 0, 0))
+    return info_path
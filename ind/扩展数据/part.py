@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+from hikyuu import *
+
+# 部件目录不在项目根目录下，导入tdx包前需要加入sys.path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from tdx.extdata_util import MARKET_CODES, ExtDataStore, extdata_file_paths, file_fingerprint
+
+author = "admin"
+version = "20251018"
+
+# 通达信扩展数据目录，可通过环境变量TDX_EXTDATA_DIR指定
+DEFAULT_EXTDATA_DIR = os.environ.get('TDX_EXTDATA_DIR', "C:\\hwx\\T0002\\extdata")
+
+
+class ExtDataSource:
+    """
+    单个扩展数据文件的共享数据源
+
+    dat文件只做一次内存映射，文件被通达信刷新（大小或修改时间变化）后自动重新打开；
+    按 (市场代码, 股票代码, K线日期序列) 缓存对齐后的数值，超过cache_size只股票时淘汰最久未使用的。
+    """
+
+    _sources = {}
+
+    def __init__(self, extdata_dir: str, slot: int, cache_size: int):
+        self.idx_path, self.dat_path = extdata_file_paths(extdata_dir, slot)
+        self.cache_size = cache_size
+        self._store = None
+        self._fingerprint = None
+        self._cache = OrderedDict()
+
+    @classmethod
+    def get(cls, extdata_dir: str, slot: int, cache_size: int) -> 'ExtDataSource':
+        key = (os.path.abspath(extdata_dir), slot)
+        source = cls._sources.get(key)
+        if source is None:
+            source = cls._sources[key] = cls(extdata_dir, slot, cache_size)
+        source.cache_size = max(source.cache_size, cache_size)
+        return source
+
+    def store(self) -> ExtDataStore:
+        fingerprint = file_fingerprint(self.idx_path) + file_fingerprint(self.dat_path)
+        if self._store is None or fingerprint != self._fingerprint:
+            if self._store is not None:
+                self._store.close()
+            self._store = ExtDataStore(self.idx_path, self.dat_path)
+            self._fingerprint = fingerprint
+            self._cache.clear()
+        return self._store
+
+    def values(self, market_code, stock_code: str, dates: tuple):
+        """股票在给定日期序列上的数值（缓存），没有数据的日期为NaN；沪深同名代码按市场代码区分"""
+        store = self.store()
+        # 以完整日期序列的摘要为键，端点相同的不同日期序列不会混用
+        key = (market_code, stock_code, hashlib.sha1(np.asarray(dates, dtype=np.int64).tobytes()).digest())
+        values = self._cache.get(key)
+        if values is not None:
+            self._cache.move_to_end(key)
+            return values
+
+        values = store.align(stock_code, dates, market_code=market_code)
+        self._cache[key] = values
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return values
+
+
+class ExtDataImp(IndicatorImp):
+    """从扩展数据文件直接生成指标值，按上下文K线的股票代码和日期对齐"""
+
+    def __init__(self, slot=1, extdata_dir=DEFAULT_EXTDATA_DIR, scale=1.0, cache_size=512):
+        super(ExtDataImp, self).__init__(f"扩展数据{slot}", 1)
+        self.slot = slot
+        self.extdata_dir = extdata_dir
+        self.scale = scale
+        self.cache_size = cache_size
+
+    def _calculate(self, ind):
+        k = self.get_context()
+        total = len(k)
+        self._ready_buffer(total, 1)
+        if total == 0:
+            return
+
+        source = ExtDataSource.get(self.extdata_dir, self.slot, self.cache_size)
+        dates = tuple(d.ymd for d in k.get_datetime_list())
+        stock = k.get_stock()
+        values = source.values(MARKET_CODES.get(stock.market.upper()), stock.code, dates)
+        for i in range(total):
+            self._set(float(values[i]) * self.scale, i, 0)
+
+    def _clone(self):
+        return ExtDataImp(self.slot, self.extdata_dir, self.scale, self.cache_size)
+
+
+def part(slot=1, extdata_dir=DEFAULT_EXTDATA_DIR, scale=1.0, cache_size=512):
+    """
+    通达信扩展数据指标：读取extdata_{slot}.dat中K线所属股票的数据段，按K线日期对齐，无数据的日期为空值。
+    可直接用于get_inds_view、INSUM等多股票筛选，无需经过DataFrame和df_to_ind/ALIGN转换。
+
+    :param slot: 扩展数据序号，如RPS10为1
+    :param extdata_dir: 扩展数据目录
+    :param scale: 数值缩放系数，如RPS数据需要除以10时为0.1
+    :param cache_size: 缓存对齐结果的最大股票数
+    :return: 扩展数据指标
+    """
+    ret = Indicator(ExtDataImp(slot, extdata_dir, scale, cache_size))
+    ret.name = f"扩展数据{slot}"
+    return ret
+
+
+if __name__ == "__main__":
+    # 执行 testall 命令时，会多传入一个参数，防止测试时间过长
+    # 比如如果在测试代码中执行了绘图操作，可以打开下面的注释代码
+    # 此时执行 testall 命令时，将直接返回
+    if len(sys.argv) > 1:
+        print("ignore test")
+        exit(0)
+
+    if sys.platform == 'win32':
+        os.system('chcp 65001')
+
+    # 仅加载测试需要的数据，请根据需要修改
+    options = {
+        "stock_list": ["sh600010", "sz000001"],
+        "ktype_list": ["day"],
+        "load_history_finance": False,
+        "load_weight": False,
+        "start_spot": False,
+        "spot_worker_num": 1,
+    }
+    load_hikyuu(**options)
+
+    # 请在下方编写测试代码
+    rps_10 = part(slot=1, scale=0.1)
+    k = sm['sh600010'].get_kdata(Query(-100, recover_type=Query.FORWARD))
+    x = rps_10(k)
+    print(x)
+
+    stks = [sm[code] for code in options['stock_list']]
+    print(get_inds_view(stks, [rps_10], k[-1].datetime))
+
+    import matplotlib.pyplot as plt
+    ax1, ax2 = create_figure(2)
+    k.plot(axes=ax1)
+    x.plot(axes=ax2)
+    plt.show()
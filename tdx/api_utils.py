@@ -2,9 +2,10 @@ import logging
 import os
 from datetime import datetime, timedelta
 
-import akshare as ak
 import pandas as pd
 
+from tdx.trade_calendar import TradingCalendar, date_to_int, default_refresher, get_calendar, int_to_str
+
 # 配置日志
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -40,6 +41,20 @@ class APIUtils:
             raise ValueError("旧值不能为零，否则无法计算百分比变化。")
         return ((new_value - old_value) / old_value) * 100
 
+    @staticmethod
+    def get_refreshed_calendar(through) -> TradingCalendar:
+        """
+        获取覆盖到through的交易日历
+
+        本地交易日文件未覆盖through时通过refresher（默认akshare，设置TDX_TRADE_DATES_SOURCE时读取该文件）
+        获取最新交易日并合并到本地文件，每天最多获取一次；之后的查询都在内存中完成。
+        """
+        calendar = get_calendar()
+        if calendar.refresher is None:
+            calendar.refresher = default_refresher()
+        calendar.ensure_covers(through)
+        return calendar
+
     @classmethod
     def get_previous_trading_day(cls, date):
         '''
@@ -48,14 +63,10 @@ class APIUtils:
         :return:
         '''
         try:
-            # 交易日期列表
-            trade_dates = ak.tool_trade_date_hist_sina()
-            # trade_dates的'trade_date'列是datetime类型，需要转换为字符串类型列表
-            trade_dates['trade_date'] = trade_dates['trade_date'].apply(lambda x: x.strftime('%Y-%m-%d'))
-            # 筛选出指定日期之前的交易日
-            previous_trading_day = trade_dates[trade_dates['trade_date'] < date]['trade_date'].iloc[-1]
-            # 将日期转换为字符串格式
-            return previous_trading_day
+            previous_trading_day = cls.get_refreshed_calendar(date).previous(date)
+            if previous_trading_day is None:
+                raise ValueError(f"{date}之前没有交易日")
+            return int_to_str(previous_trading_day)
 
         except Exception as e:
             logging.error(f"Error fetching trade dates: {str(e)}")
@@ -70,39 +81,15 @@ class APIUtils:
         :return: 交易日期列表，如果出错返回空列表
         """
         try:
-            trade_dates = APIUtils.get_trade_dates_from_local()
-            if not trade_dates:
+            calendar = get_calendar()
+            if len(calendar) == 0:
                 logging.warning("交易日列表为空")
                 return []
-
-            # 确保交易日列表已排序
-            trade_dates = sorted(trade_dates)
-
-            # 处理start_date不在交易日列表中的情况
-            if start_date not in trade_dates:
-                # 使用bisect快速查找插入位置
-                import bisect
-                pos = bisect.bisect_left(trade_dates, start_date)
-                if pos == len(trade_dates):
-                    return []  # 所有日期都小于start_date
-                start_index = pos
-            else:
-                start_index = trade_dates.index(start_date)
-
-            # 处理边界情况
-            if n >= 0:
-                end_index = min(start_index + n, len(trade_dates))
-                return trade_dates[start_index:end_index]
-            else:
-                start_index = max(0, start_index + n)  # n为负数，所以是减
-                return trade_dates[start_index:start_index - n]  # -n得到正数
-
+            return calendar.to_str_list(calendar.range(start_date, n))
         except Exception as e:
             logging.error(f"获取交易日范围出错: {str(e)}", exc_info=True)
             return []
 
-
-
     @staticmethod
     def get_trade_dates_between(start_date, end_date):
         """
@@ -110,14 +97,8 @@ class APIUtils:
         :return: 交易日期列表
         """
         try:
-            list = APIUtils.get_trade_dates_from_local()
-            # 交易日期列表
-            trade_dates = pd.DataFrame(list, columns=['trade_date'])
-            trade_dates['trade_date'] = trade_dates['trade_date'].apply(lambda x: x.strftime('%Y-%m-%d'))
-            # 筛选出指定时间段内的交易日
-            trade_dates = trade_dates[(trade_dates['trade_date'] >= start_date) & (trade_dates['trade_date'] <= end_date)]['trade_date'].tolist()
-            # 将日期转换为字符串格式
-            return trade_dates
+            calendar = get_calendar()
+            return calendar.to_str_list(calendar.between(start_date, end_date))
         except Exception as e:
             logging.error(f"Error fetching trade dates: {str(e)}")
             return []
@@ -125,18 +106,12 @@ class APIUtils:
     @staticmethod
     def get_trade_dates_from_local():
         """
-        从txt文件中读入交易日期列表
+        从txt文件中读入交易日期列表（由TradingCalendar缓存，文件变化时自动重新加载）
         :return: 交易日期列表
         """
         try:
-            # 获取项目根目录
-            project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            # 拼接完整文件路径
-            file_path = os.path.join(project_root, 'tdx', 'trade_dates.txt')
-
-            with open(file_path, 'r') as f:
-                trade_dates = f.read().splitlines()
-            return trade_dates
+            calendar = get_calendar()
+            return calendar.to_str_list(calendar.dates)
         except Exception as e:
             logging.error(f"Error reading trade dates from file: {str(e)}")
             return []
@@ -149,25 +124,10 @@ class APIUtils:
         :return: 最近一个交易日的日期，如果出错返回None
         """
         try:
-            # 交易日期列表
-            trade_dates = APIUtils.get_trade_dates_from_local()
-            #trade_dates的'trade_date'列是str类型
-            # 筛选出少于等于指定日期的交易日
-            import bisect
-            index = bisect.bisect_left(trade_dates, target_date)
-            # 处理三种情况：
-            # 1. 日期在列表末尾之后
-            # 2. 日期精确匹配
-            # 3. 日期在列表中间但不存在
-            if index >= len(trade_dates):
-                return trade_dates[-1]
-            elif trade_dates[index] == target_date:
-                return target_date
-            else:
-                return trade_dates[index - 1] if index > 0 else None
-
+            nearest = get_calendar().nearest(target_date)
+            return int_to_str(nearest) if nearest is not None else None
         except Exception as e:
-            logging.error(f"获取指定日期{date}的最近一个交易日出错: {str(e)}", exc_info=True)
+            logging.error(f"获取指定日期{target_date}的最近一个交易日出错: {str(e)}", exc_info=True)
             return None
 
     @staticmethod
@@ -176,8 +136,8 @@ class APIUtils:
         从日期列表中获取指定date开始往前数第n个交易日的日期
         先定位date在日期列表中的位置，然后往前数n个交易日
         :param date: 日期，格式为 YYYY-MM-DD
-        :param n: 往后的交易日数量，必须为正整数
-        :return: 往后第n个交易日的日期，如果出错返回None
+        :param n: 往前的交易日数量，必须为正整数
+        :return: 往前第n个交易日的日期，如果出错或超出交易日列表范围返回None
         """
         try:
             # 检查n是否为正整数
@@ -185,31 +145,19 @@ class APIUtils:
                 logging.warning("n必须为正整数")
                 return None
 
-            # 获取交易日列表
-            trade_dates = APIUtils.get_trade_dates_from_local()
-            if not trade_dates:
+            calendar = get_calendar()
+            if len(calendar) == 0:
                 logging.warning("交易日列表为空")
                 return None
 
-            # 确保交易日列表已排序
-            trade_dates = sorted(trade_dates)
-
-            # 找到date在交易日列表中的位置
-            import bisect
-            date_index = bisect.bisect_left(trade_dates, date)
-
-            # 计算目标索引：往后数第n个交易日，即date_index + n -1
-            target_index = date_index - n + 1
-
-            # 检查目标索引是否超出范围
-            if target_index >= len(trade_dates):
-                logging.warning(f"无法获取往后第{n}个交易日，超出交易日列表范围")
+            target = calendar.n_days_before(date, n)
+            if target is None:
+                logging.warning(f"无法获取往前第{n}个交易日，超出交易日列表范围")
                 return None
-
-            return trade_dates[target_index]
+            return int_to_str(target)
 
         except Exception as e:
-            logging.error(f"获取{date}往后第{n}个交易日的日期出错: {str(e)}", exc_info=True)
+            logging.error(f"获取{date}往前第{n}个交易日的日期出错: {str(e)}", exc_info=True)
             return None
 
 
@@ -226,8 +174,6 @@ class APIUtils:
         """
         try:
             today = datetime.today().strftime('%Y-%m-%d')
-            # 交易日期列表
-            trade_dates = ak.tool_trade_date_hist_sina()
             if default_date is None:
                 # 默认昨天
                 default_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
@@ -236,12 +182,10 @@ class APIUtils:
             if latest_date is None:
                 latest_date = default_date
 
-            # trade_dates的'trade_date'列是datetime类型，需要转换为字符串类型列表
-            trade_dates['trade_date'] = trade_dates['trade_date'].apply(lambda x: x.strftime('%Y-%m-%d'))
+            calendar = APIUtils.get_refreshed_calendar(today)
             # 筛选出指定时间段内的交易日
-            trade_dates = \
-            trade_dates[(trade_dates['trade_date'] > latest_date) & (trade_dates['trade_date'] <= today)][
-                'trade_date'].tolist()
+            trade_dates = calendar.between(latest_date, today)
+            trade_dates = calendar.to_str_list(trade_dates[trade_dates > date_to_int(latest_date)])
 
             # 将日期转换为字符串格式
             return trade_dates
@@ -65,7 +65,8 @@ def get_all_stocks_ind_by_date(
     dat_file_path: str,
     target_date: int,
     output_file: Optional[str] = None,
-    max_display_rows: int = 30
+    max_display_rows: int = 30,
+    date_index_path: Optional[str] = None
 ) -> Optional[pd.DataFrame]:
     """
     获取指定日期的所有股票数据，并按value_f倒序排序
@@ -76,6 +77,7 @@ def get_all_stocks_ind_by_date(
         target_date: 目标日期，格式如20200221
         output_file: 输出CSV文件路径（可选）
         max_display_rows: 最大显示行数
+        date_index_path: 日期索引文件路径（可选），重复查询同一文件时复用
     
     Returns:
         排序后的DataFrame或None（如果没有找到数据）
@@ -90,44 +92,23 @@ def get_all_stocks_ind_by_date(
         return None
     
     try:
-        # 2. 加载索引数据
+        # 2. 加载索引数据，内存映射数据文件
         print(f"正在加载索引文件: {idx_file_path}...")
-        idx_df = load_idx_data(idx_file_path)
-        
-        if idx_df.empty:
-            print("警告: 索引文件没有有效数据")
-            return None
-        
-        print(f"索引文件加载完成，共包含 {len(idx_df)} 只股票")
-        
-        # 3. 加载所有股票数据
-        print(f"正在加载所有股票数据: {dat_file_path}...")
-        all_stock_data = load_dat_data(dat_file_path, idx_df)
-        print(f"数据加载完成，成功加载 {len(all_stock_data)} 只股票的数据")
-        
-        # 4. 提取指定日期的数据
-        result_list = []
-        found_count = 0
-        
-        print(f"正在筛选日期 {target_date} 的数据...")
-        for stock_code, df in all_stock_data.items():
-            if not df.empty:
-                # 查找特定日期的数据
-                date_data = df[df['date_int'] == target_date]
-                
-                if not date_data.empty:
-                    value_f = date_data['value_f'].iloc[0]
-                    result_list.append({
-                        'stock_code': stock_code,
-                        'value_f': value_f
-                    })
-                    found_count += 1
-        
-        # 5. 转换为DataFrame并排序
-        if result_list:
-            result_df = pd.DataFrame(result_list)
-            # 按value_f倒序排序
-            result_df = result_df.sort_values(by='value_f', ascending=False).reset_index(drop=True)
+        with ExtDataStore(idx_file_path, dat_file_path) as store:
+            if len(store) == 0:
+                print("警告: 索引文件没有有效数据")
+                return None
+
+            print(f"索引文件加载完成，共包含 {len(store)} 只股票")
+
+            # 3. 截面查询指定日期的数据
+            print(f"正在筛选日期 {target_date} 的数据...")
+            date_index = ExtDataDateIndex.open(date_index_path, store) if date_index_path else None
+            values = store.cross_section(target_date, date_index=date_index)
+
+        # 4. 转换为DataFrame（已按value_f倒序排序）
+        if not values.empty:
+            result_df = values.rename('value_f').reset_index()
             
             print(f"\n在日期 {target_date} 找到 {len(result_df)} 条记录，按value_f倒序排序:")
             # 打印前N行
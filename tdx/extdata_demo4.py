@@ -19,29 +19,31 @@ def process_multiple_stocks(idx_file_path: str, dat_file_path: str, stock_codes:
         Dict: 键为股票代码，值为对应的DataFrame
     """
     # 先解析idx文件一次，避免重复解析
-    records = parse_file_idx(idx_file_path)
-    if not records:
+    try:
+        index = ExtDataIndex.from_file(idx_file_path)
+    except Exception as e:
+        print(f"错误: 无法解析idx文件 {idx_file_path}: {e}")
+        return {}
+    if len(index) == 0:
         print(f"错误: 无法解析idx文件 {idx_file_path}")
         return {}
 
-    idx_df = pd.DataFrame(records)
-    idx_df['cum_sum'] = idx_df['record_count'].cumsum().shift(1).fillna(0).astype(int)
+    # 批量二分查找所有股票代码
+    slots = index.lookup(stock_codes)
 
     results = {}
 
-    for stock_code in stock_codes:
+    for stock_code, slot in zip(stock_codes, slots):
         print(f"\n处理股票 {stock_code}...")
 
         # 查找股票代码
-        stock_row = idx_df[idx_df['stock_code'] == stock_code]
-        if stock_row.empty:
+        if slot < 0:
             print(f"警告: 跳过不存在的股票代码 {stock_code}")
             continue
 
         # 获取股票信息
-        row = stock_row.iloc[0]
-        record_count = int(row['record_count'])
-        cum_sum = int(row['cum_sum'])
+        record_count = int(index.record_count[slot])
+        cum_sum = int(index.cum_sum[slot])
 
         print(f"stock_code={stock_code}, record_count={record_count}, start_index={cum_sum}")
 
@@ -251,6 +253,46 @@ def compare_extdata_stocks(df1: pd.DataFrame, df2: pd.DataFrame,
     return result
 
 
+def compare_extdata_files(base_idx_path: str, base_dat_path: str, work_idx_path: str, work_dat_path: str,
+                          precision: float = 1e-6, max_display_rows: int = 30) -> Dict[str, any]:
+    """
+    整文件比较base与work两组扩展数据（所有股票一次完成），打印汇总和差异最多的股票
+
+    Args:
+        base_idx_path: base环境idx文件路径
+        base_dat_path: base环境dat文件路径
+        work_idx_path: work环境idx文件路径
+        work_dat_path: work环境dat文件路径
+        precision: 浮点数比较精度
+        max_display_rows: 最大显示行数
+
+    Returns:
+        Dict: diff_extdata的比较结果
+    """
+    result = diff_extdata(base_idx_path, base_dat_path, work_idx_path, work_dat_path,
+                          rtol=precision, atol=precision)
+    summary = result['summary']
+
+    print("=" * 60)
+    print("扩展数据文件比较结果")
+    print("=" * 60)
+    print(f"base总行数: {summary['left_total']}")
+    print(f"work总行数: {summary['right_total']}")
+    print(f"值相同的行数: {summary['same']}")
+    print(f"值不同的行数: {summary['changed']}")
+    print(f"只在work中的行数: {summary['added']}")
+    print(f"只在base中的行数: {summary['removed']}")
+    print(f"存在差异的股票数: {summary['stocks_changed']}")
+
+    stocks = result['stocks']
+    stocks = stocks[(stocks['changed'] + stocks['added'] + stocks['removed']) > 0]
+    if not stocks.empty:
+        print("\n差异最多的股票:")
+        top = stocks.assign(total=stocks['changed'] + stocks['added'] + stocks['removed'])
+        print(top.sort_values('total', ascending=False).head(max_display_rows).to_string(index=False))
+
+    return result
+
 
 # 批量处理示例
 if __name__ == "__main__":
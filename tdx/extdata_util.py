@@ -4,10 +4,17 @@
 
 import os
 import sys
+import shutil
+import threading
+import time
+import hashlib
+import zlib
 import logging
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import struct
-from typing import List, Dict, Optional, Union, Tuple, Any, Set
+from typing import List, Dict, Optional, Union, Tuple, Any, Set, Callable
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
@@ -16,10 +23,44 @@ from tqdm import tqdm
 logger = logging.getLogger(__name__)
 
 # 常量定义
+# idx文件中的市场代码
+MARKET_CODES = {'SZ': 0, 'SH': 1, 'BJ': 2}
 IDX_RECORD_SIZE = 29
 DAT_RECORD_SIZE = 12
 INFO_RECORD_SIZE = 293
 
+# 原样复制文件字节区间时使用的缓冲区大小
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
+# dat记录结构（小端序）：日期(4字节) + 时间(4字节) + 数值(4字节浮点)
+DAT_DTYPE = np.dtype([
+    ('date_int', '<u4'),
+    ('time_int', '<u4'),
+    ('value_f', '<f4'),
+])
+
+# idx记录结构（小端序）：市场代码(2字节) + 股票代码(7字节) + 保留(16字节) + 记录数(4字节)
+IDX_DTYPE = np.dtype([
+    ('market_code', '<u2'),
+    ('stock_code', 'S7'),
+    ('reserved', 'V16'),
+    ('record_count', '<u4'),
+])
+
+# info记录结构（小端序），与parse_file_info的格式一致，周期字段位于0xA0
+INFO_DTYPE = np.dtype([
+    ('seq', '<u2'),
+    ('name', 'S64'),
+    ('date_int', '<u4'),
+    ('time_int', '<u4'),
+    ('msec', '<u4'),
+    ('reserved1', 'V82'),
+    ('period', 'i1'),
+    ('date_start', '<u4'),
+    ('date_end', '<u4'),
+    ('reserved2', 'V124'),
+])
+
 
 def setup_logging(log_level=logging.INFO) -> None:
     """配置项目日志"""
@@ -36,11 +77,19 @@ def setup_logging(log_level=logging.INFO) -> None:
 
 def write_binary_data(file_path: str, data: List[Tuple[int, int, float]], mode: str = 'wb') -> bool:
     """安全写入二进制数据文件"""
+    try:
+        records = np.array(data, dtype=DAT_DTYPE) if len(data) else np.empty(0, dtype=DAT_DTYPE)
+    except Exception as e:
+        logger.error(f"写入文件错误: {file_path}, 错误: {e}")
+        return False
+    return write_dat_array(file_path, records, mode)
+
+
+def write_dat_array(file_path: str, records: np.ndarray, mode: str = 'wb') -> bool:
+    """将DAT_DTYPE结构化数组一次性写入dat文件"""
     try:
         with open(file_path, mode) as f:
-            for date_int, time_int, value_f in data:
-                packed_data = struct.pack('IIf', date_int, time_int, value_f)
-                f.write(packed_data)
+            f.write(np.ascontiguousarray(records, dtype=DAT_DTYPE).tobytes())
         logger.info(f"成功写入数据到文件: {file_path}")
         return True
     except Exception as e:
@@ -48,6 +97,40 @@ def write_binary_data(file_path: str, data: List[Tuple[int, int, float]], mode:
         return False
 
 
+def write_idx_array(file_path: str, idx_records: np.ndarray) -> bool:
+    """将IDX_DTYPE结构化数组一次性写入idx文件"""
+    try:
+        with open(file_path, 'wb') as f:
+            f.write(np.ascontiguousarray(idx_records, dtype=IDX_DTYPE).tobytes())
+        logger.info(f"成功写入idx文件: {file_path}")
+        return True
+    except Exception as e:
+        logger.error(f"写入idx文件失败: {e}")
+        return False
+
+
+def frame_to_dat_array(df: pd.DataFrame) -> np.ndarray:
+    """将包含date_int, value_f（可选time_int）列的DataFrame按列打包为DAT_DTYPE结构化数组"""
+    records = np.zeros(len(df), dtype=DAT_DTYPE)
+    if len(df) == 0:
+        return records
+
+    records['date_int'] = df['date_int'].to_numpy(dtype=np.int64)
+    if 'time_int' in df.columns:
+        records['time_int'] = df['time_int'].to_numpy(dtype=np.int64)
+    records['value_f'] = df['value_f'].to_numpy(dtype=np.float64)
+    return records
+
+
+def build_idx_array(market_code: np.ndarray, stock_code: np.ndarray, record_count: np.ndarray) -> np.ndarray:
+    """按列打包idx记录为IDX_DTYPE结构化数组，保留字段填充为0"""
+    idx_records = np.zeros(len(stock_code), dtype=IDX_DTYPE)
+    idx_records['market_code'] = np.asarray(market_code, dtype=np.int64)
+    idx_records['stock_code'] = encode_stock_codes(stock_code)
+    idx_records['record_count'] = np.asarray(record_count, dtype=np.int64)
+    return idx_records
+
+
 def write_file_info_batch(file_path: str, indexes: List[int], field_offset: int,
                           fmt: str, values: Tuple[Any]) -> bool:
     """批量写入文件信息"""
@@ -190,27 +273,398 @@ def parse_file_info(file_path: str) -> List[Dict]:
     return parse_binary_file(file_path, INFO_RECORD_SIZE, record_format, _process_info_record)
 
 
+class ExtDataInfo:
+    """
+    extdata.info编辑器
+
+    内存映射info文件，按INFO_DTYPE提供逐记录的字段访问；修改先暂存，
+    flush时一次性写入映射缓冲区，并直接从缓冲区校验写入结果，无需重新解析文件。
+
+    用法：
+        with ExtDataInfo(info_path) as info:
+            info.stage(info.index_of(['新高标记', '新低标记']), period=1, date_start=20250101, date_end=20250601)
+            ok = info.flush()
+    """
+
+    FIELDS = ('seq', 'date_int', 'time_int', 'period', 'date_start', 'date_end')
+
+    def __init__(self, file_path: str, writable: bool = True):
+        self.file_path = file_path
+        self.writable = writable
+        self._pending: Dict[Tuple[int, str], int] = {}
+        self._name_index_map = None
+
+        self._file = open(file_path, 'r+b' if writable else 'rb')
+        num_records = os.path.getsize(file_path) // INFO_RECORD_SIZE
+        if num_records == 0:
+            self._mmap = None
+            self._records = np.zeros(0, dtype=INFO_DTYPE)
+        else:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self._mmap = mmap.mmap(self._file.fileno(), num_records * INFO_RECORD_SIZE, access=access)
+            self._records = np.frombuffer(self._mmap, dtype=INFO_DTYPE, count=num_records)
+
+    def _field(self, name: str) -> np.ndarray:
+        """字段值（复制），不包含尚未flush的修改"""
+        return self._records[name].copy()
+
+    @property
+    def seq(self) -> np.ndarray:
+        return self._field('seq')
+
+    @property
+    def date_int(self) -> np.ndarray:
+        return self._field('date_int')
+
+    @property
+    def time_int(self) -> np.ndarray:
+        return self._field('time_int')
+
+    @property
+    def period(self) -> np.ndarray:
+        return self._field('period')
+
+    @property
+    def date_start(self) -> np.ndarray:
+        return self._field('date_start')
+
+    @property
+    def date_end(self) -> np.ndarray:
+        return self._field('date_end')
+
+    @property
+    def names(self) -> List[str]:
+        """指标名称列表"""
+        return [name.decode('gb2312', errors='ignore').rstrip('\x00') for name in self._records['name'].tolist()]
+
+    @property
+    def name_index_map(self) -> Dict[str, int]:
+        """名称->记录序号映射（缓存），名称重复时取最后一条"""
+        if self._name_index_map is None:
+            self._name_index_map = {name: i for i, name in enumerate(self.names)}
+        return self._name_index_map
+
+    def index_of(self, names: List[str]) -> List[int]:
+        """按名称获取记录序号，不存在的名称被忽略并记录警告"""
+        indexes = []
+        for name in names:
+            index = self.name_index_map.get(name)
+            if index is None:
+                logger.warning(f"info文件中不存在指标: {name}")
+            else:
+                indexes.append(index)
+        return indexes
+
+    def stage(self, indexes: List[int], **values: int) -> None:
+        """
+        暂存对多条记录的字段修改
+
+        Args:
+            indexes: 记录序号列表
+            values: 字段名=值，字段名取自FIELDS，如 period=1, date_start=20250101
+        """
+        for field in values:
+            if field not in self.FIELDS:
+                raise ValueError(f"不支持修改的字段: {field}")
+        for index in indexes:
+            if not 0 <= index < len(self._records):
+                raise IndexError(f"记录序号超出范围: {index}")
+            for field, value in values.items():
+                self._pending[(index, field)] = int(value)
+
+    @property
+    def pending(self) -> int:
+        """暂存的修改数量"""
+        return len(self._pending)
+
+    def flush(self) -> bool:
+        """一次性写入所有暂存的修改，并从映射缓冲区校验"""
+        if not self._pending:
+            return True
+        if not self.writable:
+            raise IOError(f"info文件以只读方式打开: {self.file_path}")
+
+        by_field: Dict[str, Tuple[List[int], List[int]]] = {}
+        for (index, field), value in self._pending.items():
+            indexes, field_values = by_field.setdefault(field, ([], []))
+            indexes.append(index)
+            field_values.append(value)
+        for field, (indexes, field_values) in by_field.items():
+            self._records[field][indexes] = field_values
+        self._mmap.flush()
+        logger.info(f"成功写入文件信息: {self.file_path}，共 {len(self._pending)} 个字段")
+
+        verified = self.verify()
+        if verified:
+            self._pending.clear()
+        return verified
+
+    def verify(self) -> bool:
+        """校验暂存的修改是否已写入缓冲区"""
+        for (index, field), value in self._pending.items():
+            actual = int(self._records[field][index])
+            if actual != value:
+                logger.warning(f"校验失败: 记录 {index} 字段 {field}，期望 {value}，实际 {actual}")
+                return False
+        return True
+
+    def to_frame(self) -> pd.DataFrame:
+        """转换为parse_file_info格式的DataFrame"""
+        return pd.DataFrame({
+            'seq': self._field('seq').astype(np.int64),
+            'name': self.names,
+            'date_int': self._field('date_int').astype(np.int64),
+            'time_int': self._field('time_int').astype(np.int64),
+            'period': self._field('period').astype(np.int64),
+            'date_start': self._field('date_start').astype(np.int64),
+            'date_end': self._field('date_end').astype(np.int64),
+        })
+
+    def close(self) -> None:
+        """释放内存映射并关闭文件"""
+        self._records = np.zeros(0, dtype=INFO_DTYPE)
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __enter__(self) -> 'ExtDataInfo':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def read_idx_array(file_path: str) -> np.ndarray:
+    """按结构化dtype一次性读取idx文件，返回IDX_DTYPE结构化数组"""
+    num_records = os.path.getsize(file_path) // IDX_RECORD_SIZE
+    if num_records == 0:
+        return np.empty(0, dtype=IDX_DTYPE)
+    return np.fromfile(file_path, dtype=IDX_DTYPE, count=num_records)
+
+
+def decode_stock_codes(raw_codes: np.ndarray) -> np.ndarray:
+    """批量解码idx中的股票代码字节串（尾部\\x00已由S7类型去除）"""
+    try:
+        # 股票代码绝大多数为ASCII，直接转换最快
+        return raw_codes.astype('U7')
+    except UnicodeDecodeError:
+        return np.char.decode(raw_codes, 'gb2312', errors='ignore').astype('U7')
+
+
+def encode_stock_codes(stock_codes: np.ndarray) -> np.ndarray:
+    """批量编码股票代码为gb2312字节串，超过7字节的部分被截断"""
+    stock_codes = np.asarray(stock_codes, dtype=str)
+    try:
+        return stock_codes.astype('S7')
+    except UnicodeEncodeError:
+        return np.char.encode(stock_codes, 'gb2312').astype('S7')
+
+
+class ExtDataIndex:
+    """
+    idx文件索引
+
+    保存市场代码、股票代码、记录数以及np.cumsum计算的起始偏移(cum_sum)，
+    并维护按代码排序的索引，支持批量二分查找。
+    """
+
+    def __init__(self, market_code: np.ndarray, stock_code: np.ndarray, record_count: np.ndarray,
+                 cum_sum: Optional[np.ndarray] = None):
+        self.market_code = np.asarray(market_code, dtype=np.uint16)
+        self.stock_code = np.asarray(stock_code, dtype=str)
+        if self.stock_code.dtype.itemsize == 0:
+            self.stock_code = self.stock_code.astype('U7')
+        self.record_count = np.asarray(record_count, dtype=np.int64)
+        if cum_sum is None:
+            cum_sum = np.cumsum(self.record_count) - self.record_count
+        self.cum_sum = np.asarray(cum_sum, dtype=np.int64)
+
+        # 稳定排序，代码重复时二分查找命中第一次出现的位置
+        self.sort_order = np.argsort(self.stock_code, kind='stable')
+        self.sorted_codes = self.stock_code[self.sort_order]
+        self._slot_map = None
+        self._market_slot_map = None
+
+    @classmethod
+    def from_array(cls, idx_records: np.ndarray) -> 'ExtDataIndex':
+        """由IDX_DTYPE结构化数组创建索引"""
+        return cls(idx_records['market_code'], decode_stock_codes(idx_records['stock_code']),
+                   idx_records['record_count'])
+
+    @classmethod
+    def from_file(cls, idx_path: str) -> 'ExtDataIndex':
+        """解析idx文件创建索引"""
+        return cls.from_array(read_idx_array(idx_path))
+
+    @classmethod
+    def from_frame(cls, idx_df: pd.DataFrame) -> 'ExtDataIndex':
+        """由idx DataFrame创建索引，优先使用已有的cum_sum列（idx_df可能只是部分行）"""
+        if idx_df.empty:
+            return cls(np.empty(0), np.empty(0, dtype='U7'), np.empty(0))
+        cum_sum = idx_df['cum_sum'].to_numpy() if 'cum_sum' in idx_df.columns else None
+        return cls(idx_df['market_code'].to_numpy(), idx_df['stock_code'].to_numpy(dtype=str),
+                   idx_df['record_count'].to_numpy(), cum_sum)
+
+    @property
+    def slot_map(self) -> Dict[str, int]:
+        """代码->序号的哈希映射，代码重复时保留第一次出现的位置"""
+        if self._slot_map is None:
+            slot_map = {}
+            for slot, stock_code in enumerate(self.stock_code.tolist()):
+                slot_map.setdefault(stock_code, slot)
+            self._slot_map = slot_map
+        return self._slot_map
+
+    @property
+    def market_slot_map(self) -> Dict[Tuple[int, str], int]:
+        """(市场代码, 代码)->序号的哈希映射，不同市场的同名代码（如沪深的000001）分别对应各自的序号"""
+        if self._market_slot_map is None:
+            market_slot_map = {}
+            for slot, key in enumerate(zip(self.market_code.tolist(), self.stock_code.tolist())):
+                market_slot_map.setdefault(key, slot)
+            self._market_slot_map = market_slot_map
+        return self._market_slot_map
+
+    def slot_of(self, stock_code: str, market_code: Optional[int] = None) -> Optional[int]:
+        """股票在idx中的序号，提供market_code时按(市场, 代码)匹配，不存在时返回None"""
+        if market_code is None:
+            return self.slot_map.get(stock_code)
+        return self.market_slot_map.get((int(market_code), stock_code))
+
+    @property
+    def total_records(self) -> int:
+        """idx声明的dat记录总数"""
+        return int((self.cum_sum + self.record_count).max()) if len(self) else 0
+
+    def lookup(self, stock_codes) -> np.ndarray:
+        """
+        批量二分查找股票代码
+
+        Args:
+            stock_codes: 股票代码列表或数组
+
+        Returns:
+            每个代码对应的idx序号，不存在的代码为-1
+        """
+        stock_codes = np.asarray(stock_codes, dtype=str)
+        if len(self) == 0 or stock_codes.size == 0:
+            return np.full(stock_codes.shape, -1, dtype=np.int64)
+
+        pos = np.searchsorted(self.sorted_codes, stock_codes, side='left')
+        pos = np.minimum(pos, len(self.sorted_codes) - 1)
+        found = self.sorted_codes[pos] == stock_codes
+        return np.where(found, self.sort_order[pos], -1).astype(np.int64)
+
+    def find(self, stock_code: str) -> int:
+        """二分查找单个股票代码，不存在时返回-1"""
+        return int(self.lookup([stock_code])[0])
+
+    def to_frame(self) -> pd.DataFrame:
+        """转换为load_idx_data格式的DataFrame"""
+        return pd.DataFrame({
+            'i': np.arange(len(self), dtype=np.int64),
+            'market_code': self.market_code.astype(np.int64),
+            'stock_code': self.stock_code.astype(object),
+            'record_count': self.record_count,
+            'cum_sum': self.cum_sum,
+        })
+
+    def __len__(self) -> int:
+        return len(self.stock_code)
+
+
 def parse_file_idx(file_path: str) -> List[Dict]:
     """解析索引文件"""
-    record_format = (
-        '<'  # 小端序
-        'H'  # 2字节无符号整数
-        '7s'  # 7字节字符串
-        '16x'  # 跳过16字节
-        'I'  # 4字节无符号整数
-    )
-    return parse_binary_file(file_path, IDX_RECORD_SIZE, record_format, _process_idx_record)
+    try:
+        idx_records = read_idx_array(file_path)
+    except Exception as e:
+        logger.error(f"读取文件错误: {file_path}, 错误: {e}", exc_info=True)
+        return []
+
+    return [
+        {'i': i, 'market_code': market_code, 'stock_code': stock_code, 'record_count': record_count}
+        for i, (market_code, stock_code, record_count) in enumerate(zip(
+            idx_records['market_code'].tolist(),
+            decode_stock_codes(idx_records['stock_code']).tolist(),
+            idx_records['record_count'].tolist()))
+    ]
+
+
+def read_dat_array(file_path: str, start_index: int = 0, record_count: Optional[int] = None) -> np.ndarray:
+    """
+    按结构化dtype一次性读取dat文件中的一段记录
+
+    Args:
+        file_path: 文件路径
+        start_index: 起始记录序号
+        record_count: 记录数量，None表示读取到文件末尾
+
+    Returns:
+        DAT_DTYPE结构化数组，字段为date_int, time_int, value_f
+    """
+    num_records = os.path.getsize(file_path) // DAT_RECORD_SIZE
+    start_index = max(0, int(start_index))
+    available = max(0, num_records - start_index)
+
+    if record_count is None:
+        count = available
+    else:
+        count = min(int(record_count), available)
+        if count < record_count:
+            logger.warning(f"记录 {start_index + count}: 数据不足，期望 {record_count} 条，实际 {count} 条")
+
+    if count <= 0:
+        return np.empty(0, dtype=DAT_DTYPE)
+
+    return np.fromfile(file_path, dtype=DAT_DTYPE, count=count, offset=start_index * DAT_RECORD_SIZE)
+
+
+def dat_array_to_frame(records: np.ndarray) -> pd.DataFrame:
+    """将dat结构化数组转换为DataFrame，列类型与逐条解析的结果保持一致（int64/float64）"""
+    return pd.DataFrame({
+        'date_int': records['date_int'].astype(np.int64),
+        'time_int': records['time_int'].astype(np.int64),
+        'value_f': records['value_f'].astype(np.float64),
+    })
+
+
+def read_dat_frame(file_path: str, start_index: int = 0, record_count: Optional[int] = None) -> pd.DataFrame:
+    """读取dat文件中的一段记录并返回DataFrame"""
+    return dat_array_to_frame(read_dat_array(file_path, start_index, record_count))
+
+
+def _segment_rows(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """将多个 [start, start+count) 区间展开为一个行号数组（不使用Python循环）"""
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    # 每行相对所在区间起点的偏移 = 全局序号 - 区间在结果中的起点
+    seg_offsets = np.cumsum(counts) - counts
+    return np.repeat(np.asarray(starts, dtype=np.int64) - seg_offsets, counts) + np.arange(total, dtype=np.int64)
+
+
+def _dat_array_to_records(records: np.ndarray) -> List[Dict]:
+    """将dat结构化数组转换为字典列表，与 _process_dat_record 的输出格式一致"""
+    return [
+        {'date_int': date_int, 'time_int': time_int, 'value_f': value_f}
+        for date_int, time_int, value_f in zip(records['date_int'].tolist(),
+                                                records['time_int'].tolist(),
+                                                records['value_f'].tolist())
+    ]
 
 
 def parse_file_dat(file_path: str) -> List[Dict]:
     """解析数据文件"""
-    record_format = (
-        '<'  # 小端序
-        'I'  # 4字节无符号整数
-        'I'  # 4字节无符号整数
-        'f'  # 4字节浮点数
-    )
-    return parse_binary_file(file_path, DAT_RECORD_SIZE, record_format, _process_dat_record)
+    try:
+        return _dat_array_to_records(read_dat_array(file_path))
+    except Exception as e:
+        logger.error(f"读取文件错误: {file_path}, 错误: {e}", exc_info=True)
+        return []
 
 
 def parse_file_dat2(file_path: str, start_index: int, record_count: int) ->  List[Dict]:
@@ -223,13 +677,11 @@ def parse_file_dat2(file_path: str, start_index: int, record_count: int) ->  Lis
     Returns:
         解析后的记录列表
     """
-    record_format = (
-        '<'  # 小端序
-        'I'  # 4字节无符号整数
-        'I'  # 4字节无符号整数
-        'f'  # 4字节浮点数
-    )
-    return parse_binary_file2(file_path, DAT_RECORD_SIZE, record_format, start_index, record_count, _process_dat_record)
+    try:
+        return _dat_array_to_records(read_dat_array(file_path, start_index, record_count))
+    except Exception as e:
+        logger.error(f"读取文件错误: {file_path}, 错误: {e}", exc_info=True)
+        return []
 
 
 def parse_binary_file2(file_path: str, record_size: int, record_format: str, index: int, record_count: int,
@@ -378,19 +830,35 @@ def generate_file_dat(df: pd.DataFrame, file_path: str) -> bool:
     """将DataFrame数据写入通达信扩展数据文件"""
     logger.info(f"生成DAT文件，数据行数: {len(df)}")
     try:
-        data_to_write = []
-        for _, row in df.iterrows():
-            date_int = int(row['date_int'])
-            time_int = int(row.get('time_int', 0))
-            value_f = row['value_f']
-            data_to_write.append((date_int, time_int, value_f))
-
-        return write_binary_data(file_path, data_to_write)
+        return write_dat_array(file_path, frame_to_dat_array(df))
     except Exception as e:
         logger.error(f"生成DAT文件错误: {e}", exc_info=True)
         return False
 
 
+def merge_dat_files(file_paths: List[str], output_path: str) -> bool:
+    """
+    合并同一指标的多个dat文件（如多日回补生成的各日期文件），按日期排序写入output_path
+
+    Args:
+        file_paths: dat文件路径，同一日期的记录以后面的文件为准；不存在的文件忽略
+        output_path: 合并后的dat文件路径
+    """
+    try:
+        frames = [read_dat_frame(path) for path in file_paths if os.path.exists(path)]
+        if not frames:
+            logger.warning(f"没有可合并的DAT文件: {output_path}")
+            return False
+        merged = pd.concat(frames, ignore_index=True)
+        merged = merged.drop_duplicates(subset=['date_int', 'time_int'], keep='last')
+        merged = merged.sort_values(['date_int', 'time_int'], kind='stable')
+        logger.info(f"合并{len(frames)}个DAT文件，数据行数: {len(merged)}")
+        return write_dat_array(output_path, frame_to_dat_array(merged))
+    except Exception as e:
+        logger.error(f"合并DAT文件错误: {e}", exc_info=True)
+        return False
+
+
 # def generate_file_idx(df: pd.DataFrame, file_path: str) -> bool:
 #     """将DataFrame数据写入通达信扩展数据文件"""
 #     logger.info(f"生成IDX文件，数据行数: {len(df)}")
@@ -404,30 +872,151 @@ def generate_file_dat(df: pd.DataFrame, file_path: str) -> bool:
 #         return False
 
 
-def load_idx_data(idx_path: str) -> pd.DataFrame:
+def load_idx_data(idx_path: str, dat_path: Optional[str] = None) -> pd.DataFrame:
     """
     加载并解析idx文件，返回包含累计记录数的DataFrame
 
     Args:
         idx_path: idx文件路径
+        dat_path: 对应的dat文件路径，提供时增加checksum列（各股票数据段的crc32）
 
     Returns:
-        DataFrame: 包含market_code, stock_code, record_count, cum_sum的DataFrame
+        DataFrame: 包含market_code, stock_code, record_count, cum_sum(, checksum)的DataFrame
     """
     logger.info(f"加载idx文件: {idx_path}")
-    idx_records = parse_file_idx(idx_path)
-    if not idx_records:
+    try:
+        index = ExtDataIndex.from_file(idx_path)
+    except Exception as e:
+        logger.error(f"读取文件错误: {idx_path}, 错误: {e}", exc_info=True)
+        index = None
+
+    if index is None or len(index) == 0:
         logger.error(f"idx文件解析失败或为空: {idx_path}")
         return pd.DataFrame()
 
-    # 将列表转换为DataFrame
-    idx_df = pd.DataFrame(idx_records)
-
-    # 计算累计记录数
-    idx_df['cum_sum'] = idx_df['record_count'].cumsum().shift(1).fillna(0).astype(int)
+    idx_df = index.to_frame()
+    if dat_path is not None:
+        try:
+            idx_df['checksum'] = compute_segment_checksums(dat_path, idx_df)
+        except Exception as e:
+            logger.error(f"计算数据段校验和错误: {dat_path}, 错误: {e}", exc_info=True)
+            return pd.DataFrame()
     return idx_df
 
 
+def segment_checksums(index: ExtDataIndex, records: np.ndarray) -> np.ndarray:
+    """
+    按index顺序计算每只股票数据段的crc32
+
+    Args:
+        index: idx索引
+        records: DAT_DTYPE记录（可为内存映射），超出末尾的部分按实际存在的记录计算
+
+    Returns:
+        与index顺序一致的uint32数组
+    """
+    checksums = np.zeros(len(index), dtype=np.uint32)
+    for slot in range(len(index)):
+        start = int(index.cum_sum[slot])
+        segment = records[start:start + int(index.record_count[slot])]
+        checksums[slot] = zlib.crc32(np.ascontiguousarray(segment).view(np.uint8))
+    return checksums
+
+
+def output_segment_checksums(output_index: ExtDataIndex, dat_records: np.ndarray, old_checksums: np.ndarray,
+                             known_slots: Optional[np.ndarray] = None) -> np.ndarray:
+    """输出数据段的crc32，沿用现有数据段的股票（known_slots >= 0）直接取现有数据的校验和"""
+    if known_slots is None:
+        return segment_checksums(output_index, dat_records)
+    checksums = np.zeros(len(output_index), dtype=np.uint32)
+    reused = known_slots >= 0
+    checksums[reused] = old_checksums[known_slots[reused]]
+    merged = np.flatnonzero(~reused)
+    checksums[merged] = segment_checksums(
+        ExtDataIndex(output_index.market_code[merged], output_index.stock_code[merged],
+                     output_index.record_count[merged], output_index.cum_sum[merged]), dat_records)
+    return checksums
+
+
+def compute_segment_checksums(dat_path: str, idx_df: pd.DataFrame) -> np.ndarray:
+    """
+    计算每只股票dat数据段字节区间的crc32
+
+    Args:
+        dat_path: dat文件路径
+        idx_df: 包含cum_sum和record_count的idx DataFrame
+
+    Returns:
+        与idx_df行顺序一致的uint32数组
+    """
+    index = ExtDataIndex.from_frame(idx_df)
+    with ExtDataStore(None, dat_path, index=index) as store:
+        return segment_checksums(index, store.records)
+
+
+def save_segment_checksums(checksum_path: str, new_index: ExtDataIndex, new_checksums: np.ndarray,
+                           output_index: ExtDataIndex, output_checksums: np.ndarray) -> bool:
+    """
+    保存本次合并的校验和：每只股票增量数据段和输出数据段的（记录数, 校验和），增量中不存在的股票记为-1
+
+    须在输出文件写入成功后调用。
+    """
+    try:
+        new_slots = new_index.lookup(output_index.stock_code)
+        found = new_slots >= 0
+        pd.DataFrame({
+            'stock_code': output_index.stock_code.astype(object),
+            'record_count': np.where(found, new_index.record_count[new_slots], -1),
+            'checksum': np.where(found, new_checksums[new_slots].astype(np.int64), -1),
+            'output_record_count': output_index.record_count,
+            'output_checksum': output_checksums.astype(np.int64),
+        }).to_csv(checksum_path, index=False)
+        logger.info(f"保存数据段校验和: {checksum_path}，共 {len(output_index)} 只股票")
+        return True
+    except Exception as e:
+        logger.error(f"保存数据段校验和错误: {checksum_path}, 错误: {e}")
+        return False
+
+
+def load_segment_checksums(checksum_path: str) -> Dict[str, Tuple[int, int, int, int]]:
+    """
+    读取save_segment_checksums保存的校验和
+
+    Returns:
+        代码->(增量记录数, 增量校验和, 输出记录数, 输出校验和)，文件不存在或格式不符时返回空字典
+    """
+    if not os.path.exists(checksum_path):
+        return {}
+    try:
+        df = pd.read_csv(checksum_path, dtype={'stock_code': str})
+        columns = ['record_count', 'checksum', 'output_record_count', 'output_checksum']
+        values = zip(*(df[column].astype(int) for column in columns))
+    except Exception as e:
+        logger.warning(f"读取数据段校验和失败: {checksum_path}, 错误: {e}")
+        return {}
+    return dict(zip(df['stock_code'], values))
+
+
+def find_unchanged_stocks(old_index: ExtDataIndex, old_checksums: np.ndarray,
+                          new_index: ExtDataIndex, new_checksums: np.ndarray,
+                          last_checksums: Dict[str, Tuple[int, int, int, int]]) -> Set[str]:
+    """
+    找出无需再次合并的股票：增量数据段与上次运行相同，且现有数据段正是上次运行的输出
+
+    现有数据段与上次输出不同（例如上次的输出没有复制回工作目录）时必须重新合并。
+    合并是幂等的（同日期以增量数据为准、保留最新的记录），满足条件的股票再次合并的结果就是现有数据段。
+    """
+    old_segments = dict(zip(old_index.stock_code.tolist(),
+                            zip(old_index.record_count.tolist(), old_checksums.astype(np.int64).tolist())))
+    unchanged = set()
+    for stock_code, record_count, checksum in zip(new_index.stock_code.tolist(), new_index.record_count.tolist(),
+                                                  new_checksums.astype(np.int64).tolist()):
+        last = last_checksums.get(stock_code)
+        if last is not None and last[:2] == (record_count, checksum) and old_segments.get(stock_code) == last[2:]:
+            unchanged.add(stock_code)
+    return unchanged
+
+
 def load_dat_data(dat_path: str, idx_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     """
     根据idx文件信息加载dat文件数据
@@ -442,23 +1031,352 @@ def load_dat_data(dat_path: str, idx_df: pd.DataFrame) -> Dict[str, pd.DataFrame
     logger.info(f"加载dat文件: {dat_path}")
     stock_data = {}
 
-    for _, row in idx_df.iterrows():
-        stock_code = row['stock_code']
-        start_index = int(row['cum_sum'])
-        record_count = int(row['record_count'])
+    with ExtDataStore.from_idx_df(idx_df, dat_path) as store:
+        for slot, stock_code in enumerate(store.codes):
+            logger.debug(f"加载股票 {stock_code} 的数据，起始位置: {store.cum_sum[slot]}, 记录数: {store.record_count[slot]}")
+
+            # 读取该股票的数据
+            records = store.records_at(slot)
+            if len(records):
+                stock_data[stock_code] = dat_array_to_frame(records)
+            else:
+                logger.warning(f"股票 {stock_code} 无数据记录")
+                stock_data[stock_code] = pd.DataFrame()
+
+    return stock_data
+
+
+class ExtDataStore:
+    """
+    扩展数据存储
+
+    dat文件只做一次内存映射，idx解析为数组并预先计算cum_sum偏移表和代码->序号映射，
+    按股票代码取数时直接返回内存映射上的零拷贝视图。
 
-        logger.debug(f"加载股票 {stock_code} 的数据，起始位置: {start_index}, 记录数: {record_count}")
+    用法：
+        with ExtDataStore(idx_path, dat_path) as store:
+            records = store['600010']       # DAT_DTYPE结构化数组视图
+            df = store.frame('600010')      # DataFrame
+    """
 
-        # 读取该股票的数据
-        data_records = parse_file_dat2(dat_path, start_index, record_count)
-        if data_records:
-            stock_df = pd.DataFrame(data_records)
-            stock_data[stock_code] = stock_df
+    def __init__(self, idx_path: Optional[str], dat_path: str, index: Optional[ExtDataIndex] = None):
+        """
+        Args:
+            idx_path: idx文件路径，提供index时可为None
+            dat_path: dat文件路径
+            index: 已解析的idx索引，避免重复解析
+        """
+        self.idx_path = idx_path
+        self.dat_path = dat_path
+
+        if index is None:
+            index = ExtDataIndex.from_file(idx_path)
+        self.index = index
+        self.market_code = index.market_code
+        self.stock_code = index.stock_code
+        self.record_count = index.record_count
+        self.cum_sum = index.cum_sum
+        self._slots = index.slot_map
+        self._records = self._map_dat(dat_path)
+        self._keys = None
+        self._key_rows = None
+
+        if index.total_records > len(self._records):
+            logger.warning(f"dat文件记录数({len(self._records)})少于idx文件声明的记录数({index.total_records}): {dat_path}")
+
+    @classmethod
+    def from_idx_df(cls, idx_df: pd.DataFrame, dat_path: str) -> 'ExtDataStore':
+        """使用已加载的idx DataFrame创建存储对象"""
+        return cls(None, dat_path, index=ExtDataIndex.from_frame(idx_df))
+
+    @staticmethod
+    def _map_dat(dat_path: str) -> np.ndarray:
+        """内存映射dat文件，空文件返回空数组"""
+        num_records = os.path.getsize(dat_path) // DAT_RECORD_SIZE
+        if num_records == 0:
+            return np.empty(0, dtype=DAT_DTYPE)
+        return np.memmap(dat_path, dtype=DAT_DTYPE, mode='r', shape=(num_records,))
+
+    @property
+    def codes(self) -> List[str]:
+        """按idx文件顺序排列的股票代码列表"""
+        return self.stock_code.tolist()
+
+    @property
+    def records(self) -> np.ndarray:
+        """整个dat文件的记录数组（内存映射）"""
+        return self._records
+
+    def slot(self, stock_code: str) -> int:
+        """获取股票代码在idx文件中的序号，不存在时抛出KeyError"""
+        return self._slots[stock_code]
+
+    def records_at(self, slot: int) -> np.ndarray:
+        """按idx序号获取该股票的记录视图"""
+        start = int(self.cum_sum[slot])
+        return self._records[start:start + int(self.record_count[slot])]
+
+    def get(self, stock_code: str, default: Any = None, market_code: Optional[int] = None) -> Optional[np.ndarray]:
+        """获取股票的记录视图，提供market_code时按(市场, 代码)匹配，不存在时返回default"""
+        slot = self.index.slot_of(stock_code, market_code)
+        if slot is None:
+            return default
+        return self.records_at(slot)
+
+    def frame(self, stock_code: str) -> pd.DataFrame:
+        """获取股票的数据DataFrame（会复制数据）"""
+        return dat_array_to_frame(self[stock_code])
+
+    def align(self, stock_code: str, dates, market_code: Optional[int] = None) -> np.ndarray:
+        """
+        将股票的数值按日期对齐到给定的日期序列（如K线日期）
+
+        Args:
+            stock_code: 股票代码
+            dates: 升序的date_int序列
+            market_code: 市场代码（0深圳、1上海、2北京），None时取第一个同名代码
+
+        Returns:
+            与dates等长的float64数组，没有数据的日期为NaN；股票不存在时全部为NaN
+        """
+        dates = np.asarray(dates, dtype=np.int64)
+        result = np.full(len(dates), np.nan)
+        records = self.get(stock_code, market_code=market_code)
+        if records is None or len(records) == 0 or len(dates) == 0:
+            return result
+
+        record_dates = records['date_int'].astype(np.int64)
+        values = records['value_f']
+        if np.any(record_dates[1:] < record_dates[:-1]):
+            order = np.argsort(record_dates, kind='stable')
+            record_dates, values = record_dates[order], values[order]
+
+        pos = np.minimum(np.searchsorted(record_dates, dates), len(record_dates) - 1)
+        found = record_dates[pos] == dates
+        result[found] = values[pos[found]]
+        return result
+
+    def select_slots(self, stock_codes=None) -> np.ndarray:
+        """按idx顺序返回需要读取的序号，None表示全部，不存在的代码被忽略"""
+        if stock_codes is None:
+            return np.arange(len(self), dtype=np.int64)
+        slots = self.index.lookup(sorted(set(stock_codes)))
+        return np.sort(slots[slots >= 0])
+
+    def segment_counts(self, slots: np.ndarray) -> np.ndarray:
+        """各序号实际可读的记录数（dat文件被截断时小于idx声明的数量）"""
+        available = np.clip(len(self._records) - self.cum_sum[slots], 0, None)
+        return np.minimum(self.record_count[slots], available)
+
+    def to_frame(self, stock_codes=None, set_index: bool = False) -> pd.DataFrame:
+        """
+        将多只股票的数据一次性转换为长表
+
+        Args:
+            stock_codes: 需要加载的股票代码集合，None表示全部
+            set_index: 是否以(stock_code, date_int)作为索引
+
+        Returns:
+            DataFrame: 列为 stock_code(分类类型), date_int, time_int, value_f
+        """
+        slots = self.select_slots(stock_codes)
+        counts = self.segment_counts(slots)
+        rows = _segment_rows(self.cum_sum[slots], counts)
+        records = self._records[rows]
+
+        slot_codes = self.stock_code[slots]
+        categories, cat_codes = np.unique(slot_codes, return_inverse=True)
+        df = dat_array_to_frame(records)
+        df.insert(0, 'stock_code', pd.Categorical.from_codes(np.repeat(cat_codes, counts), categories=categories))
+
+        if set_index:
+            df = df.set_index(['stock_code', 'date_int'])
+        return df
+
+    def row_keys(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        全部记录按(序号, 日期)升序排列的键及对应的dat行号，键为 序号<<32 | date_int
+
+        每只股票的日期段本身有序时无需排序，只做一次线性检查
+        """
+        if self._keys is None:
+            slots = np.arange(len(self), dtype=np.int64)
+            counts = self.segment_counts(slots)
+            rows = _segment_rows(self.cum_sum, counts)
+            keys = (np.repeat(slots, counts) << 32) | self._records['date_int'][rows].astype(np.int64)
+            if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+                logger.debug(f"存在日期未排序的股票数据段，重新排序: {self.dat_path}")
+                order = np.argsort(keys, kind='stable')
+                keys, rows = keys[order], rows[order]
+            self._keys, self._key_rows = keys, rows
+        return self._keys, self._key_rows
+
+    def _scan_dates(self, dates: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """对所有股票的日期段同时做二分查找，返回命中的(日期, 序号, dat行号)"""
+        keys, key_rows = self.row_keys()
+        slots = np.arange(len(self), dtype=np.int64)
+        if len(keys) == 0 or len(slots) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        targets = ((slots[np.newaxis, :] << 32) | dates[:, np.newaxis]).ravel()
+        pos = np.minimum(np.searchsorted(keys, targets), len(keys) - 1)
+        found = keys[pos] == targets
+        date_col = np.repeat(dates, len(slots))[found]
+        slot_col = np.tile(slots, len(dates))[found]
+        return date_col, slot_col, key_rows[pos[found]]
+
+    def cross_section(self, dates, ascending: bool = False,
+                      date_index: Optional['ExtDataDateIndex'] = None) -> pd.Series:
+        """
+        截面查询：获取指定日期所有股票的数值并排序
+
+        Args:
+            dates: 单个日期(如20200221)或日期列表
+            ascending: 是否升序，默认按数值倒序
+            date_index: 日期索引（ExtDataDateIndex），提供时直接按索引取行，不再查找
+
+        Returns:
+            单个日期：以stock_code为索引、按value_f排序的Series，name为日期
+            多个日期：以(date_int, stock_code)为索引的Series，日期内按value_f排序
+        """
+        single = np.ndim(dates) == 0
+        dates = np.atleast_1d(np.asarray(dates, dtype=np.int64))
+
+        if date_index is not None:
+            date_col, slot_col, rows = date_index.select(dates)
         else:
-            logger.warning(f"股票 {stock_code} 无数据记录")
-            stock_data[stock_code] = pd.DataFrame()
+            date_col, slot_col, rows = self._scan_dates(dates)
 
-    return stock_data
+        result = pd.DataFrame({
+            'date_int': date_col,
+            'stock_code': self.stock_code[slot_col].astype(object),
+            'value_f': self._records['value_f'][rows].astype(np.float64),
+        })
+        result = result.sort_values(['date_int', 'value_f'], ascending=[True, ascending], kind='stable')
+
+        if single:
+            return pd.Series(result['value_f'].to_numpy(), index=pd.Index(result['stock_code'], name='stock_code'),
+                             name=int(dates[0]))
+        return result.set_index(['date_int', 'stock_code'])['value_f']
+
+    def close(self) -> None:
+        """释放内存映射，已返回的视图在被回收前仍然有效"""
+        self._records = np.empty(0, dtype=DAT_DTYPE)
+
+    def __getitem__(self, stock_code: str) -> np.ndarray:
+        return self.records_at(self._slots[stock_code])
+
+    def __contains__(self, stock_code: str) -> bool:
+        return stock_code in self._slots
+
+    def __len__(self) -> int:
+        return len(self.stock_code)
+
+    def __iter__(self):
+        return iter(self.codes)
+
+    def __enter__(self) -> 'ExtDataStore':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def file_fingerprint(file_path: Optional[str]) -> Tuple[int, int]:
+    """文件指纹：(大小, 修改时间ns)，路径为空时返回(0, 0)"""
+    if not file_path:
+        return 0, 0
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ExtDataDateIndex:
+    """
+    日期->行偏移索引
+
+    将所有股票的记录按(日期, 序号)重新排列，每个日期对应一段连续的行号，
+    截面查询时直接取出该日期的所有行。可保存为npz文件，文件未变化时重复查询无需重新扫描。
+    """
+
+    def __init__(self, dates: np.ndarray, offsets: np.ndarray, slots: np.ndarray, rows: np.ndarray,
+                 fingerprint: np.ndarray):
+        self.dates = dates
+        self.offsets = offsets
+        self.slots = slots
+        self.rows = rows
+        self.fingerprint = fingerprint
+
+    @staticmethod
+    def store_fingerprint(store: ExtDataStore) -> np.ndarray:
+        """idx和dat文件的指纹，用于判断持久化索引是否过期"""
+        return np.array(file_fingerprint(store.idx_path) + file_fingerprint(store.dat_path), dtype=np.int64)
+
+    @classmethod
+    def build(cls, store: ExtDataStore) -> 'ExtDataDateIndex':
+        """扫描一次存储对象，建立日期索引"""
+        keys, key_rows = store.row_keys()
+        slots = keys >> 32
+        dates = keys & 0xFFFFFFFF
+
+        order = np.lexsort((slots, dates))
+        slots, dates, rows = slots[order], dates[order], key_rows[order]
+
+        # 同一股票同一日期重复时保留第一条
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (dates[1:] != dates[:-1]) | (slots[1:] != slots[:-1])
+        slots, dates, rows = slots[keep], dates[keep], rows[keep]
+
+        unique_dates, starts = np.unique(dates, return_index=True)
+        offsets = np.append(starts, len(dates)).astype(np.int64)
+        return cls(unique_dates, offsets, slots, rows, cls.store_fingerprint(store))
+
+    def select(self, dates: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """返回指定日期命中的(日期, 序号, dat行号)"""
+        dates = np.atleast_1d(np.asarray(dates, dtype=np.int64))
+        if len(self.dates) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        pos = np.minimum(np.searchsorted(self.dates, dates), len(self.dates) - 1)
+        found = self.dates[pos] == dates
+        pos = pos[found]
+        counts = self.offsets[pos + 1] - self.offsets[pos]
+        selected = _segment_rows(self.offsets[pos], counts)
+        return np.repeat(dates[found], counts), self.slots[selected], self.rows[selected]
+
+    def save(self, path: str) -> None:
+        """保存为npz文件"""
+        with open(path, 'wb') as f:
+            np.savez(f, dates=self.dates, offsets=self.offsets, slots=self.slots, rows=self.rows,
+                     fingerprint=self.fingerprint)
+        logger.info(f"保存日期索引: {path}")
+
+    @classmethod
+    def load(cls, path: str, store: ExtDataStore) -> Optional['ExtDataDateIndex']:
+        """加载npz文件，文件不存在或与存储对象的指纹不一致时返回None"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                index = cls(data['dates'], data['offsets'], data['slots'], data['rows'], data['fingerprint'])
+        except Exception as e:
+            logger.warning(f"读取日期索引失败: {path}, 错误: {e}")
+            return None
+
+        if not np.array_equal(index.fingerprint, cls.store_fingerprint(store)):
+            logger.info(f"日期索引已过期: {path}")
+            return None
+        return index
+
+    @classmethod
+    def open(cls, path: str, store: ExtDataStore) -> 'ExtDataDateIndex':
+        """加载持久化的日期索引，过期或不存在时重新建立并保存"""
+        index = cls.load(path, store)
+        if index is None:
+            index = cls.build(store)
+            index.save(path)
+        return index
 
 
 def merge_stock_data(old_data: pd.DataFrame, new_data: pd.DataFrame) -> pd.DataFrame:
@@ -498,11 +1416,23 @@ def process_incremental_update_files_optimized(
         new_idx_path: str,
         new_dat_path: str,
         output_idx_path: str,
-        output_dat_path: str
+        output_dat_path: str,
+        bulk: bool = False,
+        checksum_path: Optional[str] = None,
+        report: Optional[Dict[str, int]] = None
 ) -> bool:
     """
     优化版的增量更新处理主函数
+
+    bulk为True时使用整文件向量化合并（process_incremental_update_files_bulk），
+    checksum_path和report只在bulk合并时生效（见process_incremental_update_files_bulk）
     """
+    if bulk:
+        return process_incremental_update_files_bulk(old_idx_path, old_dat_path, new_idx_path, new_dat_path,
+                                                     output_idx_path, output_dat_path,
+                                                     checksum_path=checksum_path, report=report)
+    if checksum_path:
+        logger.warning("校验和跳过只支持bulk合并，忽略checksum_path")
     try:
         # 1. 并行加载idx文件
         logger.info("并行加载idx文件...")
@@ -556,6 +1486,456 @@ def process_incremental_update_files_optimized(
         return False
 
 
+def merge_extdata_bulk(
+        old_index: ExtDataIndex,
+        old_records: np.ndarray,
+        new_index: ExtDataIndex,
+        new_records: np.ndarray,
+        max_records: int = 500
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    整文件向量化合并现有数据和增量数据
+
+    所有记录标记股票序号和来源后按(代码, 日期, 来源)排序，同一代码同一日期保留增量数据，
+    每只股票保留最新的max_records条。股票按代码升序排列，市场代码优先取现有数据。
+
+    Args:
+        old_index: 现有数据的idx索引
+        old_records: 现有数据的dat记录（DAT_DTYPE）
+        new_index: 增量数据的idx索引
+        new_records: 增量数据的dat记录（DAT_DTYPE）
+        max_records: 每只股票保留的最大记录数
+
+    Returns:
+        Tuple: (IDX_DTYPE结构化数组, DAT_DTYPE结构化数组)，可直接交给write_idx_array/write_dat_array
+    """
+    all_codes = np.union1d(old_index.stock_code, new_index.stock_code)
+
+    code_ids = []
+    rows = []
+    for index, records in ((old_index, old_records), (new_index, new_records)):
+        available = np.clip(len(records) - index.cum_sum, 0, None)
+        counts = np.minimum(index.record_count, available)
+        ids = np.searchsorted(all_codes, index.stock_code).astype(np.int64)
+        code_ids.append(np.repeat(ids, counts))
+        rows.append(_segment_rows(index.cum_sum, counts))
+
+    merged = np.concatenate([old_records[rows[0]], new_records[rows[1]]])
+    code_id = np.concatenate(code_ids)
+    source = np.repeat(np.array([0, 1], dtype=np.int64), [len(rows[0]), len(rows[1])])
+
+    # 按(代码, 日期, 来源)排序，同一(代码, 日期)的最后一条即增量数据；三个键合成一个int64键排序
+    sort_keys = (code_id << 33) | (merged['date_int'].astype(np.int64) << 1) | source
+    order = np.argsort(sort_keys, kind='stable')
+    merged, code_id, sort_keys = merged[order], code_id[order], sort_keys[order] >> 1
+
+    keep = np.ones(len(merged), dtype=bool)
+    keep[:-1] = sort_keys[:-1] != sort_keys[1:]
+    merged, code_id = merged[keep], code_id[keep]
+
+    # 每只股票保留最新的max_records条
+    counts = np.bincount(code_id, minlength=len(all_codes))
+    ends = np.cumsum(counts)
+    keep = (ends[code_id] - np.arange(len(code_id))) <= max_records
+    merged, code_id = merged[keep], code_id[keep]
+    counts = np.bincount(code_id, minlength=len(all_codes))
+
+    market_code = np.zeros(len(all_codes), dtype=np.int64)
+    market_code[np.searchsorted(all_codes, new_index.stock_code)] = new_index.market_code
+    market_code[np.searchsorted(all_codes, old_index.stock_code)] = old_index.market_code
+
+    return build_idx_array(market_code, all_codes, counts), np.ascontiguousarray(merged)
+
+
+def merge_extdata_skipping(
+        old_index: ExtDataIndex,
+        old_records: np.ndarray,
+        new_index: ExtDataIndex,
+        new_records: np.ndarray,
+        skipped_stocks: Set[str],
+        max_records: int = 500
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    跳过部分股票的整文件合并：skipped_stocks直接沿用现有数据段，只对其余股票排序合并
+
+    Returns:
+        Tuple: (IDX_DTYPE结构化数组, DAT_DTYPE结构化数组, 各股票沿用的现有数据序号（合并的股票为-1）)，
+               结果与merge_extdata_bulk相同的前提是跳过的股票再次合并的结果就是现有数据段（见find_unchanged_stocks）
+    """
+    skipped = list(skipped_stocks)
+    skip_old = np.isin(old_index.stock_code, skipped)
+    keep_new = ~np.isin(new_index.stock_code, skipped)
+    merged_idx, merged_dat = merge_extdata_bulk(
+        ExtDataIndex(old_index.market_code[~skip_old], old_index.stock_code[~skip_old],
+                     old_index.record_count[~skip_old], old_index.cum_sum[~skip_old]), old_records,
+        ExtDataIndex(new_index.market_code[keep_new], new_index.stock_code[keep_new],
+                     new_index.record_count[keep_new], new_index.cum_sum[keep_new]), new_records, max_records)
+
+    # 合并结果与沿用的现有数据段按代码排序拼接
+    skipped_slots = np.flatnonzero(skip_old)
+    stock_code = np.concatenate([decode_stock_codes(merged_idx['stock_code']), old_index.stock_code[skipped_slots]])
+    order = np.argsort(stock_code, kind='stable')
+    market_code = np.concatenate([merged_idx['market_code'], old_index.market_code[skipped_slots]])[order]
+    counts = np.concatenate([merged_idx['record_count'].astype(np.int64),
+                             old_index.record_count[skipped_slots]])[order]
+    known_slots = np.concatenate([np.full(len(merged_idx), -1, dtype=np.int64), skipped_slots])[order]
+
+    starts = np.cumsum(counts) - counts
+    is_skipped = known_slots >= 0
+    dat_records = np.empty(int(counts.sum()), dtype=DAT_DTYPE)
+    dat_records[_segment_rows(starts[~is_skipped], counts[~is_skipped])] = merged_dat
+    dat_records[_segment_rows(starts[is_skipped], counts[is_skipped])] = \
+        old_records[_segment_rows(old_index.cum_sum[known_slots[is_skipped]], counts[is_skipped])]
+    return build_idx_array(market_code, stock_code[order], counts), dat_records, known_slots
+
+
+def _copy_byte_range(src, dst, offset: int, length: int) -> None:
+    """将src文件[offset, offset+length)的字节追加到dst（两者均为无缓冲的二进制文件对象）"""
+    if length <= 0:
+        return
+
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while length > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), min(length, 1 << 30), offset)
+                if copied == 0:
+                    break
+                offset += copied
+                length -= copied
+            if length == 0:
+                return
+        except OSError as e:
+            logger.debug(f"copy_file_range不可用，改用缓冲区复制: {e}")
+
+    src.seek(offset)
+    while length > 0:
+        chunk = src.read(min(length, COPY_BUFFER_SIZE))
+        if not chunk:
+            raise IOError(f"源文件数据不足，剩余 {length} 字节未复制")
+        _write_all(dst, chunk)
+        length -= len(chunk)
+
+
+def _write_all(dst, data) -> None:
+    """无缓冲文件可能只写入部分数据，循环直到全部写入"""
+    view = memoryview(data)
+    while view:
+        view = view[dst.write(view):]
+
+
+def file_digest(file_path: str) -> str:
+    """按COPY_BUFFER_SIZE分块计算文件的sha1"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            chunk = f.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_same_file(src_stat: os.stat_result, src_path: str, dst_path: str, verify_hash: bool) -> bool:
+    """
+    目标文件大小、修改时间（复制时由copystat保留）一致时视为无需复制
+
+    verify_hash时还要求sha1一致，需要完整读取源文件和目标文件，跨盘时比复制本身更慢，只在怀疑被篡改时开启
+    """
+    try:
+        dst_stat = os.stat(dst_path)
+    except OSError:
+        return False
+    if dst_stat.st_size != src_stat.st_size or dst_stat.st_mtime_ns != src_stat.st_mtime_ns:
+        return False
+    return not verify_hash or file_digest(src_path) == file_digest(dst_path)
+
+
+def stage_file(src_path: str, dst_dir: str, verify_hash: bool = False) -> Dict[str, Any]:
+    """
+    复制单个文件到目录，目标文件一致时跳过
+
+    先复制到目标目录下的临时文件，再原子重命名为目标文件名（跨盘复制时也不会留下不完整的目标文件），
+    并保留修改时间，下次复制时可据此跳过。
+
+    Returns:
+        Dict: {'src', 'dst', 'bytes', 'skipped'}
+    """
+    dst_path = os.path.join(dst_dir, os.path.basename(src_path))
+    src_stat = os.stat(src_path)
+    result = {'src': src_path, 'dst': dst_path, 'bytes': src_stat.st_size, 'skipped': False}
+    if _is_same_file(src_stat, src_path, dst_path, verify_hash):
+        result['skipped'] = True
+        return result
+
+    temp_path = f"{dst_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(src_path, 'rb', buffering=0) as src, open(temp_path, 'wb', buffering=0) as dst:
+            _copy_byte_range(src, dst, 0, src_stat.st_size)
+        shutil.copystat(src_path, temp_path)
+        os.replace(temp_path, dst_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return result
+
+
+def stage_files(src_paths: List[str], dst_dir: str, max_workers: int = 8,
+                verify_hash: bool = False, check_cancelled: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """
+    并发复制多个文件到目录（有界线程池），大小、修改时间一致的文件跳过
+
+    Args:
+        src_paths: 源文件路径
+        dst_dir: 目标目录
+        max_workers: 并发复制的文件数
+        verify_hash: 大小、修改时间一致时是否再比较sha1（默认关闭，会完整读取两边的文件）
+        check_cancelled: 取消检查（如BaseProcessor.check_cancelled），每个文件开始复制前调用，
+            已取消时抛出异常，不再复制剩余的文件
+
+    Returns:
+        Dict: copied/skipped（文件数）、bytes_copied/bytes_skipped、seconds、throughput（复制字节/秒）、
+              errors（源文件路径 -> 错误信息）
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    summary = {'copied': 0, 'skipped': 0, 'bytes_copied': 0, 'bytes_skipped': 0, 'errors': {}}
+    start = time.perf_counter()
+    def stage(path):
+        if check_cancelled is not None:
+            check_cancelled()
+        return stage_file(path, dst_dir, verify_hash)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(src_paths) or 1))) as executor:
+        futures = {executor.submit(stage, path): path for path in src_paths}
+        for future, path in futures.items():
+            # 等待该文件完成后再检查取消，已取消时放弃尚未开始的文件并抛出取消异常
+            future.exception()
+            if check_cancelled is not None:
+                try:
+                    check_cancelled()
+                except BaseException:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"复制[{path}]到[{dst_dir}]失败: {e}")
+                summary['errors'][path] = str(e)
+                continue
+            if result['skipped']:
+                summary['skipped'] += 1
+                summary['bytes_skipped'] += result['bytes']
+                logger.debug(f"[{path}]未变化，跳过复制")
+            else:
+                summary['copied'] += 1
+                summary['bytes_copied'] += result['bytes']
+                logger.debug(f"复制[{path}]到[{dst_dir}]")
+    summary['seconds'] = time.perf_counter() - start
+    summary['throughput'] = summary['bytes_copied'] / summary['seconds'] if summary['seconds'] > 0 else 0.0
+    return summary
+
+
+def find_unchanged_segments(old_index: ExtDataIndex, old_records: np.ndarray,
+                            idx_records: np.ndarray, dat_records: np.ndarray,
+                            known_slots: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    找出与原文件逐字节相同的股票数据段
+
+    Args:
+        old_index: 原文件的idx索引
+        old_records: 原文件的dat记录（DAT_DTYPE）
+        idx_records: 新的idx记录（IDX_DTYPE）
+        dat_records: 新的dat记录（DAT_DTYPE），按idx_records顺序连续排列
+        known_slots: 已知与原文件相同的数据段对应的原文件序号（其余为-1），这些股票不再逐字节比较
+
+    Returns:
+        每只股票对应的原文件序号，数据段有变化或原文件中不存在时为-1
+    """
+    new_counts = idx_records['record_count'].astype(np.int64)
+    new_starts = np.cumsum(new_counts) - new_counts
+    old_slots = old_index.lookup(decode_stock_codes(idx_records['stock_code']))
+
+    # 只有记录数相同且完整存在于原文件中的数据段才需要逐字节比较
+    candidates = np.flatnonzero(old_slots >= 0)
+    if known_slots is not None:
+        candidates = candidates[known_slots[candidates] < 0]
+    old_starts = old_index.cum_sum[old_slots[candidates]]
+    old_counts = old_index.record_count[old_slots[candidates]]
+    comparable = (old_counts == new_counts[candidates]) & (old_starts + old_counts <= len(old_records))
+    candidates, old_starts = candidates[comparable], old_starts[comparable]
+    counts = new_counts[candidates]
+
+    # 每条记录按3个uint32比较，浮点NaN也能按字节判断相同
+    old_words = np.ascontiguousarray(old_records).view('<u4').reshape(-1, 3)
+    new_words = np.ascontiguousarray(dat_records).view('<u4').reshape(-1, 3)
+    differs = np.any(old_words[_segment_rows(old_starts, counts)] !=
+                     new_words[_segment_rows(new_starts[candidates], counts)], axis=1)
+    seg_ids = np.repeat(np.arange(len(candidates)), counts)
+    unchanged = np.bincount(seg_ids[differs], minlength=len(candidates)) == 0
+
+    result = np.full(len(idx_records), -1, dtype=np.int64) if known_slots is None else known_slots.astype(np.int64)
+    result[candidates[unchanged]] = old_slots[candidates[unchanged]]
+    return result
+
+
+def write_dat_segments(old_dat_path: str, old_index: ExtDataIndex, old_records: np.ndarray,
+                       idx_records: np.ndarray, dat_records: np.ndarray, output_path: str,
+                       known_slots: Optional[np.ndarray] = None) -> Dict[str, int]:
+    """
+    生成dat文件：未变化的股票数据段直接从原文件复制字节区间，只重新编码有变化的股票
+
+    相邻的未变化数据段在原文件中也连续时合并为一次复制，相邻的变化数据段合并为一次写入。
+
+    Args:
+        old_dat_path: 原dat文件路径
+        old_index: 原文件的idx索引
+        old_records: 原文件的dat记录（可为内存映射）
+        idx_records: 新的idx记录（IDX_DTYPE）
+        dat_records: 新的dat记录（DAT_DTYPE）
+        output_path: 输出dat文件路径
+        known_slots: 已知未变化的股票对应的原文件序号（其余为-1），见find_unchanged_segments
+
+    Returns:
+        Dict: copied_stocks, encoded_stocks, copied_bytes, encoded_bytes, copy_ops, write_ops
+    """
+    old_slots = find_unchanged_segments(old_index, old_records, idx_records, dat_records, known_slots)
+    new_counts = idx_records['record_count'].astype(np.int64)
+    new_starts = np.cumsum(new_counts) - new_counts
+
+    # 合并为连续的操作：['copy', 原文件起始记录, 记录数] 或 ['encode', 新记录起始, 记录数]
+    operations = []
+    for slot, old_slot in enumerate(old_slots.tolist()):
+        count = int(new_counts[slot])
+        if count == 0:
+            continue
+        if old_slot >= 0:
+            op, start = 'copy', int(old_index.cum_sum[old_slot])
+        else:
+            op, start = 'encode', int(new_starts[slot])
+        if operations and operations[-1][0] == op and operations[-1][1] + operations[-1][2] == start:
+            operations[-1][2] += count
+        else:
+            operations.append([op, start, count])
+
+    report = {
+        'copied_stocks': int(np.count_nonzero((old_slots >= 0) & (new_counts > 0))),
+        'encoded_stocks': int(np.count_nonzero((old_slots < 0) & (new_counts > 0))),
+        'copied_bytes': 0,
+        'encoded_bytes': 0,
+        'copy_ops': 0,
+        'write_ops': 0,
+    }
+
+    with open(old_dat_path, 'rb', buffering=0) as src, open(output_path, 'wb', buffering=0) as dst:
+        for op, start, count in operations:
+            if op == 'copy':
+                _copy_byte_range(src, dst, start * DAT_RECORD_SIZE, count * DAT_RECORD_SIZE)
+                report['copied_bytes'] += count * DAT_RECORD_SIZE
+                report['copy_ops'] += 1
+            else:
+                _write_all(dst, np.ascontiguousarray(dat_records[start:start + count]).tobytes())
+                report['encoded_bytes'] += count * DAT_RECORD_SIZE
+                report['write_ops'] += 1
+
+    logger.info(f"生成dat文件: {output_path}，复制 {report['copied_stocks']} 只股票 {report['copied_bytes']} 字节，"
+                f"重新编码 {report['encoded_stocks']} 只股票 {report['encoded_bytes']} 字节")
+    return report
+
+
+def process_incremental_update_files_bulk(
+        old_idx_path: str,
+        old_dat_path: str,
+        new_idx_path: str,
+        new_dat_path: str,
+        output_idx_path: str,
+        output_dat_path: str,
+        max_records: int = 500,
+        segment_copy: bool = True,
+        checksum_path: Optional[str] = None,
+        report: Optional[Dict[str, int]] = None
+) -> bool:
+    """
+    整文件向量化的增量更新处理主函数：一次合并所有股票并批量写出idx/dat文件
+
+    segment_copy为True时，未变化的股票数据段直接从原dat文件复制（见write_dat_segments）
+
+    提供checksum_path时，比较现有数据（old）和增量数据（new）各股票数据段的校验和与上次运行保存的结果：
+    增量数据段未变化且现有数据段就是上次输出的股票不再合并，直接沿用现有数据段（见find_unchanged_stocks）；
+    输出文件写入成功后保存本次的校验和。report不为None时写入 total/skipped/merged 统计，
+    以及dat文件的 copied_stocks/encoded_stocks/copied_bytes/encoded_bytes/copy_ops/write_ops（见write_dat_segments）。
+    """
+    try:
+        with ExtDataStore(old_idx_path, old_dat_path) as old_store, \
+                ExtDataStore(new_idx_path, new_dat_path) as new_store:
+            if len(old_store) == 0 or len(new_store) == 0:
+                logger.error(f"idx文件解析失败或为空: {old_idx_path}, {new_idx_path}")
+                return False
+
+            old_stocks = set(old_store.codes)
+            new_stocks = set(new_store.codes)
+            logger.info(f"合并汇总，交集数量:{len(old_stocks & new_stocks)}, 并集数量:{len(old_stocks | new_stocks)}, 新增数量:{len(new_stocks - old_stocks)}")
+            logger.info(f"新增的股票代码集合:{new_stocks - old_stocks}")
+            logger.info(f"不再更新的股票代码集合:{old_stocks - new_stocks}")
+
+            old_index, new_index = old_store.index, new_store.index
+            skipped_stocks = set()
+            if checksum_path:
+                new_checksums = segment_checksums(new_index, new_store.records)
+                old_checksums = segment_checksums(old_index, old_store.records)
+                skipped_stocks = find_unchanged_stocks(old_index, old_checksums, new_index, new_checksums,
+                                                       load_segment_checksums(checksum_path))
+                # 现有数据段超过max_records条或不完整时合并结果会不同，不能跳过
+                invalid = (old_index.record_count > max_records) | \
+                          (old_index.cum_sum + old_index.record_count > len(old_store.records))
+                skipped_stocks -= set(old_index.stock_code[invalid].tolist())
+                logger.info(f"校验和未变化跳过 {len(skipped_stocks)} 只股票，"
+                            f"需要合并 {len(new_stocks) - len(skipped_stocks)} 只股票")
+            if report is not None:
+                report.update({'total': len(old_stocks | new_stocks), 'skipped': len(skipped_stocks),
+                               'merged': len(new_stocks) - len(skipped_stocks)})
+
+            # 跳过的股票不参与排序合并，写dat文件时直接复制、不再逐字节比较
+            known_slots = None
+            if skipped_stocks:
+                idx_records, dat_records, known_slots = merge_extdata_skipping(
+                    old_index, old_store.records, new_index, new_store.records, skipped_stocks, max_records)
+            else:
+                idx_records, dat_records = merge_extdata_bulk(old_index, old_store.records,
+                                                              new_index, new_store.records, max_records)
+
+            # 输出csv文件，目录同output_idx_path
+            ExtDataIndex.from_array(idx_records).to_frame().to_csv(output_idx_path.replace('.idx', '_temp.csv'),
+                                                                   index=False)
+
+            logger.info(f"生成新文件，股票数量: {len(idx_records)}，记录数量: {len(dat_records)}")
+            same_file = os.path.exists(output_dat_path) and os.path.samefile(old_dat_path, output_dat_path)
+            expected_bytes = len(dat_records) * DAT_RECORD_SIZE
+            if segment_copy and not same_file:
+                dat_report = write_dat_segments(old_dat_path, old_index, old_store.records,
+                                                idx_records, dat_records, output_dat_path, known_slots)
+                dat_success = dat_report['copied_bytes'] + dat_report['encoded_bytes'] == expected_bytes
+                if not dat_success:
+                    logger.error(f"dat文件写入字节数与记录数不符: {output_dat_path}，"
+                                 f"写入 {dat_report['copied_bytes'] + dat_report['encoded_bytes']} 字节，应为 {expected_bytes} 字节")
+            else:
+                dat_success = write_dat_array(output_dat_path, dat_records)
+                dat_report = {'copied_stocks': 0, 'encoded_stocks': int(np.count_nonzero(idx_records['record_count'])),
+                              'copied_bytes': 0, 'encoded_bytes': expected_bytes, 'copy_ops': 0, 'write_ops': 1}
+            if report is not None:
+                report.update(dat_report)
+
+            success = dat_success and write_idx_array(output_idx_path, idx_records)
+            if success and checksum_path:
+                output_index = ExtDataIndex.from_array(idx_records)
+                save_segment_checksums(checksum_path, new_index, new_checksums, output_index,
+                                       output_segment_checksums(output_index, dat_records, old_checksums, known_slots))
+        return success
+
+    except Exception as e:
+        logger.error(f"处理增量更新时发生错误: {e}", exc_info=True)
+        return False
+
+
 def load_idx_data_parallel(old_path: str, new_path: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """并行加载idx文件"""
     # 这里可以使用多线程，但为了简单起见，先顺序执行
@@ -743,25 +2123,16 @@ def generate_dat_file(dat_data: Dict[str, pd.DataFrame], output_path: str) -> bo
     """
     logger.info(f"生成dat文件: {output_path}")
 
-    # 收集所有数据记录
-    all_records = []
-    total_records = sum(len(df) for df in dat_data.values())
-
-    # 添加进度条
-    pbar = tqdm(total=total_records, desc="写入DAT记录", unit="条")
-
-    for stock_code, df in dat_data.items():
-        for _, row in df.iterrows():
-            all_records.append((
-                int(row['date_int']),
-                int(row.get('time_int', 0)),
-                float(row['value_f'])
-            ))
-            pbar.update(1)
-    pbar.close()
+    try:
+        # 每只股票按列打包，合并后一次性写入
+        all_records = [frame_to_dat_array(df) for df in tqdm(dat_data.values(), desc="打包DAT记录", unit="只")]
+        records = np.concatenate(all_records) if all_records else np.empty(0, dtype=DAT_DTYPE)
+    except Exception as e:
+        logger.error(f"生成dat文件错误: {e}", exc_info=True)
+        return False
 
     # 写入文件
-    return write_binary_data(output_path, all_records)
+    return write_dat_array(output_path, records)
 
 
 def generate_idx_file(idx_df: pd.DataFrame, output_path: str) -> bool:
@@ -778,24 +2149,18 @@ def generate_idx_file(idx_df: pd.DataFrame, output_path: str) -> bool:
     logger.info(f"生成idx文件: {output_path}")
 
     try:
-        with open(output_path, 'wb') as f:
-            for _, row in idx_df.iterrows():
-                # 打包idx记录: market_code (2字节), stock_code (7字节), 保留16字节, record_count (4字节)
-                stock_code_bytes = row['stock_code'].encode('gb2312').ljust(7, b'\x00')
-                packed_data = struct.pack(
-                    '<H7s16xI',
-                    row['market_code'],
-                    stock_code_bytes,
-                    row['record_count']
-                )
-                f.write(packed_data)
-
-        logger.info(f"成功写入idx文件: {output_path}")
-        return True
+        # 打包idx记录: market_code (2字节), stock_code (7字节), 保留16字节, record_count (4字节)
+        if idx_df.empty:
+            return write_idx_array(output_path, np.empty(0, dtype=IDX_DTYPE))
+        idx_records = build_idx_array(idx_df['market_code'].to_numpy(),
+                                      idx_df['stock_code'].to_numpy(dtype=str),
+                                      idx_df['record_count'].to_numpy())
     except Exception as e:
         logger.error(f"写入idx文件失败: {e}")
         return False
 
+    return write_idx_array(output_path, idx_records)
+
 
 def merge_idx_data(old_idx_df: pd.DataFrame, new_idx_df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -849,8 +2214,7 @@ def merge_idx_data(old_idx_df: pd.DataFrame, new_idx_df: pd.DataFrame) -> pd.Dat
     return merged_idx_df
 
 
-def load_stock_data_optimized(dat_path: str, idx_df: pd.DataFrame, stock_codes: Set[str] = None) -> Dict[
-    str, pd.DataFrame]:
+def load_stock_data_optimized(dat_path: str, idx_df: pd.DataFrame, stock_codes: Set[str] = None) -> Dict[str, pd.DataFrame]:
     """
     优化版的数据加载方法
 
@@ -864,59 +2228,33 @@ def load_stock_data_optimized(dat_path: str, idx_df: pd.DataFrame, stock_codes:
     """
     logger.info(f"优化加载dat文件: {dat_path}")
 
+    index = ExtDataIndex.from_frame(idx_df)
     if stock_codes is None:
-        stock_codes = set(idx_df['stock_code'])
-
-    # 预先计算需要读取的数据范围
-    read_ranges = []
-    stock_mapping = {}
-
-    for _, row in tqdm(idx_df.iterrows(), total=len(idx_df), desc="加载股票数据", unit="只"):
-        stock_code = row['stock_code']
-        if stock_code not in stock_codes:
-            continue
-
-        start_index = int(row['cum_sum'])
-        record_count = int(row['record_count'])
-        end_index = start_index + record_count
-
-        read_ranges.append((start_index, end_index, stock_code))
-        stock_mapping[stock_code] = (start_index, record_count)
+        slots = np.arange(len(index))
+    else:
+        # 二分查找需要读取的股票，忽略idx中不存在的代码
+        slots = index.lookup(sorted(stock_codes))
+        slots = slots[slots >= 0]
 
     # 按起始位置排序，减少磁盘寻址时间
-    read_ranges.sort(key=lambda x: x[0])
+    slots = slots[np.argsort(index.cum_sum[slots], kind='stable')]
+    read_ranges = [(int(index.cum_sum[slot]), int(index.cum_sum[slot] + index.record_count[slot]),
+                    str(index.stock_code[slot])) for slot in slots]
 
     stock_data = {}
 
     # 批量读取数据
     try:
-        file_size = os.path.getsize(dat_path)
         record_size = DAT_RECORD_SIZE
 
         with open(dat_path, 'rb') as f:
             for start_index, end_index, stock_code in read_ranges:
-                # 定位到起始位置
+                # 定位到起始位置，一次性读取该股票的所有数据
                 f.seek(start_index * record_size)
+                records = np.fromfile(f, dtype=DAT_DTYPE, count=end_index - start_index)
 
-                # 读取该股票的所有数据
-                data_records = []
-                for _ in range(end_index - start_index):
-                    data = f.read(record_size)
-                    if len(data) < record_size:
-                        break
-
-                    try:
-                        parsed_data = struct.unpack('<IIf', data)
-                        data_records.append({
-                            'date_int': parsed_data[0],
-                            'time_int': parsed_data[1],
-                            'value_f': parsed_data[2]
-                        })
-                    except struct.error:
-                        break
-
-                if data_records:
-                    stock_data[stock_code] = pd.DataFrame(data_records)
+                if len(records):
+                    stock_data[stock_code] = dat_array_to_frame(records)
                 else:
                     stock_data[stock_code] = pd.DataFrame()
 
@@ -924,4 +2262,364 @@ def load_stock_data_optimized(dat_path: str, idx_df: pd.DataFrame, stock_codes:
         logger.error(f"读取dat文件错误: {e}")
         return {}
 
-    return stock_data
\ No newline at end of file
+    return stock_data
+
+
+def load_stock_data_frame(dat_path: str, idx_df: pd.DataFrame, stock_codes: Set[str] = None,
+                          set_index: bool = False) -> pd.DataFrame:
+    """
+    长表版的数据加载方法，替代每只股票一个DataFrame的字典
+
+    Args:
+        dat_path: dat文件路径
+        idx_df: 包含cum_sum和record_count的idx DataFrame
+        stock_codes: 需要加载的股票代码集合，None表示全部
+        set_index: 是否以(stock_code, date_int)作为索引
+
+    Returns:
+        DataFrame: 列为 stock_code(分类类型), date_int, time_int, value_f，按idx顺序排列；
+                   后续可直接使用groupby/pivot处理
+    """
+    logger.info(f"长表加载dat文件: {dat_path}")
+    try:
+        with ExtDataStore.from_idx_df(idx_df, dat_path) as store:
+            return store.to_frame(stock_codes, set_index=set_index)
+    except Exception as e:
+        logger.error(f"读取dat文件错误: {e}")
+        return pd.DataFrame()
+
+
+def extdata_file_paths(extdata_dir: str, slot: int) -> Tuple[str, str]:
+    """扩展数据序号对应的(idx路径, dat路径)，如 extdata_42.idx / extdata_42.dat"""
+    return (os.path.join(extdata_dir, f"extdata_{slot}.idx"),
+            os.path.join(extdata_dir, f"extdata_{slot}.dat"))
+
+
+class ExtDataCube:
+    """
+    多个扩展数据对齐后的 指标 × 股票 × 日期 稠密数组
+
+    values为float32数组，缺失位置为NaN；mask为同形状的bool数组，True表示该位置有数据
+    （用于区分缺失与原始数据本身为NaN）。
+
+    用法：
+        cube = load_extdata_cube(extdata_dir, [11, 12, 42])
+        rps = cube[42]                       # 股票 × 日期 二维数组
+        hit = (cube[11] > 0) & (cube[12] > 0)
+    """
+
+    def __init__(self, slots: List[int], stock_codes: np.ndarray, dates: np.ndarray,
+                 values: np.ndarray, mask: np.ndarray):
+        self.slots = list(slots)
+        self.stock_codes = stock_codes
+        self.dates = dates
+        self.values = values
+        self.mask = mask
+        self._slot_index = {slot: i for i, slot in enumerate(self.slots)}
+        self._stock_index = {code: i for i, code in enumerate(stock_codes.tolist())}
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.values.shape
+
+    def slot_index(self, slot: int) -> int:
+        """扩展数据序号在第一维中的位置，不存在时抛出KeyError"""
+        return self._slot_index[slot]
+
+    def stock_index(self, stock_code: str) -> int:
+        """股票代码在第二维中的位置，不存在时抛出KeyError"""
+        return self._stock_index[stock_code]
+
+    def date_index(self, date_int: int) -> int:
+        """日期在第三维中的位置，不存在时抛出KeyError"""
+        pos = int(np.searchsorted(self.dates, date_int))
+        if pos >= len(self.dates) or self.dates[pos] != date_int:
+            raise KeyError(date_int)
+        return pos
+
+    def frame(self, slot: int) -> pd.DataFrame:
+        """单个扩展数据的宽表：行为股票代码，列为日期"""
+        return pd.DataFrame(self[slot], index=pd.Index(self.stock_codes, name='stock_code'),
+                            columns=pd.Index(self.dates, name='date_int'))
+
+    def __getitem__(self, slot: int) -> np.ndarray:
+        return self.values[self._slot_index[slot]]
+
+    def __contains__(self, slot: int) -> bool:
+        return slot in self._slot_index
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+
+def _decode_extdata_slot(extdata_dir: str, slot: int, stock_codes=None,
+                         start_date: Optional[int] = None,
+                         end_date: Optional[int] = None) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """解码单个扩展数据为(每条记录的股票代码, 日期, 数值)，文件不存在或出错时返回None"""
+    idx_path, dat_path = extdata_file_paths(extdata_dir, slot)
+    if not (os.path.exists(idx_path) and os.path.exists(dat_path)):
+        logger.warning(f"扩展数据文件不存在: {idx_path} / {dat_path}")
+        return None
+
+    try:
+        with ExtDataStore(idx_path, dat_path) as store:
+            slots = store.select_slots(stock_codes)
+            counts = store.segment_counts(slots)
+            records = store.records[_segment_rows(store.cum_sum[slots], counts)]
+            codes = np.repeat(store.stock_code[slots], counts)
+    except Exception as e:
+        logger.error(f"解码扩展数据错误: extdata_{slot}, 错误: {e}")
+        return None
+
+    dates = records['date_int'].astype(np.int64)
+    keep = np.ones(len(dates), dtype=bool)
+    if start_date is not None:
+        keep &= dates >= start_date
+    if end_date is not None:
+        keep &= dates <= end_date
+    return codes[keep], dates[keep], records['value_f'][keep]
+
+
+def load_extdata_cube(extdata_dir: str, slots: List[int], stock_codes=None,
+                      start_date: Optional[int] = None, end_date: Optional[int] = None,
+                      max_workers: Optional[int] = None) -> ExtDataCube:
+    """
+    并发加载多个扩展数据，对齐到统一的股票轴和日期轴
+
+    各文件通过内存映射+NumPy解码，在线程池中并发执行（NumPy拷贝期间释放GIL）。
+
+    Args:
+        extdata_dir: extdata目录
+        slots: 扩展数据序号列表，如 [11, 12, 61, 62]
+        stock_codes: 股票代码列表，给定时按此顺序作为股票轴；None表示所有文件中出现的股票（排序后）
+        start_date: 起始日期（含），None表示不限
+        end_date: 结束日期（含），None表示不限
+        max_workers: 线程数，None表示使用默认值
+
+    Returns:
+        ExtDataCube: values形状为 (len(slots), 股票数, 日期数)，文件缺失的序号整层为NaN
+    """
+    slots = list(slots)
+    logger.info(f"并发加载扩展数据: {slots}")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        decoded = list(executor.map(
+            lambda slot: _decode_extdata_slot(extdata_dir, slot, stock_codes, start_date, end_date), slots))
+
+    loaded = [item for item in decoded if item is not None]
+    if stock_codes is not None:
+        stock_axis = np.asarray(list(dict.fromkeys(stock_codes)), dtype=object)
+    elif loaded:
+        stock_axis = np.unique(np.concatenate([codes for codes, _, _ in loaded])).astype(object)
+    else:
+        stock_axis = np.empty(0, dtype=object)
+    if loaded:
+        date_axis = np.unique(np.concatenate([dates for _, dates, _ in loaded]))
+    else:
+        date_axis = np.empty(0, dtype=np.int64)
+
+    values = np.full((len(slots), len(stock_axis), len(date_axis)), np.nan, dtype=np.float32)
+    mask = np.zeros(values.shape, dtype=bool)
+
+    stock_order = np.argsort(stock_axis.astype(str), kind='stable')
+    sorted_stocks = stock_axis.astype(str)[stock_order]
+
+    def fill(layer: int) -> None:
+        item = decoded[layer]
+        if item is None or len(item[0]) == 0:
+            return
+        codes, dates, slot_values = item
+        stock_pos = stock_order[np.searchsorted(sorted_stocks, codes.astype(str))]
+        date_pos = np.searchsorted(date_axis, dates)
+        values[layer, stock_pos, date_pos] = slot_values
+        mask[layer, stock_pos, date_pos] = True
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(fill, range(len(slots))))
+
+    logger.info(f"扩展数据加载完成: {len(slots)} 个指标 × {len(stock_axis)} 只股票 × {len(date_axis)} 个交易日")
+    return ExtDataCube(slots, stock_axis, date_axis, values, mask)
+
+
+# 流式遍历时每次读取的最大记录数（约12MB）
+ITER_CHUNK_RECORDS = 1024 * 1024
+
+
+def _plan_chunk_reads(index: ExtDataIndex, slots: np.ndarray, total_records: int,
+                      chunk_records: int) -> List[Tuple[int, int, List[int]]]:
+    """把按起始位置排序的股票数据段合并为连续的大块读取：[(起始记录, 记录数, 序号列表)]"""
+    reads = []
+    for slot in slots.tolist():
+        start = int(index.cum_sum[slot])
+        count = max(0, min(int(index.record_count[slot]), total_records - start))
+        if reads and reads[-1][0] + reads[-1][1] == start and reads[-1][1] + count <= chunk_records:
+            reads[-1][1] += count
+            reads[-1][2].append(slot)
+        else:
+            reads.append([start, count, [slot]])
+    return [(start, count, slot_list) for start, count, slot_list in reads]
+
+
+def iter_extdata(idx_path: str, dat_path: str, codes=None,
+                 chunk_records: int = ITER_CHUNK_RECORDS):
+    """
+    按文件顺序流式遍历扩展数据，内存占用与块大小相关而与文件大小无关
+
+    相邻股票的数据段合并为一次读取（不超过chunk_records条，单只股票超过时单独读取），
+    每只股票返回该块上的视图；调用方不再引用视图后对应的块即可被回收。
+
+    Args:
+        idx_path: idx文件路径
+        dat_path: dat文件路径
+        codes: 需要遍历的股票代码集合，None表示全部
+        chunk_records: 每次读取的最大记录数
+
+    Yields:
+        (stock_code, records): records为DAT_DTYPE结构化数组视图
+    """
+    index = ExtDataIndex.from_file(idx_path)
+    if codes is None:
+        slots = np.arange(len(index), dtype=np.int64)
+    else:
+        slots = index.lookup(sorted(set(codes)))
+        slots = slots[slots >= 0]
+    slots = slots[np.argsort(index.cum_sum[slots], kind='stable')]
+
+    total_records = os.path.getsize(dat_path) // DAT_RECORD_SIZE
+    reads = _plan_chunk_reads(index, slots, total_records, chunk_records)
+    logger.debug(f"流式遍历dat文件: {dat_path}，{len(slots)} 只股票，{len(reads)} 次读取")
+
+    with open(dat_path, 'rb') as f:
+        for start, count, slot_list in reads:
+            f.seek(start * DAT_RECORD_SIZE)
+            chunk = np.fromfile(f, dtype=DAT_DTYPE, count=count)
+            for slot in slot_list:
+                offset = int(index.cum_sum[slot]) - start
+                yield str(index.stock_code[slot]), chunk[offset:offset + int(index.record_count[slot])]
+
+
+def map_reduce(idx_path: str, dat_path: str, mapper: callable, reducer: Optional[callable] = None,
+               initial: Any = None, codes=None, chunk_records: int = ITER_CHUNK_RECORDS) -> Any:
+    """
+    对每只股票计算统计值并汇总，基于iter_extdata流式执行
+
+    Args:
+        idx_path: idx文件路径
+        dat_path: dat文件路径
+        mapper: mapper(stock_code, records) -> 单只股票的结果
+        reducer: reducer(累计值, stock_code, 单只股票的结果) -> 新的累计值；None表示返回 代码->结果 的字典
+        initial: reducer的初始累计值
+        codes: 需要计算的股票代码集合，None表示全部
+        chunk_records: 每次读取的最大记录数
+
+    Returns:
+        reducer为None时返回Dict[str, Any]，否则返回最终累计值
+
+    示例：
+        # 每只股票的最大值
+        max_values = map_reduce(idx_path, dat_path, lambda code, r: float(r['value_f'].max()) if len(r) else None)
+        # 全部记录数
+        total = map_reduce(idx_path, dat_path, lambda code, r: len(r), lambda acc, code, n: acc + n, initial=0)
+    """
+    if reducer is None:
+        return {stock_code: mapper(stock_code, records)
+                for stock_code, records in iter_extdata(idx_path, dat_path, codes, chunk_records)}
+
+    result = initial
+    for stock_code, records in iter_extdata(idx_path, dat_path, codes, chunk_records):
+        result = reducer(result, stock_code, mapper(stock_code, records))
+    return result
+
+
+def _diff_keys(store: ExtDataStore, code_axis: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """全部记录的 股票序号<<32 | date_int 键（已排序、同键保留第一条）及对应数值"""
+    slots = np.arange(len(store), dtype=np.int64)
+    counts = store.segment_counts(slots)
+    records = store.records[_segment_rows(store.cum_sum, counts)]
+    code_ids = np.repeat(np.searchsorted(code_axis, store.stock_code).astype(np.int64), counts)
+    keys = (code_ids << 32) | records['date_int'].astype(np.int64)
+    values = records['value_f'].astype(np.float64)
+
+    # 文件按代码排列且各股票日期有序时无需排序
+    if len(keys) > 1 and np.any(keys[1:] <= keys[:-1]):
+        order = np.argsort(keys, kind='stable')
+        keys, values = keys[order], values[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        keys, values = keys[first], values[first]
+    return keys, values
+
+
+def diff_extdata(left_idx_path: str, left_dat_path: str, right_idx_path: str, right_dat_path: str,
+                 rtol: float = 1e-6, atol: float = 1e-6) -> Dict[str, Any]:
+    """
+    整文件比较两组idx/dat，按(股票代码, 日期)对齐
+
+    以左侧为基准（如base目录），右侧为比较对象（如work目录）：
+    只在右侧存在的记录为新增，只在左侧存在的为删除，两侧都存在但np.isclose不成立的为变化（两侧均为NaN视为相同）。
+
+    Args:
+        left_idx_path: 基准idx文件路径
+        left_dat_path: 基准dat文件路径
+        right_idx_path: 比较idx文件路径
+        right_dat_path: 比较dat文件路径
+        rtol: 相对误差
+        atol: 绝对误差
+
+    Returns:
+        Dict:
+            summary: 全局统计 left_total, right_total, same, changed, added, removed, stocks_changed
+            stocks: 每只股票的统计DataFrame，列为 stock_code, left_count, right_count, same, changed, added, removed
+            changed: 值变化的记录DataFrame，列为 stock_code, date_int, value_left, value_right, diff
+    """
+    with ExtDataStore(left_idx_path, left_dat_path) as left, ExtDataStore(right_idx_path, right_dat_path) as right:
+        code_axis = np.union1d(left.stock_code, right.stock_code)
+        left_keys, left_values = _diff_keys(left, code_axis)
+        right_keys, right_values = _diff_keys(right, code_axis)
+
+    # 两侧键均已排序且唯一，二分查找完成连接
+    pos = np.minimum(np.searchsorted(right_keys, left_keys), max(len(right_keys) - 1, 0))
+    matched = right_keys[pos] == left_keys if len(right_keys) else np.zeros(len(left_keys), dtype=bool)
+    left_pos, right_pos = np.flatnonzero(matched), pos[matched]
+    equal = np.isclose(left_values[left_pos], right_values[right_pos], rtol=rtol, atol=atol, equal_nan=True)
+    removed = np.ones(len(left_keys), dtype=bool)
+    removed[left_pos] = False
+    added = np.ones(len(right_keys), dtype=bool)
+    added[right_pos] = False
+
+    def per_stock(keys: np.ndarray) -> np.ndarray:
+        return np.bincount(keys >> 32, minlength=len(code_axis))
+
+    common_keys = left_keys[left_pos]
+    stocks = pd.DataFrame({
+        'stock_code': code_axis.astype(object),
+        'left_count': per_stock(left_keys),
+        'right_count': per_stock(right_keys),
+        'same': per_stock(common_keys[equal]),
+        'changed': per_stock(common_keys[~equal]),
+        'added': per_stock(right_keys[added]),
+        'removed': per_stock(left_keys[removed]),
+    })
+
+    changed_keys = common_keys[~equal]
+    value_left = left_values[left_pos][~equal]
+    value_right = right_values[right_pos][~equal]
+    changed = pd.DataFrame({
+        'stock_code': code_axis[changed_keys >> 32].astype(object),
+        'date_int': changed_keys & 0xFFFFFFFF,
+        'value_left': value_left,
+        'value_right': value_right,
+        'diff': value_right - value_left,
+    })
+
+    summary = {
+        'left_total': len(left_keys),
+        'right_total': len(right_keys),
+        'same': int(equal.sum()),
+        'changed': int((~equal).sum()),
+        'added': int(added.sum()),
+        'removed': int(removed.sum()),
+        'stocks_changed': int(((stocks['changed'] + stocks['added'] + stocks['removed']) > 0).sum()),
+    }
+    logger.info(f"比较完成: {left_dat_path} vs {right_dat_path}，相同 {summary['same']}，变化 {summary['changed']}，"
+                f"新增 {summary['added']}，删除 {summary['removed']}，涉及 {summary['stocks_changed']} 只股票")
+    return {'summary': summary, 'stocks': stocks, 'changed': changed}
@@ -1,14 +1,21 @@
 # 使用绝对导入
-import shutil
+import argparse
+from abc import abstractmethod
 
 from hikyuu.interactive import *
+from datetime import datetime
 
 from tdx import extdata_util
 from tdx.ma50.preprocessor import Preprocessor
-from tdx.workflow import Config, WorkflowLogger, BaseProcessor, Workflow
+from tdx.trade_calendar import INVALID_DATE, get_calendar
+from tdx.workflow import Config, WorkflowLogger, BaseProcessor, Workflow, Backfill
 
 
 class TempDirProcessor(BaseProcessor):
+    reads = ('today_int',)
+    writes = ('temp_dir_path',)
+    idempotent = True
+
     def process(self, data: any) -> (any, bool):
         # 临时目录
         temp_extdata_path = self.get_temp_extdata_path()
@@ -18,8 +25,12 @@ class TempDirProcessor(BaseProcessor):
         temp_dir_name = str(data['today_int'])
         temp_dir_path = os.path.join(temp_extdata_path, temp_dir_name)
         try:
-            if os.path.exists(temp_dir_path):
-                temp_dir_files = os.listdir(temp_dir_path)
+            if os.path.exists(temp_dir_path) and self.resume:
+                # resume模式保留上次运行的中间结果和检查点
+                self.logger.info(f"继续使用临时目录：{temp_dir_path}")
+            elif os.path.exists(temp_dir_path):
+                temp_dir_files = [f for f in os.listdir(temp_dir_path)
+                                  if os.path.isfile(os.path.join(temp_dir_path, f))]
                 for file in temp_dir_files:
                     to_delete = os.path.join(temp_dir_path, file)
                     os.remove(to_delete)
@@ -36,6 +47,11 @@ class TempDirProcessor(BaseProcessor):
             return data, False
 
 class StockListProcessor(BaseProcessor):
+    reads = ('temp_dir_path',)
+    writes = ('stock_list',)
+    idempotent = True
+    # 回补时只加载一次
+    shared = True
 
     def process(self, data: any) -> (any, bool):
         # 保存数据的路径
@@ -62,18 +78,87 @@ class StockListProcessor(BaseProcessor):
         return data, True
 
 
-class CrowdednessProcessor(BaseProcessor):
-    def process(self, data):
+class IndicatorProcessor(BaseProcessor):
+    """
+    hikyuu统计指标处理器
+
+    子类实现compute，返回 文件名（不含扩展名） -> 包含date_int、value_f列的DataFrame。
+    按日执行时计算最近window个交易日；回补时一次计算所有日期，再按日截取写入各日期的临时目录。
+    """
+    reads = ('temp_dir_path', 'stock_list')
+    writes = ()
+    idempotent = True
+    # 每个日期输出的交易日数
+    window = 100
+    recover_type = Query.FORWARD
+    file_names = ()
+
+    @property
+    def cacheable(self):
+        """检查点键须包含hikyuu数据文件的指纹，未配置path.hikyuu_data_dir时不保存检查点"""
+        return bool(self.get_hikyuu_data_dir())
+
+    def get_hikyuu_data_dir(self):
+        return self.config.get("path", {}).get("hikyuu_data_dir")
+
+    def cache_inputs(self, data):
+        # 股票列表以代码参与检查点键，hikyuu的Stock对象无法序列化
+        return {'temp_dir_path': data['temp_dir_path'],
+                'stock_codes': sorted(stk.market_code for stk in data['stock_list'])}
+
+    def input_files(self, data):
+        # hikyuu数据目录下的K线数据文件（如sh_day.h5），数据更新后重新计算
+        data_dir = self.get_hikyuu_data_dir()
+        return [os.path.join(data_dir, f) for f in sorted(os.listdir(data_dir))
+                if os.path.isfile(os.path.join(data_dir, f))]
+
+    def output_files(self, data):
+        return [data['temp_dir_path'] + "\\" + f"{name}.dat" for name in self.file_names]
+
+    @abstractmethod
+    def compute(self, stk_list, q) -> dict:
+        pass
+
+    def _write(self, temp_dir_path, results):
+        for name, result_df in results.items():
+            # 超时或取消后不再写入日期临时目录
+            self.check_cancelled()
+            result_df.to_csv(temp_dir_path + "\\" + f"{name}.csv")
+            extdata_util.generate_file_dat(result_df, temp_dir_path + "\\" + f"{name}.dat")
 
-        temp_dir_path = data['temp_dir_path']
-        stk_list = data['stock_list']
+    def process(self, data):
+        q = Query(-self.window, recover_type=self.recover_type)
+        self._write(data['temp_dir_path'], self.compute(data['stock_list'], q))
+        return data, True
 
+    def process_range(self, days_data):
+        days = sorted(days_data)
+        # 第一天往前window个交易日到最后一天（Query的结束日期不包含在内）
+        start_int = int(get_calendar().shift(days[0], 1 - self.window))
+        if start_int == INVALID_DATE:
+            self.logger.error(f"日期 {days[0]} 往前第{self.window}个交易日超出交易日历范围，无法回补")
+            return days_data, False
+        q = Query(Datetime(start_int * 10000), Datetime(days[-1] * 10000) + Days(1), recover_type=self.recover_type)
+        results = self.compute(days_data[days[0]]['stock_list'], q)
+        for day in days:
+            day_results = {name: result_df[result_df['date_int'] <= day].tail(self.window)
+                           for name, result_df in results.items()}
+            self._write(days_data[day]['temp_dir_path'], day_results)
+        return days_data, True
+
+
+class CrowdednessProcessor(IndicatorProcessor):
+    window = 10
+    recover_type = Query.NO_RECOVER
+    file_names = ('extdata_82',)
+
+    def compute(self, stk_list, q):
         # 调用hikyuu计算拥挤度
         percent = 5
-        q = Query(-10)
         cal = sm.get_trading_calendar(q)
         df = pd.DataFrame()
         for dtime in cal:
+            self.check_cancelled()
             ind_view_df = get_inds_view(stk_list, [AMO], dtime)
             # print(ind_view_df.head())
             # 计算前5
@@ -106,9 +191,7 @@ class CrowdednessProcessor(BaseProcessor):
 
         amo_crowd_ind = amo_sum_ind / amo_a_total_ind
         # print(amo_crowd_ind)
-        amo_crowd_ind.plot()
 
-        cal_df = cal.to_df()
         amo_df = amo_sum_ind.to_df()
 
         # 关键步骤：按列合并（横向合并），使 datetime 和 AMO 成为两列
@@ -121,24 +204,18 @@ class CrowdednessProcessor(BaseProcessor):
         result_df['value_f'] = result_df['AMO'] / result_df['AMO_A']
         # result_df = result_df.rename(columns={'AMO': 'value_f'})
         # print(result_df)
-        result_df.to_csv(temp_dir_path + "\\extdata_82.csv")
-        extdata_util.generate_file_dat(result_df, temp_dir_path + "\\extdata_82.dat")
-
-
-        return data, True
-
-class NLNHProcessor(BaseProcessor):
-    def process(self, data: any) -> (any, bool):
+        return {'extdata_82': result_df}
 
-        temp_dir_path = data['temp_dir_path']
-        stk_list = data['stock_list']
+class NLNHProcessor(IndicatorProcessor):
+    file_names = ('extdata_65', 'extdata_66')
 
+    def compute(self, stk_list, q):
         # 统计新高新低
         NH_60 = HIGH() >= HHV(HIGH(), 60)
         NL_60 = LOW() <= LLV(LOW(), 60)
 
-        q = Query(-100, recover_type=Query.FORWARD)
         nh_60_ind = INSUM(stk_list, q, ind=NH_60, mode=0)
+        self.check_cancelled()
         nl_60_ind = INSUM(stk_list, q, ind=NL_60, mode=0)
 
         cal = sm.get_trading_calendar(q)
@@ -147,39 +224,29 @@ class NLNHProcessor(BaseProcessor):
         nh_60_df = nh_60_ind.to_df().rename(columns={'value0': 'value_f'})
         nl_60_df = nl_60_ind.to_df().rename(columns={'value0': 'value_f'})
 
-        result_df = pd.concat([cal_df, nh_60_df], axis=1).rename(columns={'value0': 'value_f'})
-        result_df['date_int'] = result_df['datetime'].dt.strftime('%Y%m%d').astype(int)
+        nh_result_df = pd.concat([cal_df, nh_60_df], axis=1).rename(columns={'value0': 'value_f'})
+        nh_result_df['date_int'] = nh_result_df['datetime'].dt.strftime('%Y%m%d').astype(int)
 
-        print(result_df)
+        print(nh_result_df)
 
-        result_df.to_csv(temp_dir_path + "\\extdata_65.csv")
-        extdata_util.generate_file_dat(result_df, temp_dir_path + "\\extdata_65.dat")
+        nl_result_df = pd.concat([cal_df, nl_60_df], axis=1).rename(columns={'value0': 'value_f'})
+        nl_result_df['date_int'] = nl_result_df['datetime'].dt.strftime('%Y%m%d').astype(int)
 
-
-        result_df = pd.concat([cal_df, nl_60_df], axis=1).rename(columns={'value0': 'value_f'})
-        result_df['date_int'] = result_df['datetime'].dt.strftime('%Y%m%d').astype(int)
-
-        print(result_df)
-        result_df.to_csv(temp_dir_path + "\\extdata_66.csv")
-        extdata_util.generate_file_dat(result_df, temp_dir_path + "\\extdata_66.dat")
-
-        return data, True
+        print(nl_result_df)
+        return {'extdata_65': nh_result_df, 'extdata_66': nl_result_df}
 
 
 
 
-class MA50Processor(BaseProcessor):
-    def process(self, data):
-
-        # 保存数据的路径
-        temp_dir_path = data['temp_dir_path']
-        stk_list = data['stock_list']
+class MA50Processor(IndicatorProcessor):
+    file_names = ('extdata_63',)
 
+    def compute(self, stk_list, q):
         UP_MA50 = CLOSE() > MA(CLOSE(), 50)
 
         # 统计这批票里面上MA50的数量
-        q = Query(-100, recover_type=Query.FORWARD)
         up_ma50_ind = INSUM(stk_list, q, ind=UP_MA50, mode=0)
+        self.check_cancelled()
         print(up_ma50_ind)
 
         cal = sm.get_trading_calendar(q)
@@ -190,14 +257,14 @@ class MA50Processor(BaseProcessor):
         result_df = pd.concat([cal_df, up_ma50_df], axis=1).rename(columns={'value0': 'value_f'})
         result_df['date_int'] = result_df['datetime'].dt.strftime('%Y%m%d').astype(int)
         print(result_df)
-
-        result_df.to_csv(temp_dir_path + "\\extdata_63.csv")
-        extdata_util.generate_file_dat(result_df, temp_dir_path + "\\extdata_63.dat")
-
-        return data, True
+        return {'extdata_63': result_df}
 
 
 class EndProcessor(BaseProcessor):
+    reads = ()
+    writes = ('stock_list',)
+    # 回补时执行一次，清空所有日期的股票列表
+    shared = True
 
     def process(self, data: any) -> (any, bool):
         self.logger.info(f"清理资源")
@@ -206,48 +273,85 @@ class EndProcessor(BaseProcessor):
 
 
 class CopyResourceProcessor(BaseProcessor):
+    reads = ('temp_dir_path',)
+    writes = ()
+    idempotent = True
+
+    def _source_files(self):
+        """需要复制的文件：info文件、工作TDX目录下所有idx文件和copy_ranges中的dat文件"""
+        work_tdx_path = self.get_work_tdx_path()
+        paths = [self.get_info_file_path()]
+        paths += [os.path.join(work_tdx_path, f) for f in sorted(os.listdir(work_tdx_path)) if f.endswith('.idx')]
+        copy_ranges = self.get_copy_ranges()
+        self.logger.debug(copy_ranges)
+        for range_ele in copy_ranges:
+            start, end = range_ele
+            paths += [os.path.join(work_tdx_path, f"extdata_{str(i)}.dat") for i in range(start, end + 1)]
+        return paths
 
     def process(self, data: any) -> (any, bool):
         self.logger.info(f"开始复制资源文件")
+        temp_dir_path = data['temp_dir_path']
+        options = (self.config.get("processors") or {}).get(self.__class__.__name__) or {}
 
         try:
-            # 从工作TDX目录复制新的info文件到临时目录
-            info_file_path = self.get_info_file_path()
-            temp_dir_path = data['temp_dir_path']
-
-            shutil.copy2(info_file_path, temp_dir_path)
-            self.logger.debug(f"复制[{info_file_path}]到[{temp_dir_path}]")
-
-            # 复制目录下所有后续名为idx的文件到临时目录
-            work_tdx_path = self.get_work_tdx_path()
-            idx_files = [f for f in os.listdir(work_tdx_path) if f.endswith('.idx')]
-            for file in idx_files:
-                file_path = os.path.join(work_tdx_path, file)
-                shutil.copy2(file_path, temp_dir_path)
-                self.logger.debug(f"复制[{file_path}]到[{temp_dir_path}]")
-
-
-            # 复制指定文件名的文件到临时目录
-            copy_ranges = self.get_copy_ranges()
-            self.logger.debug(copy_ranges)
-            for range_ele in copy_ranges:
-                start, end = range_ele
-                for i in range(start, end + 1):
-                    file_path = os.path.join(work_tdx_path, f"extdata_{str(i)}.dat")
-                    shutil.copy2(file_path, temp_dir_path)
-                    self.logger.debug(f"复制[{file_path}]到目录[{temp_dir_path}]")
-
-            # 复制剩余的指定序号的dat文件
+            paths = self._source_files()
         except FileNotFoundError as e:
             self.logger.error(f"目录不存在: {e.filename}")
-        except PermissionError as e:
-            self.logger.error(f"权限拒绝: {e.filename}")
-        except Exception as e:
-            self.logger.error(f"文件复制失败: {str(e)}")
+            return data, False
+
+        # 并发复制，先写临时文件再重命名；大小、修改时间一致的文件跳过
+        summary = extdata_util.stage_files(paths, temp_dir_path,
+                                           max_workers=options.get("max_workers", 8),
+                                           verify_hash=options.get("verify_hash", False),
+                                           check_cancelled=self.check_cancelled)
+        self.report_records(summary['copied'], key='files')
+        self.report_records(summary['bytes_copied'], key='bytes')
+        self.logger.info(f"复制{summary['copied']}个文件（{summary['bytes_copied'] / 1024 / 1024:.1f} MB），"
+                         f"跳过{summary['skipped']}个未变化的文件（{summary['bytes_skipped'] / 1024 / 1024:.1f} MB），"
+                         f"耗时{summary['seconds']:.2f}秒，{summary['throughput'] / 1024 / 1024:.1f} MB/s")
+        if summary['errors']:
+            self.logger.error(f"{len(summary['errors'])}个文件复制失败: {list(summary['errors'])}")
+            return data, False
+        return data, True
+
+
+def add_processors(workflow, config, logger):
+    """按日运行和回补使用相同的处理器"""
+    workflow.add_processor(Preprocessor(config, logger))
+    workflow.add_processor(TempDirProcessor(config, logger))
+    workflow.add_processor(StockListProcessor(config, logger))
+    # workflow.add_processor(CrowdednessProcessor(config, logger))
+    # workflow.add_processor(CrowdednessProcessor(config, logger))
+    # workflow.add_processor(MA50Processor(config, logger))
+    workflow.add_processor(NLNHProcessor(config, logger))
+
+    # workflow.add_processor(ApppendProcessor(config, logger))
+    # workflow.add_processor(CopyResourceProcessor(config, logger))
+    workflow.add_processor(EndProcessor(config, logger))
+
+
+def consolidate(workflow, days_data, output_dir):
+    """将各日期临时目录下的指标文件合并为一组文件，保存到output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    day_dirs = [days_data[day]['temp_dir_path'] for day in sorted(days_data)]
+    success = True
+    for processor in workflow.processors:
+        for name in getattr(processor, 'file_names', ()):
+            paths = [day_dir + "\\" + f"{name}.dat" for day_dir in day_dirs]
+            success &= extdata_util.merge_dat_files(paths, os.path.join(output_dir, f"{name}.dat"))
+    return success
 
 
 # 使用工作流框架
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true', help="保留临时目录，跳过输入未变化的处理器")
+    parser.add_argument('--start', type=int, help="回补开始日期，如20250801；指定后按交易日回补到--end")
+    parser.add_argument('--end', type=int, help="回补结束日期，默认为最近一个交易日")
+    parser.add_argument('--consolidate', help="回补完成后将各日期的指标文件合并到该目录")
+    args = parser.parse_args(argv)
+
     # 加载配置
     config = Config("ind_config.yaml")
 
@@ -258,21 +362,17 @@ def main():
         log_file=config.get("logging", {}).get("file")
     )
 
-    # 创建工作流
-    workflow = Workflow(config, logger)
+    if args.start:
+        # 回补：股票列表只加载一次，指标处理器一次计算所有日期，每个日期输出到各自的临时目录
+        calendar = get_calendar()
+        end = args.end or calendar.nearest(int(datetime.now().strftime("%Y%m%d")))
+        workflow = Backfill(config, logger, calendar.between(args.start, end), resume=args.resume)
+    else:
+        # 创建工作流，ind_config.yaml中scheduler为dag时，各指标处理器在StockListProcessor之后并行执行
+        workflow = Workflow(config, logger, resume=args.resume)
 
     # 添加处理器
-    workflow.add_processor(Preprocessor(config, logger))
-    workflow.add_processor(TempDirProcessor(config, logger))
-    workflow.add_processor(StockListProcessor(config, logger))
-    # workflow.add_processor(CrowdednessProcessor(config, logger))
-    # workflow.add_processor(CrowdednessProcessor(config, logger))
-    # workflow.add_processor(MA50Processor(config, logger))
-    workflow.add_processor(NLNHProcessor(config, logger))
-
-    # workflow.add_processor(ApppendProcessor(config, logger))
-    # workflow.add_processor(CopyResourceProcessor(config, logger))
-    workflow.add_processor(EndProcessor(config, logger))
+    add_processors(workflow, config, logger)
 
     try:
         # 初始化工作流
@@ -284,10 +384,13 @@ def main():
         # 输出结果
         logger.info(f"工作流执行结果: {result}")
 
+        if args.start and args.consolidate:
+            consolidate(workflow, result, args.consolidate)
+
     finally:
         # 清理工作流
         workflow.teardown()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
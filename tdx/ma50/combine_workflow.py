@@ -1,6 +1,6 @@
 # 使用绝对导入
+import argparse
 import os
-import shutil
 from doctest import debug
 
 import pandas as pd
@@ -12,17 +12,25 @@ from tdx.workflow import Config, WorkflowLogger, BaseProcessor, Workflow
 
 
 class TempDirProcessor(BaseProcessor):
+    reads = ('today_int',)
+    writes = ('temp_dir_path',)
+    idempotent = True
+
     def process(self, data: any) -> (any, bool):
         # 临时目录
         temp_extdata_path = self.get_temp_extdata_path()
         self.logger.info(f"合并数据临时目录：{temp_extdata_path}")
 
         # 使用当前日期在临时目录下新建文件夹，作为后面使用存放临时数据，如果目录存在，则清空
-        temp_dir_name = str(data[0])
+        temp_dir_name = str(data['today_int'])
         temp_dir_path = os.path.join(temp_extdata_path, temp_dir_name)
         try:
-            if os.path.exists(temp_dir_path):
-                temp_dir_files = os.listdir(temp_dir_path)
+            if os.path.exists(temp_dir_path) and self.resume:
+                # resume模式保留上次运行的中间结果和检查点
+                self.logger.info(f"继续使用临时目录：{temp_dir_path}")
+            elif os.path.exists(temp_dir_path):
+                temp_dir_files = [f for f in os.listdir(temp_dir_path)
+                                  if os.path.isfile(os.path.join(temp_dir_path, f))]
                 for file in temp_dir_files:
                     to_delete = os.path.join(temp_dir_path, file)
                     os.remove(to_delete)
@@ -32,17 +40,41 @@ class TempDirProcessor(BaseProcessor):
                 os.makedirs(temp_dir_path, exist_ok=True)
                 self.logger.info(f"创建临时目录：{temp_dir_path}")
 
-            return data + [temp_dir_path], True
+            data['temp_dir_path'] = temp_dir_path
+            return data, True
         except Exception as e:
             self.logger.error(f"清理临时目录失败：{e}")
             return data, False
 
 class ApppendProcessor(BaseProcessor):
+    reads = ('temp_dir_path',)
+    writes = ()
+    cacheable = True
+    idempotent = True
+
+    def _file_paths(self, temp_dir_path):
+        """(工作idx, 工作dat, 基础idx, 基础dat, 临时idx, 临时dat)"""
+        index = int(self.get_append_list()[0])
+        work_tdx_path = self.get_work_tdx_path()
+        tdx_base_path = self.get_tdx_base_path()
+        return (os.path.join(work_tdx_path, f"extdata_{index}.idx"),
+                os.path.join(work_tdx_path, f"extdata_{index}.dat"),
+                os.path.join(tdx_base_path, f"extdata_{index}.idx"),
+                os.path.join(tdx_base_path, f"extdata_{index}.dat"),
+                os.path.join(temp_dir_path, f"extdata_{index}.idx"),
+                os.path.join(temp_dir_path, f"extdata_{index}.dat"))
+
+    def input_files(self, data):
+        return list(self._file_paths(data['temp_dir_path'])[:4])
+
+    def output_files(self, data):
+        return list(self._file_paths(data['temp_dir_path'])[4:])
+
     def process(self, data):
 
         append_list = self.get_append_list()
         index = int(append_list[0])
-        temp_dir_path = data[5]
+        temp_dir_path = data['temp_dir_path']
         self.logger.info(f"开始追加数据到临时目录：{temp_dir_path}")
         work_tdx_path = self.get_work_tdx_path()
         tdx_base_path = self.get_tdx_base_path()
@@ -64,7 +96,8 @@ class ApppendProcessor(BaseProcessor):
         self.logger.debug(f"临时追加idx文件：{dest_idx_file_path}")
         self.logger.debug(f"临时追加dat文件：{dest_dat_file_path}")
 
-
+        # 合并统计：dat文件复制和重新编码的字节数
+        report = {}
         # extdata_util.process_incremental_update_files_optimized(
         #     old_idx_path=work_idx_file_path,
         #     old_dat_path=work_dat_file_path,
@@ -72,12 +105,32 @@ class ApppendProcessor(BaseProcessor):
         #     new_dat_path=base_dat_file_path,
         #     output_idx_path=dest_idx_file_path,
         #     output_dat_path=dest_dat_file_path,
+        #     report=report,
         # )
+        for key in ('copied_bytes', 'encoded_bytes'):
+            if key in report:
+                self.report_records(report[key], key=key)
+        return data, True
 
 
 class CombineProcessor(BaseProcessor):
+    reads = ('temp_dir_path',)
+    writes = ()
+    cacheable = True
+    idempotent = True
+
+    def input_files(self, data):
+        files = []
+        for flag_file, sum_file in self.get_flag_sum_mapping().items():
+            files.append(os.path.join(self.get_tdx_base_path(), flag_file))
+            files.append(os.path.join(self.get_work_tdx_path(), sum_file))
+        return files
+
+    def output_files(self, data):
+        return [os.path.join(data['temp_dir_path'], sum_file) for sum_file in self.get_flag_sum_mapping().values()]
+
     def process(self, data):
-        temp_dir_path = data[5]
+        temp_dir_path = data['temp_dir_path']
         self.logger.info(f"开始合并数据到临时目录：{temp_dir_path}")
 
         flag_sum_mapping = self.get_flag_sum_mapping()
@@ -85,6 +138,7 @@ class CombineProcessor(BaseProcessor):
 
         # 遍历flag_sum_mapping
         for flag_file, sum_file in flag_sum_mapping.items():
+            self.check_cancelled()
 
             flag_file_path = os.path.join(self.get_tdx_base_path(), flag_file)
             self.logger.debug(f"标记文件：{flag_file_path}")
@@ -107,7 +161,8 @@ class CombineProcessor(BaseProcessor):
             result_df.to_csv(os.path.join(temp_dir_path, sum_file + "_result.csv"))
 
             # self.logger.info(f"数据合并完毕，追加（覆盖）最后[{m}]天的数据，过程数据已输出csv文件")
-            # 待生成
+            # 待生成，超时或取消后不再写入临时目录
+            self.check_cancelled()
             res = extdata_util.generate_file_dat(result_df, os.path.join(temp_dir_path, sum_file))
             if res:
                 self.logger.info(f"数据{sum_file}合并完成")
@@ -118,48 +173,55 @@ class CombineProcessor(BaseProcessor):
 
 
 class CopyResourceProcessor(BaseProcessor):
+    reads = ('temp_dir_path',)
+    writes = ()
+    idempotent = True
+
+    def _source_files(self):
+        """需要复制的文件：info文件、工作TDX目录下所有idx文件和copy_ranges中的dat文件"""
+        work_tdx_path = self.get_work_tdx_path()
+        paths = [self.get_info_file_path()]
+        paths += [os.path.join(work_tdx_path, f) for f in sorted(os.listdir(work_tdx_path)) if f.endswith('.idx')]
+        copy_ranges = self.get_copy_ranges()
+        self.logger.debug(copy_ranges)
+        for range_ele in copy_ranges:
+            start, end = range_ele
+            paths += [os.path.join(work_tdx_path, f"extdata_{str(i)}.dat") for i in range(start, end + 1)]
+        return paths
 
     def process(self, data: any) -> (any, bool):
         self.logger.info(f"开始复制资源文件")
+        temp_dir_path = data['temp_dir_path']
+        options = (self.config.get("processors") or {}).get(self.__class__.__name__) or {}
 
         try:
-            # 从工作TDX目录复制新的info文件到临时目录
-            info_file_path = self.get_info_file_path()
-            temp_dir_path = data[5]
-
-            shutil.copy2(info_file_path, temp_dir_path)
-            self.logger.debug(f"复制[{info_file_path}]到[{temp_dir_path}]")
-
-            # 复制目录下所有后续名为idx的文件到临时目录
-            work_tdx_path = self.get_work_tdx_path()
-            idx_files = [f for f in os.listdir(work_tdx_path) if f.endswith('.idx')]
-            for file in idx_files:
-                file_path = os.path.join(work_tdx_path, file)
-                shutil.copy2(file_path, temp_dir_path)
-                self.logger.debug(f"复制[{file_path}]到[{temp_dir_path}]")
-
-
-            # 复制指定文件名的文件到临时目录
-            copy_ranges = self.get_copy_ranges()
-            self.logger.debug(copy_ranges)
-            for range_ele in copy_ranges:
-                start, end = range_ele
-                for i in range(start, end + 1):
-                    file_path = os.path.join(work_tdx_path, f"extdata_{str(i)}.dat")
-                    shutil.copy2(file_path, temp_dir_path)
-                    self.logger.debug(f"复制[{file_path}]到目录[{temp_dir_path}]")
-
-            # 复制剩余的指定序号的dat文件
+            paths = self._source_files()
         except FileNotFoundError as e:
             self.logger.error(f"目录不存在: {e.filename}")
-        except PermissionError as e:
-            self.logger.error(f"权限拒绝: {e.filename}")
-        except Exception as e:
-            self.logger.error(f"文件复制失败: {str(e)}")
+            return data, False
+
+        # 并发复制，先写临时文件再重命名；大小、修改时间一致的文件跳过
+        summary = extdata_util.stage_files(paths, temp_dir_path,
+                                           max_workers=options.get("max_workers", 8),
+                                           verify_hash=options.get("verify_hash", False),
+                                           check_cancelled=self.check_cancelled)
+        self.report_records(summary['copied'], key='files')
+        self.report_records(summary['bytes_copied'], key='bytes')
+        self.logger.info(f"复制{summary['copied']}个文件（{summary['bytes_copied'] / 1024 / 1024:.1f} MB），"
+                         f"跳过{summary['skipped']}个未变化的文件（{summary['bytes_skipped'] / 1024 / 1024:.1f} MB），"
+                         f"耗时{summary['seconds']:.2f}秒，{summary['throughput'] / 1024 / 1024:.1f} MB/s")
+        if summary['errors']:
+            self.logger.error(f"{len(summary['errors'])}个文件复制失败: {list(summary['errors'])}")
+            return data, False
+        return data, True
 
 
 # 使用工作流框架
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true', help="保留临时目录，跳过输入未变化的处理器")
+    args = parser.parse_args(argv)
+
     # 加载配置
     config = Config("ma50_config.yaml")
 
@@ -171,7 +233,7 @@ def main():
     )
 
     # 创建工作流
-    workflow = Workflow(config, logger)
+    workflow = Workflow(config, logger, resume=args.resume)
 
     # 添加处理器
     workflow.add_processor(Preprocessor(config, logger))
@@ -3,12 +3,24 @@ import os
 import shutil
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
 from tdx.extdata_util import parse_file_idx
 from tdx.ma50.preprocessor import Preprocessor
 from tdx.workflow import Config, WorkflowLogger, BaseProcessor, Workflow
 from tdx import extdata_util, api_utils
+from tdx.trade_calendar import shift_trading_days
+
+
+# 各组指标统计的交易日数（包含当天往前数）
+INFO_LOOKBACKS = [
+    (['个股月多标记', '板块月多标记'], 300),
+    (['上MA50标记', '全A数量标记', '新高标记', '新低标记'], 100),
+    (['二阶段标记'], 300),
+    (['BS个股', '动量股_D', '趋势股_D', '慢牛股_D', '动量股_W', '趋势股_W',
+      '慢牛股_W', '动量股_M', '趋势股_M', '慢牛股_M'], 300),
+]
 
 
 class PeriodProcessor(BaseProcessor):
@@ -19,41 +31,21 @@ class PeriodProcessor(BaseProcessor):
         info_file_path = self.get_info_file_path()
         self.logger.debug(f"info文件路径：{info_file_path}")
         # 1.第一步，批量修改统计时间
-        last_trading_day_int = data[1]
-        pre_100_day_int = data[2]
-        pre_300_day_int = data[3]
-
-        # 读取检查
-        records = extdata_util.parse_file_info(info_file_path)
-        info_df = pd.DataFrame(records)
-        # 增加自然序号index列
-        info_df['index'] = range(0, len(info_df))
-        # 计算name列与index列的映射
-        name_index_map = dict(zip(info_df['name'], info_df['index']))
-
-        # 300天
-        index_list = self.get_index_list(name_index_map, ['个股月多标记', '板块月多标记'])
-        extdata_util.write_file_info_batch(info_file_path, index_list, 0xA0, '<bII',
-                                           [1, pre_300_day_int, last_trading_day_int])
-        # 100天
-        index_list = self.get_index_list(name_index_map, ['上MA50标记', '全A数量标记', '新高标记', '新低标记'])
-        extdata_util.write_file_info_batch(info_file_path, index_list, 0xA0, '<bII',
-                                           [1, pre_100_day_int, last_trading_day_int])
-
-        index_list = self.get_index_list(name_index_map, ['二阶段标记'])
-        extdata_util.write_file_info_batch(info_file_path, index_list, 0xA0, '<bII',
-                                           [1, pre_300_day_int, last_trading_day_int])
-
-        index_list = self.get_index_list(name_index_map,
-                                         ['BS个股', '动量股_D', '趋势股_D', '慢牛股_D', '动量股_W', '趋势股_W',
-                                          '慢牛股_W', '动量股_M','趋势股_M', '慢牛股_M'])
-
-        extdata_util.write_file_info_batch(info_file_path, index_list, 0xA0, '<bII',
-                                           [1, pre_300_day_int, last_trading_day_int])
-
-        # 读取检查
-        records = extdata_util.parse_file_info(info_file_path)
-        df = pd.DataFrame(records)
+        today_int = data['today_int']
+        last_trading_day_int = data['last_trading_day_int']
+        # 所有分组的起始日期一次计算
+        lookbacks = np.array([lookback for _, lookback in INFO_LOOKBACKS])
+        date_starts = shift_trading_days(today_int, 1 - lookbacks).tolist()
+        pre_300_day_int = date_starts[0]
+
+        with extdata_util.ExtDataInfo(info_file_path) as info:
+            for (names, _), date_start in zip(INFO_LOOKBACKS, date_starts):
+                info.stage(info.index_of(names), period=1, date_start=date_start, date_end=last_trading_day_int)
+
+            # 一次性写入并从缓冲区校验
+            flushed = info.flush()
+            df = info.to_frame()
+
         # 文件名增加时间戳
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         df.to_csv(os.path.join(self.get_temp_extdata_path(), f"base_extdata_info_{timestamp}.csv"), index=False)
@@ -61,7 +53,7 @@ class PeriodProcessor(BaseProcessor):
         # 读取df首行数据['seq']的值
         # 检查df列
         after_date_start = df[df['seq'] == 11].iloc[0]['date_start']
-        if after_date_start == pre_300_day_int:
+        if flushed and after_date_start == pre_300_day_int:
             self.logger.info("更新info文件周期成功")
             # 实际的数据加载逻辑
             return data, True
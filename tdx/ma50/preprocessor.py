@@ -1,32 +1,61 @@
 # 使用绝对导入
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
-from tdx import extdata_util, api_utils
+from tdx import extdata_util
+from tdx.trade_calendar import INVALID_DATE, get_calendar, int_to_str
 from tdx.workflow import BaseProcessor
 
 
 class Preprocessor(BaseProcessor):
-    def process(self, data):
-        self.logger.info("开始前置处理，对齐日期...")
-        #
-        today = datetime.now().strftime("%Y-%m-%d")
-        today_int = int(datetime.now().strftime("%Y%m%d"))
-        last_trading_day = api_utils.APIUtils.get_nearest_trade_date(today)
-        last_trading_day_int = int(last_trading_day.replace("-", ""))
-        pre_100_day = api_utils.APIUtils.get_n_days_before(today, 100)
-        pre_100_day_int = int(pre_100_day.replace("-", ""))
-        pre_300_day = api_utils.APIUtils.get_n_days_before(today, 300)
-        pre_300_day_int = int(pre_300_day.replace("-", ""))
-        self.logger.debug(f"当前日期:{today}, 最近一个交易日{last_trading_day}，往前第100个交易日:{pre_100_day}，往前第300个交易日:{pre_300_day}")
+    reads = ()
+    writes = ('today_int', 'last_trading_day_int', 'pre_100_day_int', 'pre_300_day_int', 'max_date_int')
+    idempotent = True
 
-        # 检查完整配置info文件的最新更新日期
+    def _read_max_date_int(self) -> int:
+        """完整配置info文件的最新更新日期"""
         self.logger.debug(self.get_info_file_path())
         idx_list = extdata_util.parse_file_info(self.get_info_file_path())
         idx_df = pd.DataFrame(idx_list)
         # 输出 date_int列最大值
-        max_date_int = idx_df['date_int'].max()
+        return int(idx_df['date_int'].max())
+
+    @staticmethod
+    def _align_dates(today_ints) -> tuple:
+        """对齐日期：最近一个交易日、往前第100、300个交易日（包含当天），today_ints可以是数组"""
+        calendar = get_calendar()
+        today_ints = np.asarray(today_ints, dtype=np.int64)
+        last_trading_day_ints = calendar.snap(today_ints)
+        pre_days = calendar.shift(today_ints[..., np.newaxis], 1 - np.array([100, 300]))
+        return last_trading_day_ints, pre_days[..., 0], pre_days[..., 1]
+
+    @staticmethod
+    def _invalid_days(days, aligned) -> list:
+        """对齐结果中任一日期为INVALID_DATE（超出交易日历范围）的日期"""
+        invalid = np.any(np.stack([np.asarray(values) == INVALID_DATE for values in aligned]), axis=0)
+        return np.asarray(days)[invalid].tolist()
+
+    def process(self, data):
+        self.logger.info("开始前置处理，对齐日期...")
+        # 回补时data中的target_date为目标日期，否则为当前日期
+        target_date = data.get('target_date') if isinstance(data, dict) else None
+        today_int = int(target_date) if target_date else int(datetime.now().strftime("%Y%m%d"))
+        today = int_to_str(today_int)
+        # 最近一个交易日、往前第100、300个交易日一次计算
+        aligned = self._align_dates(today_int)
+        if self._invalid_days([today_int], aligned):
+            self.logger.error(f"日期 {today} 超出交易日历范围，无法对齐最近一个交易日及往前第100、300个交易日")
+            return data, False
+        last_trading_day_int, pre_100_day_int, pre_300_day_int = (int(value) for value in aligned)
+        last_trading_day = int_to_str(last_trading_day_int)
+        pre_100_day = int_to_str(pre_100_day_int)
+        pre_300_day = int_to_str(pre_300_day_int)
+        self.logger.debug(f"当前日期:{today}, 最近一个交易日{last_trading_day}，往前第100个交易日:{pre_100_day}，往前第300个交易日:{pre_300_day}")
+
+        # 检查完整配置info文件的最新更新日期
+        max_date_int = self._read_max_date_int()
         self.logger.debug(f"完整配置的info文件最新日期：[{max_date_int}]，当前日期[{today_int}]，最近一个交易日[{last_trading_day_int}]，前100[{pre_100_day_int}]，前300[{pre_300_day_int}]")
 
         # 检查是否需要更新
@@ -42,6 +71,27 @@ class Preprocessor(BaseProcessor):
             'last_trading_day_int': last_trading_day_int,
             'pre_100_day_int': pre_100_day_int,
             'pre_300_day_int': pre_300_day_int,
-            'max_date_int': int(max_date_int)
+            'max_date_int': max_date_int
         }
-        return data, True
\ No newline at end of file
+        return data, True
+
+    def process_range(self, days_data):
+        """回补时所有日期一次对齐，info文件只读取一次"""
+        days = sorted(days_data)
+        self.logger.info(f"开始前置处理，对齐 {len(days)} 个日期...")
+        aligned = self._align_dates(days)
+        invalid_days = self._invalid_days(days, aligned)
+        if invalid_days:
+            self.logger.error(f"日期 {invalid_days} 超出交易日历范围，无法对齐最近一个交易日及往前第100、300个交易日")
+            return days_data, False
+        last_trading_day_ints, pre_100_day_ints, pre_300_day_ints = aligned
+        max_date_int = self._read_max_date_int()
+        for i, day in enumerate(days):
+            days_data[day].update({
+                'today_int': day,
+                'last_trading_day_int': int(last_trading_day_ints[i]),
+                'pre_100_day_int': int(pre_100_day_ints[i]),
+                'pre_300_day_int': int(pre_300_day_ints[i]),
+                'max_date_int': max_date_int
+            })
+        return days_data, True
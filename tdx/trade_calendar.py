@@ -0,0 +1,428 @@
+# 交易日历
+# 从tdx/trade_dates.txt一次性加载交易日，所有查询基于有序int32数组的二分查找
+
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 默认交易日文件，每行一个 YYYY-MM-DD
+DEFAULT_TRADE_DATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trade_dates.txt')
+
+DateLike = Union[str, int, date, datetime, pd.Timestamp, np.datetime64]
+
+
+def date_to_int(value: DateLike) -> int:
+    """
+    将日期转换为yyyymmdd整数
+
+    支持 'YYYY-MM-DD'、'YYYYMMDD' 字符串，yyyymmdd整数，date/datetime/pandas.Timestamp/numpy.datetime64
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str):
+        return int(value.replace('-', '')[:8])
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    if isinstance(value, (date, datetime)):
+        return value.year * 10000 + value.month * 100 + value.day
+    raise ValueError(f"不支持的日期格式: {value!r}")
+
+
+def int_to_str(value: int) -> str:
+    """yyyymmdd整数转换为 YYYY-MM-DD 字符串"""
+    value = int(value)
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+
+
+def ints_to_datetime64(values: np.ndarray) -> np.ndarray:
+    """yyyymmdd整数数组转换为datetime64[D]数组"""
+    values = np.asarray(values, dtype=np.int64)
+    years = (values // 10000 - 1970).astype('datetime64[Y]')
+    months = (years.astype('datetime64[M]') + (values // 100 % 100 - 1).astype('timedelta64[M]'))
+    return months.astype('datetime64[D]') + (values % 100 - 1).astype('timedelta64[D]')
+
+
+def datetime64_to_ints(values: np.ndarray) -> np.ndarray:
+    """datetime64数组转换为yyyymmdd整数数组"""
+    values = np.asarray(values, dtype='datetime64[D]')
+    months = values.astype('datetime64[M]')
+    years = values.astype('datetime64[Y]').astype(np.int64) + 1970
+    month_of_year = months.astype(np.int64) % 12 + 1
+    days = (values - months.astype('datetime64[D]')).astype(np.int64) + 1
+    return years * 10000 + month_of_year * 100 + days
+
+
+# 批量计算超出日历范围时的结果（datetime64输入时为NaT）
+INVALID_DATE = 0
+
+
+def as_date_ints(dates) -> Tuple[np.ndarray, bool]:
+    """
+    将日期（标量或数组）转换为int64 yyyymmdd数组
+
+    Returns:
+        (int64数组, 输入是否为datetime64)
+    """
+    values = np.asarray(dates)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return datetime64_to_ints(values), True
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.int64), False
+    if values.size == 0:
+        return values.astype(np.int64), False
+    return np.vectorize(date_to_int, otypes=[np.int64])(values), False
+
+
+class TradingCalendar:
+    """
+    交易日历
+
+    交易日文件只在首次使用或文件变化（大小、修改时间）时读取，保存为升序的int32 yyyymmdd数组，
+    最近交易日、前后偏移、区间等查询都通过np.searchsorted完成。
+
+    用法：
+        calendar = TradingCalendar.instance()
+        calendar.nearest(20250830)          # 20250829
+        calendar.offset(20250829, -1)       # 20250828
+        calendar.between(20250801, 20250831)
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, file_path: str = DEFAULT_TRADE_DATES_PATH, auto_reload: bool = True,
+                 refresher: Optional[Callable[[], Iterable[DateLike]]] = None):
+        """
+        Args:
+            file_path: 交易日文件路径
+            auto_reload: 查询前是否检查文件变化并重新加载
+            refresher: 获取最新交易日的函数（如AkshareRefresher、FileRefresher），None表示只使用本地文件
+        """
+        self.file_path = file_path
+        self.auto_reload = auto_reload
+        self.refresher = refresher
+        self.stamp_path = f"{file_path}.refreshed"
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._dates = np.empty(0, dtype=np.int32)
+        self._datetime64 = None
+        self._fingerprint = None
+        self._reload_hooks = []
+
+    @classmethod
+    def instance(cls, file_path: str = DEFAULT_TRADE_DATES_PATH) -> 'TradingCalendar':
+        """获取指定交易日文件的共享实例"""
+        key = os.path.abspath(file_path)
+        with cls._instances_lock:
+            calendar = cls._instances.get(key)
+            if calendar is None:
+                calendar = cls._instances[key] = cls(file_path)
+            return calendar
+
+    def _file_fingerprint(self):
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def add_reload_hook(self, hook) -> None:
+        """注册重新加载后的回调，参数为日历对象"""
+        self._reload_hooks.append(hook)
+
+    def reload_if_changed(self) -> bool:
+        """文件变化（或尚未加载）时重新加载，返回是否重新加载"""
+        fingerprint = self._file_fingerprint()
+        if fingerprint == self._fingerprint:
+            return False
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return False
+            self._dates = self._read_dates()
+            self._datetime64 = None
+            self._fingerprint = fingerprint
+        logger.info(f"加载交易日历: {self.file_path}，共 {len(self._dates)} 个交易日")
+        for hook in self._reload_hooks:
+            hook(self)
+        return True
+
+    def _read_dates(self) -> np.ndarray:
+        """读取交易日文件，返回去重排序后的int32数组"""
+        try:
+            with open(self.file_path, 'r') as f:
+                lines = [line.strip() for line in f if line.strip()]
+        except Exception as e:
+            logger.error(f"读取交易日文件错误: {self.file_path}, 错误: {e}")
+            return np.empty(0, dtype=np.int32)
+        dates = datetime64_to_ints(np.array(lines, dtype='datetime64[D]'))
+        return np.unique(dates).astype(np.int32)
+
+    @property
+    def dates(self) -> np.ndarray:
+        """升序的交易日数组（int32 yyyymmdd）"""
+        if self.auto_reload or self._fingerprint is None:
+            self.reload_if_changed()
+        return self._dates
+
+    @property
+    def datetime64(self) -> np.ndarray:
+        """交易日的datetime64[D]视图"""
+        dates = self.dates
+        if self._datetime64 is None or len(self._datetime64) != len(dates):
+            self._datetime64 = ints_to_datetime64(dates)
+        return self._datetime64
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __contains__(self, value: DateLike) -> bool:
+        return self.is_trading_day(value)
+
+    def is_trading_day(self, value: DateLike) -> bool:
+        """是否为交易日"""
+        dates = self.dates
+        target = date_to_int(value)
+        pos = int(np.searchsorted(dates, target))
+        return pos < len(dates) and dates[pos] == target
+
+    def nearest(self, value: DateLike) -> Optional[int]:
+        """
+        最近一个交易日（包含当天）
+
+        Returns:
+            小于等于value的最后一个交易日；value晚于日历末尾时返回最后一个交易日；早于日历开始时返回None
+        """
+        dates = self.dates
+        pos = int(np.searchsorted(dates, date_to_int(value), side='right')) - 1
+        return int(dates[pos]) if pos >= 0 else None
+
+    def offset(self, value: DateLike, n: int) -> Optional[int]:
+        """
+        从value往后（n>0）或往前（n<0）第n个交易日，value不是交易日时以其后的第一个交易日为起点
+
+        Returns:
+            交易日，超出日历范围时返回None
+        """
+        dates = self.dates
+        target = int(np.searchsorted(dates, date_to_int(value))) + n
+        if target < 0 or target >= len(dates):
+            return None
+        return int(dates[target])
+
+    def n_days_before(self, value: DateLike, n: int) -> Optional[int]:
+        """
+        包含value所在位置在内往前数第n个交易日（n=1为value本身或其后的第一个交易日）
+
+        Returns:
+            交易日，超出日历范围时返回None
+        """
+        return self.offset(value, 1 - n)
+
+    def range(self, start: DateLike, n: int) -> np.ndarray:
+        """
+        从start开始的n个交易日（n>0，包含start），或start之前的-n个交易日（n<0，不包含start）
+
+        start不是交易日时以其后的第一个交易日为起点；start晚于日历末尾时返回空数组
+        """
+        dates = self.dates
+        start_index = int(np.searchsorted(dates, date_to_int(start)))
+        if start_index == len(dates):
+            return dates[:0]
+        if n >= 0:
+            return dates[start_index:start_index + n]
+        start_index = max(0, start_index + n)
+        return dates[start_index:start_index - n]
+
+    def between(self, start: DateLike, end: DateLike) -> np.ndarray:
+        """start到end之间（含两端）的交易日"""
+        dates = self.dates
+        left = np.searchsorted(dates, date_to_int(start), side='left')
+        right = np.searchsorted(dates, date_to_int(end), side='right')
+        return dates[left:right]
+
+    def _take(self, dates: np.ndarray, positions: np.ndarray, as_datetime64: bool):
+        """按位置取交易日，越界位置为INVALID_DATE/NaT；标量输入返回标量"""
+        valid = (positions >= 0) & (positions < len(dates))
+        result = np.where(valid, dates[np.clip(positions, 0, max(len(dates) - 1, 0))] if len(dates) else 0,
+                          INVALID_DATE).astype(np.int64)
+        if as_datetime64:
+            result = np.where(valid, ints_to_datetime64(np.where(valid, result, 19700101)),
+                              np.datetime64('NaT', 'D'))
+        return result[()]
+
+    def snap(self, dates, side: str = 'backward'):
+        """
+        批量对齐到交易日
+
+        Args:
+            dates: yyyymmdd整数、datetime64或日期字符串（标量或数组）
+            side: 'backward' 取小于等于日期的最后一个交易日，'forward' 取大于等于日期的第一个交易日
+
+        Returns:
+            与输入形状相同的交易日数组（输入为datetime64时返回datetime64），超出日历范围时为INVALID_DATE/NaT
+        """
+        if side not in ('backward', 'forward'):
+            raise ValueError(f"side只能为backward或forward: {side}")
+        values, as_datetime64 = as_date_ints(dates)
+        trade_dates = self.dates
+        if side == 'backward':
+            positions = np.searchsorted(trade_dates, values, side='right') - 1
+        else:
+            positions = np.searchsorted(trade_dates, values, side='left')
+        return self._take(trade_dates, positions, as_datetime64)
+
+    def shift(self, dates, n):
+        """
+        批量偏移交易日，语义与offset相同：非交易日以其后的第一个交易日为起点
+
+        Args:
+            dates: yyyymmdd整数、datetime64或日期字符串（标量或数组）
+            n: 偏移的交易日数，标量或可与dates广播的数组，如 1 - np.array([100, 300]) 对应n_days_before的100、300
+
+        Returns:
+            广播后形状的交易日数组，超出日历范围时为INVALID_DATE/NaT
+        """
+        values, as_datetime64 = as_date_ints(dates)
+        trade_dates = self.dates
+        positions = np.searchsorted(trade_dates, values, side='left') + np.asarray(n, dtype=np.int64)
+        return self._take(trade_dates, positions, as_datetime64)
+
+    def count_between(self, start, end):
+        """
+        批量计算交易日数：满足 start < d <= end 的交易日个数，end早于start时为负数
+
+        start、end都是交易日时即两者在日历中的位置差，shift(start, count_between(start, end)) == end。
+        """
+        start_values, _ = as_date_ints(start)
+        end_values, _ = as_date_ints(end)
+        trade_dates = self.dates
+        counts = (np.searchsorted(trade_dates, end_values, side='right')
+                  - np.searchsorted(trade_dates, start_values, side='right'))
+        return counts.astype(np.int64)[()]
+
+    def previous(self, value: DateLike) -> Optional[int]:
+        """value之前（不含value）的最后一个交易日，不存在时返回None"""
+        dates = self.dates
+        pos = int(np.searchsorted(dates, date_to_int(value), side='left')) - 1
+        return int(dates[pos]) if pos >= 0 else None
+
+    def last_refresh(self) -> Optional[int]:
+        """上次从refresher更新的日期（yyyymmdd），从未更新时返回None"""
+        try:
+            with open(self.stamp_path, 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        从refresher获取交易日并合并到本地文件，每天最多获取一次
+
+        新交易日与本地文件取并集后先写临时文件再原子替换；获取失败时保留本地文件。
+
+        Args:
+            force: 忽略当天已更新的标记
+
+        Returns:
+            本地文件是否有新增交易日
+        """
+        if self.refresher is None:
+            return False
+        today = date_to_int(date.today())
+        with self._refresh_lock:
+            if not force and self.last_refresh() == today:
+                return False
+            try:
+                fetched = np.array([date_to_int(value) for value in self.refresher()], dtype=np.int64)
+            except Exception as e:
+                logger.error(f"获取交易日历失败，继续使用本地文件: {e}")
+                return False
+
+            current = self._read_dates().astype(np.int64)
+            merged = np.union1d(current, fetched)
+            added = len(merged) - len(current)
+            if added:
+                self._write_atomic(self.file_path, '\n'.join(int_to_str(value) for value in merged) + '\n')
+                logger.info(f"交易日历新增 {added} 个交易日: {self.file_path}")
+            self._write_atomic(self.stamp_path, f"{today}\n")
+        self.reload_if_changed()
+        return added > 0
+
+    def ensure_covers(self, value: DateLike) -> bool:
+        """本地交易日未覆盖到value时尝试刷新，返回刷新后是否覆盖"""
+        dates = self.dates
+        target = date_to_int(value)
+        if len(dates) and dates[-1] >= target:
+            return True
+        self.refresh()
+        dates = self.dates
+        return bool(len(dates)) and dates[-1] >= target
+
+    @staticmethod
+    def _write_atomic(file_path: str, content: str) -> None:
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(content)
+            os.replace(temp_path, file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def to_str_list(dates: np.ndarray) -> List[str]:
+        """交易日数组转换为 YYYY-MM-DD 字符串列表"""
+        return [int_to_str(value) for value in np.asarray(dates).tolist()]
+
+
+class AkshareRefresher:
+    """从新浪获取全部历史交易日（akshare.tool_trade_date_hist_sina）"""
+
+    def __call__(self) -> List[int]:
+        import akshare as ak
+        trade_dates = ak.tool_trade_date_hist_sina()
+        return datetime64_to_ints(pd.to_datetime(trade_dates['trade_date']).to_numpy()).tolist()
+
+
+class FileRefresher:
+    """从另一个交易日文件（每行一个日期）获取交易日，用于测试和离线运行"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def __call__(self) -> List[int]:
+        with open(self.file_path, 'r') as f:
+            return [date_to_int(line.strip()) for line in f if line.strip()]
+
+
+def default_refresher() -> Callable[[], Iterable[DateLike]]:
+    """环境变量TDX_TRADE_DATES_SOURCE指定文件时使用FileRefresher，否则使用akshare"""
+    source = os.environ.get('TDX_TRADE_DATES_SOURCE')
+    return FileRefresher(source) if source else AkshareRefresher()
+
+
+def get_calendar() -> TradingCalendar:
+    """默认交易日文件的共享日历"""
+    return TradingCalendar.instance()
+
+
+def shift_trading_days(dates, n, calendar: Optional[TradingCalendar] = None):
+    """批量偏移交易日，见TradingCalendar.shift，默认使用共享日历"""
+    return (calendar or get_calendar()).shift(dates, n)
+
+
+def trading_days_between(start, end, calendar: Optional[TradingCalendar] = None):
+    """批量计算start（不含）到end（含）之间的交易日数，见TradingCalendar.count_between"""
+    return (calendar or get_calendar()).count_between(start, end)
+
+
+def snap_to_trading_day(dates, side: str = 'backward', calendar: Optional[TradingCalendar] = None):
+    """批量对齐到交易日，见TradingCalendar.snap"""
+    return (calendar or get_calendar()).snap(dates, side)
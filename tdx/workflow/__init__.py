@@ -2,6 +2,11 @@ from .config import Config
 from .logger import WorkflowLogger
 from .processor import BaseProcessor
 from .workflow import Workflow
+from .backfill import Backfill
+from .instrument import RunReport, compare_reports, load_report
+from .checkpoint import CheckpointStore
+from .errors import WorkflowError, ProcessorTimeout, WorkflowTimeout, WorkflowCancelled
 
 __version__ = "0.1.0"
-__all__ = ["Config", "WorkflowLogger", "BaseProcessor", "Workflow"]
\ No newline at end of file
+__all__ = ["Config", "WorkflowLogger", "BaseProcessor", "Workflow", "Backfill", "RunReport", "compare_reports", "load_report",
+           "CheckpointStore", "WorkflowError", "ProcessorTimeout", "WorkflowTimeout", "WorkflowCancelled"]
\ No newline at end of file
@@ -0,0 +1,178 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import Config
+from .logger import WorkflowLogger
+from .processor import BaseProcessor
+from .instrument import measure
+from .workflow import Workflow, _start_daemon
+from .errors import WorkflowError, WorkflowTimeout
+
+
+def _unpack(result: Any) -> Tuple[Any, bool]:
+    """处理器返回值：(data, 继续标志)，只返回数据时视为继续"""
+    if isinstance(result, tuple) and len(result) == 2:
+        return result
+    return result, True
+
+
+class Backfill(Workflow):
+    """
+    多日回补
+
+    对一组交易日执行同一组处理器，每天的data为 initial_data + {'target_date': 日期}。处理器按回补方式分为：
+      - shared：shared=True 的处理器只执行一次（如加载股票列表），输出（声明的writes）合并到每天的data
+      - range：实现了process_range的处理器一次计算所有日期
+      - daily：其余处理器，连续的按日处理器合并为一段，每天一个任务，最多max_workers天同时执行；
+        每个处理器与Workflow一样经过重试、超时和取消检查（_run_with_retries），executor为process时在进程池中执行
+
+    某天的按日处理器返回False或重试后仍抛出异常时，该日期记入failed_days，后续阶段不再处理；
+    shared/range处理器失败、超时或取消时整个回补终止。运行报告中按日处理器的名称为 处理器名@日期。
+
+    配置示例：
+        backfill:
+          executor: thread      # thread / process（处理器及data须可pickle）
+          max_workers: 4
+    """
+
+    def __init__(self, config: Config, logger: WorkflowLogger, dates: Sequence[int],
+                 max_workers: Optional[int] = None, executor: Optional[str] = None, resume: Optional[bool] = None):
+        backfill_config = config.get("backfill") or {}
+        super().__init__(config, logger, scheduler="linear",
+                         max_workers=max_workers or backfill_config.get("max_workers"),
+                         executor=executor or backfill_config.get("executor", "thread"), resume=resume)
+        self.name = f"{self.name}_backfill"
+        self.dates = sorted(int(day) for day in dates)
+        self.failed_days: Dict[int, str] = {}
+
+    def stages(self) -> List[Tuple[str, List[int]]]:
+        """按回补方式划分的阶段 [(shared / range / daily, 处理器序号列表)]"""
+        stages: List[Tuple[str, List[int]]] = []
+        for i, processor in enumerate(self.processors):
+            kind = 'shared' if processor.shared else 'range' if processor.supports_range else 'daily'
+            if kind == 'daily' and stages and stages[-1][0] == 'daily':
+                stages[-1][1].append(i)
+            else:
+                stages.append((kind, [i]))
+        return stages
+
+    def execute(self, initial_data: Any = None) -> Dict[int, Any]:
+        """执行回补，返回 日期 -> data（不含失败的日期）"""
+        self.logger.info(f"开始回补 {len(self.dates)} 个交易日"
+                         f"{f'：{self.dates[0]} ~ {self.dates[-1]}' if self.dates else ''}")
+        self.context['start_time'] = self.get_current_time()
+        names = self._start_run()
+        self.failed_days = {}
+        days_data = {day: dict(initial_data or {}, target_date=day) for day in self.dates}
+        status = 'failed'
+        try:
+            for kind, indexes in self.stages():
+                self._check_cancelled(names[indexes[0]])
+                if not days_data:
+                    break
+                if kind == 'daily':
+                    days_data = self._run_daily(indexes, names, days_data)
+                    continue
+                processor, name = self.processors[indexes[0]], names[indexes[0]]
+                self.logger.info(f"执行处理器 {name}（{kind}）")
+                try:
+                    if kind == 'shared':
+                        days_data, continue_flag = self._run_shared(processor, name, days_data)
+                    else:
+                        with measure(name, self.instrument, processor) as metrics:
+                            days_data, continue_flag = processor.process_range(days_data)
+                        self.run_report.add(metrics)
+                except Exception as e:
+                    self._record_failure(name, e, processor)
+                    raise
+                if not continue_flag:
+                    self.logger.info(f"处理器 {name} 中断回补")
+                    self.failed_days.update({day: name for day in days_data})
+                    days_data = {}
+
+            self.context['end_time'] = self.get_current_time()
+            self.context['duration'] = self.context['end_time'] - self.context['start_time']
+            self.logger.info(f"回补完成 {len(days_data)} 个交易日，失败 {len(self.failed_days)} 个，"
+                             f"耗时: {self.context['duration']} 秒")
+            status = 'completed' if not self.failed_days else 'interrupted'
+            return days_data
+        except Exception as e:
+            self.logger.error(f"回补执行失败: {e}")
+            status = self._failure_status(e)
+            if self.run_report.failure is None:
+                self._record_failure(None, e)
+            raise
+        finally:
+            self._finish_report(status)
+
+    def _run_shared(self, processor: BaseProcessor, name: str,
+                    days_data: Dict[int, Any]) -> Tuple[Dict[int, Any], bool]:
+        """以第一天的data执行一次，输出合并到每天的data"""
+        first = days_data[min(days_data)]
+        result, metrics = self._run_with_retries(processor, dict(first), name)
+        self.run_report.add(metrics)
+        data, continue_flag = _unpack(result)
+        if processor.writes is not None:
+            outputs = {key: data[key] for key in processor.writes if key in data}
+        else:
+            outputs = {key: value for key, value in data.items() if key != 'target_date'}
+        for day_data in days_data.values():
+            day_data.update(outputs)
+        return days_data, continue_flag
+
+    def _run_day(self, indexes: List[int], names: List[str], day: int, data: Any) -> Tuple[Any, Optional[str]]:
+        """依次执行一天的按日处理器，返回(data, 中断回补的处理器名称，未中断时为None)"""
+        for i in indexes:
+            name = f"{names[i]}@{day}"
+            result, metrics = self._run_with_retries(self.processors[i], data, name)
+            self.run_report.add(metrics)
+            data, continue_flag = _unpack(result)
+            if not continue_flag:
+                return data, name
+        return data, None
+
+    def _run_daily(self, indexes: List[int], names: List[str], days_data: Dict[int, Any]) -> Dict[int, Any]:
+        """一段按日处理器，每天一个任务，最多max_workers天同时执行"""
+        name = '+'.join(names[i] for i in indexes)
+        self.logger.info(f"按日执行处理器 {name}，{len(days_data)} 个交易日，执行器: {self.executor}")
+        if self.executor == "process":
+            self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        pending = list(days_data.items())
+        running = {}
+        results = {}
+        try:
+            while pending or running:
+                self._check_cancelled()
+                while pending and len(running) < self.max_workers:
+                    day, data = pending.pop(0)
+                    running[_start_daemon(self._run_day, indexes, names, day, data)] = day
+
+                done, _ = wait(running, timeout=self._remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    # 回补超时，正在执行的日期都未在剩余时间内完成
+                    raise WorkflowTimeout(self.timeout, f"{name}@{next(iter(running.values()))}")
+                for future in done:
+                    day = running.pop(future)
+                    try:
+                        data, stopped_by = future.result()
+                    except WorkflowError:
+                        raise
+                    except Exception as e:
+                        self.logger.error(f"交易日 {day} 执行处理器 {name} 失败: {e}")
+                        self.failed_days[day] = f"{name}: {e}"
+                        continue
+                    if stopped_by is None:
+                        results[day] = data
+                    else:
+                        self.logger.info(f"交易日 {day} 被处理器 {stopped_by} 中断")
+                        self.failed_days[day] = stopped_by
+        except Exception:
+            for future in running:
+                future.cancel()
+            self._cancel_event.set()
+            raise
+        finally:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+        return dict(sorted(results.items()))
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import pickle
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .processor import BaseProcessor
+
+# 检查点保存在data中该键对应的目录（按日期的临时目录）下
+CHECKPOINT_DIR_KEY = 'temp_dir_path'
+CHECKPOINT_SUBDIR = '.checkpoints'
+
+
+def file_fingerprint(path: str) -> Optional[List[int]]:
+    """文件指纹（大小、修改时间），文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def fingerprint_value(value: Any) -> str:
+    """data中输入值的指纹，值须可JSON序列化（repr无法反映对象内容，不作为指纹）"""
+    try:
+        content = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    except TypeError as e:
+        raise TypeError(f"检查点输入无法JSON序列化，处理器应在cache_inputs中返回可序列化的值: {e}") from e
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class CheckpointStore:
+    """
+    处理器输出的检查点
+
+    键由处理器类、cache_config()、cache_inputs()返回的data值和input_files()的文件指纹组成，
+    检查点保存写入的data值、继续标志和output_files()的文件指纹；恢复时输出文件须未被修改。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @classmethod
+    def for_data(cls, data: Any) -> Optional['CheckpointStore']:
+        """data中已有日期临时目录时返回该目录下的检查点存储"""
+        if not isinstance(data, dict) or not data.get(CHECKPOINT_DIR_KEY):
+            return None
+        return cls(os.path.join(data[CHECKPOINT_DIR_KEY], CHECKPOINT_SUBDIR))
+
+    @staticmethod
+    def key(processor: BaseProcessor, data: Dict[str, Any]) -> str:
+        processor_class = processor.__class__
+        content = {
+            'processor': f"{processor_class.__module__}.{processor_class.__qualname__}",
+            'config': processor.cache_config(),
+            'inputs': {key: fingerprint_value(value) for key, value in processor.cache_inputs(data).items()},
+            'files': {path: file_fingerprint(path) for path in processor.input_files(data)},
+        }
+        encoded = json.dumps(content, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+    def _path(self, processor: BaseProcessor, key: str) -> str:
+        return os.path.join(self.directory, f"{processor.__class__.__name__}_{key[:16]}.pkl")
+
+    def load(self, processor: BaseProcessor, key: str) -> Optional[Dict[str, Any]]:
+        """读取检查点，不存在、损坏或输出文件已变化时返回None"""
+        path = self._path(processor, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except Exception:
+            return None
+        if checkpoint.get('key') != key:
+            return None
+        for output_path, fingerprint in checkpoint.get('output_files', {}).items():
+            if file_fingerprint(output_path) != fingerprint:
+                return None
+        return checkpoint
+
+    def save(self, processor: BaseProcessor, key: str, result_data: Dict[str, Any], continue_flag: bool) -> str:
+        """原子写入检查点，返回文件路径"""
+        os.makedirs(self.directory, exist_ok=True)
+        checkpoint = {
+            'processor': processor.__class__.__name__,
+            'key': key,
+            'outputs': {name: result_data[name] for name in processor.writes or () if name in result_data},
+            'continue': continue_flag,
+            'output_files': {path: file_fingerprint(path) for path in processor.output_files(result_data)},
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
+        path = self._path(processor, key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump(checkpoint, f)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return path
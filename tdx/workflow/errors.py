@@ -0,0 +1,28 @@
+from typing import Optional
+
+
+class WorkflowError(Exception):
+    """工作流调度错误（超时、取消），不会被重试"""
+
+
+class ProcessorTimeout(WorkflowError):
+    """单个处理器执行超时"""
+
+    def __init__(self, processor: str, timeout: float):
+        super().__init__(f"处理器 {processor} 执行超过 {timeout} 秒")
+        self.processor = processor
+        self.timeout = timeout
+
+
+class WorkflowTimeout(WorkflowError):
+    """工作流总耗时超过workflow.timeout"""
+
+    def __init__(self, timeout: float, processor: Optional[str] = None):
+        where = f"，正在执行处理器 {processor}" if processor else ""
+        super().__init__(f"工作流执行超过 {timeout} 秒{where}")
+        self.processor = processor
+        self.timeout = timeout
+
+
+class WorkflowCancelled(WorkflowError):
+    """工作流被取消（Workflow.cancel或超时后处理器检查到取消标志）"""
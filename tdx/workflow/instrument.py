@@ -0,0 +1,237 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from .config import Config
+
+DEFAULT_THRESHOLD = 1.3
+
+
+def instrument_options(config: Config) -> Dict[str, Any]:
+    """
+    从YAML的workflow节读取统计选项
+
+        workflow:
+          instrument: true        # 记录每个处理器的耗时、内存、记录数，默认开启
+          tracemalloc: false      # 使用tracemalloc统计Python内存分配峰值（有额外开销）
+          profile: cprofile       # cprofile / pyinstrument，不配置时不采样
+          report_dir: "logs"      # 运行报告目录，默认为日志文件所在目录
+    """
+    workflow_config = config.get("workflow") or {}
+    log_file = (config.get("logging") or {}).get("file")
+    report_dir = workflow_config.get("report_dir")
+    if report_dir is None and log_file:
+        report_dir = os.path.dirname(os.path.abspath(log_file))
+    return {
+        'enabled': workflow_config.get("instrument", True),
+        'tracemalloc': workflow_config.get("tracemalloc", False),
+        'profile': workflow_config.get("profile"),
+        'report_dir': report_dir,
+    }
+
+
+def _max_rss_kb() -> Optional[float]:
+    """进程内存占用峰值（KB），平台不支持时返回None"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 if sys.platform == 'darwin' else float(max_rss)
+
+
+def _start_profiler(kind: Optional[str]):
+    if not kind:
+        return None
+    try:
+        if kind == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        if kind == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    except Exception:
+        # 未安装pyinstrument，或其他线程已经在采样
+        return None
+    raise ValueError(f"不支持的采样方式: {kind}")
+
+
+def _stop_profiler(profiler, kind: str, profile_dir: str, name: str) -> Optional[str]:
+    os.makedirs(profile_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if kind == 'cprofile':
+        profiler.disable()
+        path = os.path.join(profile_dir, f"{name}_{timestamp}.prof")
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = os.path.join(profile_dir, f"{name}_{timestamp}.html")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+    return path
+
+
+@contextmanager
+def measure(name: str, options: Dict[str, Any], processor=None):
+    """
+    统计一次处理器执行
+
+    产出的字典在退出时填充 wall（秒）、cpu（当前线程CPU秒）、rss_peak_delta_kb（进程内存峰值增量，
+    DAG并行时为整个进程）、tracemalloc_peak_kb、records（处理器通过report_records报告的记录数）、
+    status（ok / failed）和profile（采样文件路径）。
+    """
+    metrics: Dict[str, Any] = {'name': name}
+    if not options.get('enabled', True):
+        yield metrics
+        return
+
+    use_tracemalloc = options.get('tracemalloc', False)
+    if use_tracemalloc:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        traced_start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    profile_kind = options.get('profile')
+    profiler = _start_profiler(profile_kind)
+    rss_start = _max_rss_kb()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    metrics['status'] = 'failed'
+    try:
+        yield metrics
+        metrics['status'] = 'ok'
+    finally:
+        metrics['wall'] = time.perf_counter() - wall_start
+        metrics['cpu'] = time.thread_time() - cpu_start
+        rss_end = _max_rss_kb()
+        metrics['rss_peak_delta_kb'] = None if rss_start is None else rss_end - rss_start
+        if use_tracemalloc:
+            metrics['tracemalloc_peak_kb'] = (tracemalloc.get_traced_memory()[1] - traced_start) / 1024
+        if profiler is not None:
+            profile_dir = options.get('report_dir') or os.getcwd()
+            metrics['profile'] = _stop_profiler(profiler, profile_kind, profile_dir, name)
+        if processor is not None:
+            metrics['records'] = processor.pop_record_counts()
+            wall = metrics['wall']
+            metrics['throughput'] = {key: count / wall for key, count in metrics['records'].items() if wall > 0}
+
+
+class RunReport:
+    """一次工作流运行的统计报告，保存为JSON"""
+
+    def __init__(self, workflow_name: str, scheduler: str):
+        self.workflow_name = workflow_name
+        self.scheduler = scheduler
+        self.start_time = datetime.now()
+        self.status = 'running'
+        self.duration = None
+        self.processors: List[Dict[str, Any]] = []
+        # 失败时的结构化信息：processor、status、type、message、attempts、errors、retryable
+        self.failure: Optional[Dict[str, Any]] = None
+
+    def add(self, metrics: Dict[str, Any]) -> None:
+        self.processors.append(metrics)
+
+    def finish(self, status: str, duration: float) -> None:
+        self.status = status
+        self.duration = duration
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'workflow': self.workflow_name,
+            'scheduler': self.scheduler,
+            'start_time': self.start_time.isoformat(timespec='seconds'),
+            'status': self.status,
+            'duration': self.duration,
+            'processors': self.processors,
+            'failure': self.failure,
+        }
+
+    def save(self, report_dir: str) -> str:
+        """保存到report_dir，文件名包含工作流名称和开始时间，返回文件路径"""
+        os.makedirs(report_dir, exist_ok=True)
+        timestamp = self.start_time.strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(report_dir, f"{self.workflow_name}_run_{timestamp}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=str)
+        return path
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_reports(base: Dict[str, Any], current: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD,
+                    min_seconds: float = 0.01) -> Dict[str, Dict[str, Any]]:
+    """
+    比较两次运行报告中各处理器的耗时
+
+    Args:
+        base: 基准报告（load_report的结果）
+        current: 本次报告
+        threshold: 耗时超过 基准 × threshold 判定为regression，低于 基准 / threshold 判定为improved
+        min_seconds: 两次耗时都低于该值时不判定回退，避免计时噪声
+
+    Returns:
+        Dict: 处理器名 -> {'base', 'current', 'ratio', 'status', 'records'}，
+              status为 regression / improved / ok / new / removed
+    """
+    base_processors = {item['name']: item for item in base.get('processors', [])}
+    current_processors = {item['name']: item for item in current.get('processors', [])}
+    comparison = {}
+    for name, item in current_processors.items():
+        if name not in base_processors:
+            comparison[name] = {'current': item.get('wall'), 'status': 'new'}
+            continue
+        base_wall = base_processors[name].get('wall') or 0.0
+        current_wall = item.get('wall') or 0.0
+        ratio = current_wall / base_wall if base_wall > 0 else float('inf')
+        if max(base_wall, current_wall) < min_seconds:
+            status = 'ok'
+        elif ratio > threshold:
+            status = 'regression'
+        elif ratio < 1 / threshold:
+            status = 'improved'
+        else:
+            status = 'ok'
+        comparison[name] = {'base': base_wall, 'current': current_wall, 'ratio': ratio, 'status': status,
+                            'records': {'base': base_processors[name].get('records'),
+                                        'current': item.get('records')}}
+    for name, item in base_processors.items():
+        if name not in current_processors:
+            comparison[name] = {'base': item.get('wall'), 'status': 'removed'}
+    return comparison
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """python -m tdx.workflow.instrument base.json current.json [threshold]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print("用法: python -m tdx.workflow.instrument base.json current.json [threshold]")
+        return 2
+    threshold = float(argv[2]) if len(argv) > 2 else DEFAULT_THRESHOLD
+    comparison = compare_reports(load_report(argv[0]), load_report(argv[1]), threshold)
+    print(f"{'处理器':<40}{'基准(s)':>10}{'本次(s)':>10}{'倍数':>8}  状态")
+    for name, item in comparison.items():
+        base = f"{item['base']:.4f}" if item.get('base') is not None else '-'
+        current = f"{item['current']:.4f}" if item.get('current') is not None else '-'
+        ratio = f"{item['ratio']:.2f}" if 'ratio' in item else '-'
+        print(f"{name:<40}{base:>10}{current:>10}{ratio:>8}  {item['status']}")
+    return 1 if any(item['status'] == 'regression' for item in comparison.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,26 @@
 import os
 from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
 from .logger import WorkflowLogger
 from .config import Config
+from .errors import WorkflowCancelled
 
 
 class BaseProcessor(ABC):
+    # DAG模式下声明读取、写入的data键；为None时视为依赖前后所有处理器（按添加顺序串行）
+    reads: Optional[Tuple[str, ...]] = None
+    writes: Optional[Tuple[str, ...]] = None
+    # 是否保存检查点（需同时声明reads/writes），resume模式下输入未变化时跳过执行
+    cacheable: bool = False
+    # resume模式下由Workflow设置为True，处理器不应清理已有的中间结果
+    resume: bool = False
+    # 可安全重复执行的处理器失败后按workflow.max_retries重试
+    idempotent: bool = False
+    # 单次执行超时（秒），None时使用workflow.processor_timeout
+    timeout: Optional[float] = None
+    # 多日回补（Backfill）时只执行一次、输出共享给所有日期的处理器，如加载股票列表
+    shared: bool = False
+
     def __init__(self, config: Config, logger: WorkflowLogger):
         self.config = config
         self.logger = logger
@@ -24,6 +40,15 @@ class BaseProcessor(ABC):
         """
         pass
 
+    @property
+    def supports_range(self) -> bool:
+        """
+        是否实现了可选的多日回补方法 process_range(days_data) -> (days_data, 继续标志)
+
+        days_data为 交易日（yyyymmdd整数） -> 当天的data，一次计算所有日期；未实现时Backfill按日调用process
+        """
+        return callable(getattr(self, 'process_range', None))
+
     def setup(self):
         """初始化方法，可选实现"""
         pass
@@ -32,6 +57,60 @@ class BaseProcessor(ABC):
         """清理方法，可选实现"""
         pass
 
+    @property
+    def declared(self) -> bool:
+        """是否声明了读写的data键"""
+        return self.reads is not None or self.writes is not None
+
+    @property
+    def cancelled(self) -> bool:
+        """工作流是否已取消本处理器（超时或Workflow.cancel）"""
+        event = self.__dict__.get("_cancel_event")
+        return event is not None and event.is_set()
+
+    def check_cancelled(self):
+        """长时间运行的处理器应在循环中调用，已取消时抛出WorkflowCancelled"""
+        if self.cancelled:
+            raise WorkflowCancelled(f"处理器 {self.__class__.__name__} 已取消")
+
+    def __getstate__(self):
+        # 进程池执行时取消标志无法序列化
+        state = self.__dict__.copy()
+        state.pop("_cancel_event", None)
+        return state
+
+    def cache_config(self) -> Dict[str, Any]:
+        """参与检查点键计算的配置：path节和processors下与类名同名的节"""
+        return {
+            "path": self.config.get("path"),
+            "processor": (self.config.get("processors") or {}).get(self.__class__.__name__),
+        }
+
+    def cache_inputs(self, data: Any) -> Dict[str, Any]:
+        """
+        参与检查点键计算的data值，默认为声明读取的键
+
+        值须可JSON序列化；读取大对象（如hikyuu股票列表）的处理器应改为返回能代表其内容的简单值（如股票代码）
+        """
+        return {key: data.get(key) for key in self.reads or ()}
+
+    def input_files(self, data: Any) -> List[str]:
+        """参与检查点键计算的输入文件，文件指纹（大小、修改时间）变化时重新执行"""
+        return []
+
+    def output_files(self, data: Any) -> List[str]:
+        """处理器生成的文件，恢复检查点时须存在且未被修改"""
+        return []
+
+    def report_records(self, count: int, key: str = "records"):
+        """报告本次处理的记录数，写入运行报告并计算吞吐量（条/秒）；同一key多次报告时累加"""
+        counts = self.__dict__.setdefault("_record_counts", {})
+        counts[key] = counts.get(key, 0) + int(count)
+
+    def pop_record_counts(self) -> Dict[str, int]:
+        """取出并清空已报告的记录数"""
+        return self.__dict__.pop("_record_counts", {})
+
     def get_tdx_base_path(self):
         return self.config.get("path", {}).get("tdx_base_path")
 
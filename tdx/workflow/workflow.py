@@ -1,17 +1,110 @@
-from typing import List, Dict, Any, Tuple
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, TimeoutError, wait
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 from .logger import WorkflowLogger
 from .config import Config
 from .processor import BaseProcessor
+from .instrument import RunReport, instrument_options, measure
+from .checkpoint import CheckpointStore
+from .errors import ProcessorTimeout, WorkflowCancelled, WorkflowError, WorkflowTimeout
+
+
+def _run_processor(processor: BaseProcessor, data: Any, name: str, options: Dict[str, Any]) -> Tuple[Any, Dict]:
+    """在线程池或进程池中执行处理器并统计（进程池要求模块级函数），返回(处理器返回值, 统计)"""
+    with measure(name, options, processor) as metrics:
+        result = processor.process(data)
+    return result, metrics
+
+
+def _returned_false(result: Any) -> bool:
+    """处理器返回(data, False)"""
+    return isinstance(result, tuple) and len(result) == 2 and not result[1]
+
+
+def _start_daemon(func: Callable, *args) -> Future:
+    """在守护线程中执行，超时后放弃等待的线程不会阻止进程退出"""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
 
 
 class Workflow:
-    def __init__(self, config: Config, logger: WorkflowLogger):
+    """
+    工作流
+
+    默认按添加顺序依次执行处理器（linear）。配置 workflow.scheduler 为 dag 时，根据处理器声明的
+    reads/writes 建立依赖：读取某个键的处理器依赖之前写入该键的处理器，写入某个键的处理器依赖之前
+    读写该键的处理器，未声明读写的处理器依赖之前所有处理器且之后的处理器都依赖它。
+    没有依赖关系的处理器在线程池（或进程池）中并行执行。
+
+    配置示例：
+        workflow:
+          scheduler: dag        # linear / dag
+          max_workers: 4
+          executor: thread      # thread / process
+
+    每次执行都会记录各处理器的耗时、CPU时间、内存峰值增量和报告的记录数（见instrument.measure），
+    结果保存在run_report中，配置了日志文件或workflow.report_dir时写入JSON运行报告。
+
+    workflow.cache 为true（或resume模式）时，cacheable的处理器执行成功后在日期临时目录下保存检查点；
+    resume模式下检查点键（处理器类、配置、输入指纹）未变化且输出文件未被修改的处理器直接恢复结果，不再执行。
+
+    超时与重试：
+        workflow:
+          timeout: 3600             # 工作流总耗时上限（秒）
+          processor_timeout: 600    # 单个处理器默认超时，处理器的timeout属性优先
+          max_retries: 3            # idempotent处理器抛出异常或返回False后的重试次数
+          retry_backoff: 1.0        # 第n次重试前等待 retry_backoff × 2^(n-1) 秒
+
+    配置了超时的处理器在守护线程中执行，超时后设置处理器的取消标志（处理器通过check_cancelled协作退出），
+    工作流立即抛出ProcessorTimeout/WorkflowTimeout，不等待超时的线程；超时和取消不重试。
+    失败时运行报告的failure字段记录失败的处理器、错误类型、重试次数和是否可重新调度。
+    """
+
+    def __init__(self, config: Config, logger: WorkflowLogger, scheduler: Optional[str] = None,
+                 max_workers: Optional[int] = None, executor: Optional[str] = None, resume: Optional[bool] = None):
         self.config = config
         self.logger = logger
         self.processors: List[BaseProcessor] = []
         self.context: Dict[str, Any] = {}
         self.should_continue = True  # 控制是否继续执行的标志
 
+        workflow_config = config.get("workflow") or {}
+        self.scheduler = scheduler or workflow_config.get("scheduler", "linear")
+        self.max_workers = max_workers or workflow_config.get("max_workers", 4)
+        self.executor = executor or workflow_config.get("executor", "thread")
+        if self.scheduler not in ("linear", "dag"):
+            raise ValueError(f"不支持的调度方式: {self.scheduler}")
+        if self.executor not in ("thread", "process"):
+            raise ValueError(f"不支持的执行器: {self.executor}")
+
+        self.name = workflow_config.get("name") or self.logger.logger.name
+        self.instrument = instrument_options(config)
+        self.run_report: Optional[RunReport] = None
+        self.report_path: Optional[str] = None
+
+        self.resume = workflow_config.get("resume", False) if resume is None else resume
+        self.cache = self.resume or workflow_config.get("cache", False)
+
+        self.timeout = workflow_config.get("timeout")
+        self.processor_timeout = workflow_config.get("processor_timeout")
+        self.max_retries = workflow_config.get("max_retries", 0)
+        self.retry_backoff = workflow_config.get("retry_backoff", 1.0)
+        self._deadline: Optional[float] = None
+        self._cancel_event = threading.Event()
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._attempt_errors: Dict[str, List[str]] = {}
+
     def add_processor(self, processor: BaseProcessor):
         """添加处理器到工作流"""
         self.processors.append(processor)
@@ -27,27 +120,72 @@ class Workflow:
                 self.logger.error(f"处理器 {processor.__class__.__name__} 初始化失败: {e}")
                 raise
 
+    def build_dependencies(self) -> List[Set[int]]:
+        """根据处理器声明的读写键计算每个处理器依赖的（之前添加的）处理器序号"""
+        dependencies = []
+        for i, processor in enumerate(self.processors):
+            deps = set()
+            reads = set(processor.reads or ())
+            writes = set(processor.writes or ())
+            for j, previous in enumerate(self.processors[:i]):
+                if not processor.declared or not previous.declared:
+                    deps.add(j)
+                    continue
+                previous_reads = set(previous.reads or ())
+                previous_writes = set(previous.writes or ())
+                if reads & previous_writes or writes & previous_writes or writes & previous_reads:
+                    deps.add(j)
+            dependencies.append(deps)
+        return dependencies
+
+    def topological_levels(self) -> List[List[int]]:
+        """按依赖分层的处理器序号，同一层的处理器可以并行执行"""
+        dependencies = self.build_dependencies()
+        level_of = []
+        for deps in dependencies:
+            level_of.append(max((level_of[j] for j in deps), default=-1) + 1)
+        levels = [[] for _ in range(max(level_of, default=-1) + 1)]
+        for i, level in enumerate(level_of):
+            levels[level].append(i)
+        return levels
+
     def execute(self, initial_data: Any = None) -> Any:
         """执行工作流"""
+        if self.scheduler == "dag":
+            return self.execute_dag(initial_data)
+
         self.logger.info("开始执行工作流")
 
         # 初始化上下文
         data = initial_data
         self.context['start_time'] = self.get_current_time()
         self.should_continue = True  # 重置继续执行标志
+        names = self._start_run()
+        status = 'failed'
 
         try:
             # 依次执行所有处理器
             for i, processor in enumerate(self.processors):
+                self._check_cancelled(names[i])
                 if not self.should_continue:
                     self.logger.info(f"工作流被处理器 {i} 中断")
                     break
 
                 self.logger.info(f"执行处理器 {i + 1}/{len(self.processors)}: {processor.__class__.__name__}")
 
+                store, key, checkpoint = self._find_checkpoint(processor, data)
+                if checkpoint is not None:
+                    data, self.should_continue = self._restore_checkpoint(names[i], processor, data, checkpoint)
+                    continue
+
                 try:
                     # 执行处理器并获取返回值和继续标志
-                    result = processor.process(data)
+                    try:
+                        result, metrics = self._run_with_retries(processor, data, names[i])
+                    except Exception as e:
+                        self._record_failure(names[i], e, processor)
+                        raise
+                    self.run_report.add(metrics)
 
                     # 处理返回值
                     if isinstance(result, tuple) and len(result) == 2:
@@ -57,6 +195,7 @@ class Workflow:
                         # 向后兼容：如果处理器没有返回元组，只返回数据
                         data = result
                         self.should_continue = True
+                    self._save_checkpoint(store, key, processor, data, self.should_continue)
 
                     if self.should_continue:
                         self.logger.info(f"处理器 {processor.__class__.__name__} 执行成功，继续下一个处理器")
@@ -76,11 +215,324 @@ class Workflow:
             else:
                 self.logger.info(f"工作流被中断，耗时: {self.context['duration']} 秒")
 
+            status = 'completed' if self.should_continue else 'interrupted'
             return data
 
         except Exception as e:
             self.logger.error(f"工作流执行失败: {e}")
+            status = self._failure_status(e)
+            if self.run_report.failure is None:
+                self._record_failure(None, e)
             raise
+        finally:
+            self._finish_report(status)
+
+    def _start_run(self) -> List[str]:
+        """重置运行状态，返回处理器名称"""
+        self.run_report = RunReport(self.name, self.scheduler)
+        self._apply_resume_flag()
+        self._cancel_event = threading.Event()
+        self._deadline = self.context['start_time'] + self.timeout if self.timeout else None
+        self._attempt_errors = {}
+        for processor in self.processors:
+            processor._cancel_event = threading.Event()
+        return self.processor_names()
+
+    def cancel(self, reason: str = "") -> None:
+        """取消工作流：不再启动新的处理器，并设置所有处理器的取消标志"""
+        self.should_continue = False
+        self._cancel_event.set()
+        for processor in self.processors:
+            event = processor.__dict__.get("_cancel_event")
+            if event is not None:
+                event.set()
+        self.logger.warning(f"工作流被取消{('：' + reason) if reason else ''}")
+
+    def _remaining(self) -> Optional[float]:
+        return None if self._deadline is None else self._deadline - self.get_current_time()
+
+    def _check_cancelled(self, name: Optional[str] = None) -> None:
+        if self._cancel_event.is_set():
+            raise WorkflowCancelled("工作流已取消")
+        remaining = self._remaining()
+        if remaining is not None and remaining <= 0:
+            raise WorkflowTimeout(self.timeout, name)
+
+    def _attempt(self, processor: BaseProcessor, data: Any, name: str) -> Tuple[Any, Dict]:
+        """执行一次处理器，超过处理器超时或工作流剩余时间时抛出超时异常"""
+        processor_timeout = processor.timeout if processor.timeout is not None else self.processor_timeout
+        remaining = self._remaining()
+        limits = [limit for limit in (processor_timeout, remaining) if limit is not None]
+        timeout = min(limits) if limits else None
+
+        if self._process_pool is not None:
+            future = self._process_pool.submit(_run_processor, processor, data, name, self.instrument)
+        elif timeout is None:
+            return _run_processor(processor, data, name, self.instrument)
+        else:
+            future = _start_daemon(_run_processor, processor, data, name, self.instrument)
+
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            processor.__dict__.get("_cancel_event", threading.Event()).set()
+            if processor_timeout is not None and timeout == processor_timeout:
+                raise ProcessorTimeout(name, processor_timeout)
+            raise WorkflowTimeout(self.timeout, name)
+
+    def _run_with_retries(self, processor: BaseProcessor, data: Any, name: str) -> Tuple[Any, Dict]:
+        """
+        执行处理器，idempotent处理器失败后按指数退避重试（超时和取消不重试）
+
+        处理器通常自行捕获异常并返回(data, False)，因此idempotent处理器抛出异常或返回False都视为失败；
+        重试次数用完后异常继续抛出，返回False的结果原样返回（中断工作流）。
+        """
+        attempts = 1 + (self.max_retries if processor.idempotent else 0)
+        errors = self._attempt_errors.setdefault(name, [])
+        for attempt in range(1, attempts + 1):
+            self._check_cancelled(name)
+            try:
+                result, metrics = self._attempt(processor, data, name)
+            except WorkflowError:
+                raise
+            except Exception as e:
+                error = f"{e.__class__.__name__}: {e}"
+                errors.append(error)
+                if attempt == attempts:
+                    raise
+            else:
+                failed = _returned_false(result)
+                if failed:
+                    error = "返回False"
+                    errors.append(error)
+                if not failed or attempt == attempts:
+                    metrics['attempts'] = attempt
+                    if errors:
+                        metrics['errors'] = list(errors)
+                    return result, metrics
+            delay = self.retry_backoff * 2 ** (attempt - 1)
+            remaining = self._remaining()
+            if remaining is not None:
+                delay = min(delay, max(remaining, 0))
+            self.logger.warning(f"处理器 {name} 第{attempt}次执行失败: {error}，{delay:.1f} 秒后重试")
+            if self._cancel_event.wait(delay):
+                raise WorkflowCancelled("工作流已取消")
+
+    @staticmethod
+    def _failure_status(error: BaseException) -> str:
+        if isinstance(error, (ProcessorTimeout, WorkflowTimeout)):
+            return 'timeout'
+        if isinstance(error, WorkflowCancelled):
+            return 'cancelled'
+        return 'failed'
+
+    def _record_failure(self, name: Optional[str], error: BaseException,
+                        processor: Optional[BaseProcessor] = None) -> None:
+        """记录失败的处理器（name为None表示处理器之间的超时或取消），并取消其他正在执行的处理器"""
+        errors = self._attempt_errors.get(name, [])
+        status = self._failure_status(error)
+        if name is not None:
+            self.run_report.add({'name': name, 'status': status, 'error': str(error),
+                                 'attempts': max(len(errors), 1)})
+        if self.run_report.failure is None:
+            self.run_report.failure = {
+                'processor': name,
+                'status': status,
+                'type': error.__class__.__name__,
+                'message': str(error),
+                'attempts': max(len(errors), 1),
+                'errors': errors,
+                # 超时通常由外部资源（数据加载、文件锁）引起，可由调度系统稍后重新运行
+                'retryable': status == 'timeout' or (status == 'failed' and processor is not None
+                                                      and processor.idempotent),
+            }
+        for other in self.processors:
+            event = other.__dict__.get("_cancel_event")
+            if event is not None:
+                event.set()
+
+    def _apply_resume_flag(self) -> None:
+        for processor in self.processors:
+            processor.resume = self.resume
+
+    def _find_checkpoint(self, processor: BaseProcessor, data: Any) -> Tuple[Optional[CheckpointStore],
+                                                                            Optional[str], Optional[Dict]]:
+        """返回(检查点存储, 键, resume模式下可恢复的检查点)，处理器不可缓存或尚无日期临时目录时都为None"""
+        if not self.cache or not processor.cacheable or not processor.declared:
+            return None, None, None
+        store = CheckpointStore.for_data(data)
+        if store is None:
+            return None, None, None
+        key = store.key(processor, data)
+        checkpoint = store.load(processor, key) if self.resume else None
+        return store, key, checkpoint
+
+    def _restore_checkpoint(self, name: str, processor: BaseProcessor, data: Dict, checkpoint: Dict) -> Tuple[Any, bool]:
+        data.update(checkpoint['outputs'])
+        self.run_report.add({'name': name, 'status': 'cached', 'wall': 0.0, 'cpu': 0.0,
+                             'checkpoint': checkpoint['created']})
+        self.logger.info(f"处理器 {name} 输入未变化，从检查点（{checkpoint['created']}）恢复结果，跳过执行")
+        return data, checkpoint['continue']
+
+    def _save_checkpoint(self, store: Optional[CheckpointStore], key: Optional[str], processor: BaseProcessor,
+                         result_data: Any, continue_flag: bool) -> None:
+        if store is None or not continue_flag or not isinstance(result_data, dict):
+            return
+        try:
+            path = store.save(processor, key, result_data, continue_flag)
+            self.logger.debug(f"保存检查点: {path}")
+        except Exception as e:
+            self.logger.warning(f"保存处理器 {processor.__class__.__name__} 检查点失败: {e}")
+
+    def processor_names(self) -> List[str]:
+        """运行报告中的处理器名称：类名，重复的类名追加#序号"""
+        names = []
+        counts: Dict[str, int] = {}
+        for processor in self.processors:
+            class_name = processor.__class__.__name__
+            counts[class_name] = counts.get(class_name, 0) + 1
+            names.append(class_name if counts[class_name] == 1 else f"{class_name}#{counts[class_name]}")
+        return names
+
+    def _finish_report(self, status: str) -> None:
+        """记录运行状态，配置了报告目录时写入JSON运行报告"""
+        duration = self.get_current_time() - self.context['start_time']
+        self.run_report.finish(status, duration)
+        for metrics in sorted(self.run_report.processors, key=lambda item: item.get('wall') or 0, reverse=True):
+            if 'wall' in metrics:
+                self.logger.info(f"处理器 {metrics['name']} 耗时 {metrics['wall']:.3f} 秒，CPU {metrics['cpu']:.3f} 秒，"
+                                 f"记录数 {metrics.get('records') or {}}")
+        if not self.instrument.get('enabled', True) or not self.instrument.get('report_dir'):
+            return
+        try:
+            self.report_path = self.run_report.save(self.instrument['report_dir'])
+            self.logger.info(f"运行报告已保存到: {self.report_path}")
+        except Exception as e:
+            self.logger.warning(f"保存运行报告失败: {e}")
+
+    def _processor_name(self, index: int) -> str:
+        return f"{index + 1}:{self.processors[index].__class__.__name__}"
+
+    def execute_dag(self, initial_data: Any = None) -> Any:
+        """
+        按依赖关系并行执行工作流
+
+        data需为字典（None时使用空字典）。声明了读写的处理器得到data的浅拷贝，执行后只将writes中的键
+        合并回data；未声明读写的处理器单独执行，其返回值替换data（与linear模式一致）。
+        任一处理器返回False时不再启动新的处理器，等待正在执行的处理器结束后返回；抛出异常时取消未开始的处理器并抛出。
+        """
+        data = {} if initial_data is None else initial_data
+        dependencies = self.build_dependencies()
+        levels = self.topological_levels()
+        self.logger.info(f"开始执行工作流（DAG，{self.executor}，最大并行 {self.max_workers}），共 {len(levels)} 层: "
+                         f"{[[self._processor_name(i) for i in level] for level in levels]}")
+
+        self.context['start_time'] = self.get_current_time()
+        self.should_continue = True
+        names = self._start_run()
+
+        if self.executor == "process":
+            self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        pending = list(range(len(self.processors)))
+        finished: Set[int] = set()
+        running = {}
+        checkpoint_keys = {}
+        try:
+            try:
+                while pending or running:
+                    self._check_cancelled()
+                    if self.should_continue:
+                        restored = False
+                        for i in [i for i in pending if dependencies[i] <= finished]:
+                            processor = self.processors[i]
+                            if not processor.declared and running or len(running) >= self.max_workers:
+                                # 未声明读写的处理器等待正在执行的处理器结束后单独执行
+                                break
+                            pending.remove(i)
+                            store, key, checkpoint = self._find_checkpoint(processor, data)
+                            if checkpoint is not None:
+                                data, continue_flag = self._restore_checkpoint(names[i], processor, data, checkpoint)
+                                finished.add(i)
+                                restored = True
+                                if not continue_flag:
+                                    self.should_continue = False
+                                    break
+                                continue
+                            checkpoint_keys[i] = (store, key)
+                            node_data = dict(data) if processor.declared and isinstance(data, dict) else data
+                            self.logger.info(f"启动处理器 {self._processor_name(i)}")
+                            running[_start_daemon(self._run_with_retries, processor, node_data, names[i])] = i
+                            if not processor.declared:
+                                break
+                        if restored:
+                            # 恢复的处理器可能使后续处理器就绪
+                            continue
+                    elif pending:
+                        self.logger.info(f"工作流被中断，跳过处理器: {[self._processor_name(i) for i in pending]}")
+                        pending = []
+                    if not running:
+                        break
+
+                    done, _ = wait(running, timeout=self._remaining(), return_when=FIRST_COMPLETED)
+                    if not done:
+                        # 工作流超时，正在执行的处理器都未在剩余时间内完成
+                        i = next(iter(running.values()))
+                        error = WorkflowTimeout(self.timeout, names[i])
+                        self._record_failure(names[i], error, self.processors[i])
+                        raise error
+                    for future in done:
+                        i = running.pop(future)
+                        processor = self.processors[i]
+                        try:
+                            result, metrics = future.result()
+                        except Exception as e:
+                            self._record_failure(names[i], e, processor)
+                            self.logger.error(f"处理器 {self._processor_name(i)} 执行失败: {e}")
+                            raise
+                        self.run_report.add(metrics)
+
+                        if isinstance(result, tuple) and len(result) == 2:
+                            result_data, continue_flag = result
+                        else:
+                            result_data, continue_flag = result, True
+
+                        if not processor.declared:
+                            data = result_data
+                        elif isinstance(result_data, dict):
+                            for key in processor.writes or ():
+                                if key in result_data:
+                                    data[key] = result_data[key]
+                        self._save_checkpoint(*checkpoint_keys.pop(i, (None, None)), processor, result_data,
+                                              continue_flag)
+
+                        finished.add(i)
+                        if continue_flag:
+                            self.logger.info(f"处理器 {self._processor_name(i)} 执行成功")
+                        else:
+                            self.should_continue = False
+                            self.logger.info(f"处理器 {self._processor_name(i)} 执行成功，但中断工作流")
+            except Exception as e:
+                for future in running:
+                    future.cancel()
+                self.logger.error(f"工作流执行失败: {e}")
+                if self.run_report.failure is None:
+                    self._record_failure(None, e)
+                self._finish_report(self._failure_status(e))
+                raise
+        finally:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+
+        self.context['end_time'] = self.get_current_time()
+        self.context['duration'] = self.context['end_time'] - self.context['start_time']
+        if self.should_continue:
+            self.logger.info(f"工作流执行完成，耗时: {self.context['duration']} 秒")
+        else:
+            self.logger.info(f"工作流被中断，耗时: {self.context['duration']} 秒")
+        self._finish_report('completed' if self.should_continue else 'interrupted')
+        return data
 
     def teardown(self):
         """清理所有处理器"""
@@ -2,9 +2,21 @@ import unittest
 import tempfile
 import pandas as pd
 import os
+import shutil
+import struct
 from tdx.extdata_util import *
 
 
+def write_test_extdata(idx_path, dat_path, stock_records):
+    """用struct逐条写入测试用的idx/dat文件，stock_records为 代码->[(date_int, time_int, value_f)]"""
+    with open(idx_path, 'wb') as f_idx, open(dat_path, 'wb') as f_dat:
+        for stock_code, records in stock_records.items():
+            market_code = 1 if stock_code.startswith('6') else 0
+            f_idx.write(struct.pack('<H7s16xI', market_code, stock_code.encode('gb2312'), len(records)))
+            for record in records:
+                f_dat.write(struct.pack('<IIf', *record))
+
+
 class TestTdxDataUpdate(unittest.TestCase):
 
     def setUp(self):
@@ -149,5 +161,662 @@ class TestTdxDataUpdate(unittest.TestCase):
         self.assertEqual(updated_idx[updated_idx['stock_code'] == '000001']['record_count'].iloc[0], 5)
 
 
+class TestExtDataReader(unittest.TestCase):
+
+    def setUp(self):
+        """生成测试dat文件"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dat_path = os.path.join(self.temp_dir.name, "test.dat")
+        self.records = [(20230101 + i, 0, i * 0.5) for i in range(10)]
+        with open(self.dat_path, 'wb') as f:
+            for record in self.records:
+                f.write(struct.pack('<IIf', *record))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_read_dat_array(self):
+        """测试一次性读取整个dat文件"""
+        records = read_dat_array(self.dat_path)
+        self.assertEqual(records.dtype, DAT_DTYPE)
+        self.assertEqual(len(records), 10)
+        self.assertEqual(records['date_int'][-1], 20230110)
+        self.assertAlmostEqual(float(records['value_f'][3]), 1.5)
+
+    def test_read_dat_array_range(self):
+        """测试读取指定记录范围，超出文件的部分被截断"""
+        records = read_dat_array(self.dat_path, 8, 5)
+        self.assertEqual(records['date_int'].tolist(), [20230109, 20230110])
+
+    def test_parse_file_dat_compatible(self):
+        """测试字典列表接口与逐条struct解析结果一致"""
+        expected = [{'date_int': d, 'time_int': t, 'value_f': struct.unpack('<f', struct.pack('<f', v))[0]}
+                    for d, t, v in self.records]
+        self.assertEqual(parse_file_dat(self.dat_path), expected)
+        self.assertEqual(parse_file_dat2(self.dat_path, 2, 3), expected[2:5])
+
+    def test_read_dat_frame(self):
+        """测试DataFrame列类型"""
+        df = read_dat_frame(self.dat_path, 0, 4)
+        self.assertEqual(list(df.columns), ['date_int', 'time_int', 'value_f'])
+        self.assertEqual(df['date_int'].dtype, np.int64)
+        self.assertEqual(df['value_f'].dtype, np.float64)
+        self.assertEqual(len(df), 4)
+
+
+class TestExtDataStore(unittest.TestCase):
+
+    def setUp(self):
+        """生成测试idx/dat文件"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.idx_path = os.path.join(self.temp_dir.name, "test.idx")
+        self.dat_path = os.path.join(self.temp_dir.name, "test.dat")
+        self.stock_records = {
+            '000001': [(20230101, 0, 1.0), (20230102, 0, 2.0), (20230103, 0, 3.0)],
+            '600010': [(20230102, 0, 4.0), (20230103, 0, 5.0)],
+            '000003': [],
+            '300750': [(20230101, 0, 6.0)],
+        }
+        write_test_extdata(self.idx_path, self.dat_path, self.stock_records)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_getitem(self):
+        """测试按代码取数"""
+        with ExtDataStore(self.idx_path, self.dat_path) as store:
+            self.assertEqual(len(store), 4)
+            self.assertIn('600010', store)
+            self.assertNotIn('999999', store)
+            self.assertEqual(store['600010']['date_int'].tolist(), [20230102, 20230103])
+            self.assertEqual(store['300750']['value_f'].tolist(), [6.0])
+            self.assertEqual(len(store['000003']), 0)
+            self.assertIsNone(store.get('999999'))
+            with self.assertRaises(KeyError):
+                store['999999']
+
+    def test_align(self):
+        with ExtDataStore(self.idx_path, self.dat_path) as store:
+            aligned = store.align('600010', [20230101, 20230102, 20230103, 20230104])
+            self.assertEqual(aligned[1:3].tolist(), [4.0, 5.0])
+            self.assertTrue(np.isnan(aligned[[0, 3]]).all())
+            self.assertTrue(np.isnan(store.align('999999', [20230101])).all())
+            self.assertEqual(len(store.align('600010', [])), 0)
+
+    def test_align_market(self):
+        """沪深同名代码（如平安银行sz000001与上证指数sh000001）按市场代码区分"""
+        idx_path = os.path.join(self.temp_dir.name, "market.idx")
+        dat_path = os.path.join(self.temp_dir.name, "market.dat")
+        with open(idx_path, 'wb') as f_idx, open(dat_path, 'wb') as f_dat:
+            for market_code, value in ((MARKET_CODES['SZ'], 1.0), (MARKET_CODES['SH'], 2.0)):
+                f_idx.write(struct.pack('<H7s16xI', market_code, b'000001', 1))
+                f_dat.write(struct.pack('<IIf', 20230101, 0, value))
+        with ExtDataStore(idx_path, dat_path) as store:
+            self.assertEqual(store.align('000001', [20230101], market_code=MARKET_CODES['SZ']).tolist(), [1.0])
+            self.assertEqual(store.align('000001', [20230101], market_code=MARKET_CODES['SH']).tolist(), [2.0])
+            self.assertEqual(store.align('000001', [20230101]).tolist(), [1.0])
+            self.assertTrue(np.isnan(store.align('000001', [20230101], market_code=MARKET_CODES['BJ'])).all())
+
+    def test_load_dat_data(self):
+        """测试load_dat_data与逐只股票解析结果一致"""
+        idx_df = load_idx_data(self.idx_path)
+        stock_data = load_dat_data(self.dat_path, idx_df)
+        self.assertEqual(list(stock_data.keys()), list(self.stock_records.keys()))
+        self.assertTrue(stock_data['000003'].empty)
+        for stock_code, df in stock_data.items():
+            expected = parse_file_dat2(self.dat_path, int(idx_df.loc[idx_df['stock_code'] == stock_code, 'cum_sum'].iloc[0]),
+                                       len(self.stock_records[stock_code]))
+            self.assertEqual(df.to_dict('records'), expected)
+
+    def test_to_frame(self):
+        """测试长表加载"""
+        idx_df = load_idx_data(self.idx_path)
+        df = load_stock_data_frame(self.dat_path, idx_df)
+        self.assertEqual(len(df), 6)
+        self.assertIsInstance(df['stock_code'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['stock_code'].astype(str).tolist(),
+                         ['000001', '000001', '000001', '600010', '600010', '300750'])
+        self.assertEqual(df.groupby('stock_code', observed=True)['value_f'].sum().to_dict(),
+                         {'000001': 6.0, '300750': 6.0, '600010': 9.0})
+
+        df = load_stock_data_frame(self.dat_path, idx_df, {'600010', '999999'}, set_index=True)
+        self.assertEqual(df.index.names, ['stock_code', 'date_int'])
+        self.assertEqual(df.loc[('600010', 20230103), 'value_f'], 5.0)
+
+    def test_cross_section(self):
+        """测试截面查询与逐只股票筛选结果一致"""
+        with ExtDataStore(self.idx_path, self.dat_path) as store:
+            values = store.cross_section(20230103)
+            self.assertEqual(values.name, 20230103)
+            self.assertEqual(values.to_dict(), {'600010': 5.0, '000001': 3.0})
+            self.assertEqual(values.index.tolist(), ['600010', '000001'])
+            self.assertTrue(store.cross_section(20240101).empty)
+
+            many = store.cross_section([20230101, 20230102])
+            self.assertEqual(many.index.tolist(), [(20230101, '300750'), (20230101, '000001'),
+                                                   (20230102, '600010'), (20230102, '000001')])
+
+    def test_cross_section_date_index(self):
+        """测试持久化日期索引：结果一致，文件变化后自动重建"""
+        index_path = os.path.join(self.temp_dir.name, "test.date_idx.npz")
+        with ExtDataStore(self.idx_path, self.dat_path) as store:
+            date_index = ExtDataDateIndex.open(index_path, store)
+            self.assertTrue(os.path.exists(index_path))
+            for dates in (20230101, 20230103, [20230102, 20230103], 20240101):
+                pd.testing.assert_series_equal(store.cross_section(dates, date_index=date_index),
+                                               store.cross_section(dates))
+            self.assertIsNotNone(ExtDataDateIndex.load(index_path, store))
+
+        self.stock_records['600010'].append((20230104, 0, 7.0))
+        write_test_extdata(self.idx_path, self.dat_path, self.stock_records)
+        os.utime(self.dat_path, ns=(0, 0))
+        with ExtDataStore(self.idx_path, self.dat_path) as store:
+            self.assertIsNone(ExtDataDateIndex.load(index_path, store))
+            date_index = ExtDataDateIndex.open(index_path, store)
+            self.assertEqual(store.cross_section(20230104, date_index=date_index).to_dict(), {'600010': 7.0})
+
+
+class TestExtDataIndex(unittest.TestCase):
+
+    def setUp(self):
+        """生成测试idx/dat文件"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.idx_path = os.path.join(self.temp_dir.name, "test.idx")
+        self.dat_path = os.path.join(self.temp_dir.name, "test.dat")
+        self.stock_records = {
+            '600010': [(20230101, 0, 1.0), (20230102, 0, 2.0)],
+            '000001': [(20230101, 0, 3.0)],
+            '300750': [(20230101, 0, 4.0), (20230102, 0, 5.0), (20230103, 0, 6.0)],
+        }
+        write_test_extdata(self.idx_path, self.dat_path, self.stock_records)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_read_idx_array(self):
+        """测试结构化dtype与29字节记录一致"""
+        self.assertEqual(IDX_DTYPE.itemsize, IDX_RECORD_SIZE)
+        records = read_idx_array(self.idx_path)
+        self.assertEqual(records['record_count'].tolist(), [2, 1, 3])
+        self.assertEqual(records['market_code'].tolist(), [1, 0, 0])
+
+    def test_index(self):
+        """测试偏移表和二分查找"""
+        index = ExtDataIndex.from_file(self.idx_path)
+        self.assertEqual(index.stock_code.tolist(), ['600010', '000001', '300750'])
+        self.assertEqual(index.cum_sum.tolist(), [0, 2, 3])
+        self.assertEqual(index.lookup(['300750', '999999', '600010']).tolist(), [2, -1, 0])
+        self.assertEqual(index.find('000001'), 1)
+        self.assertEqual(index.find('000002'), -1)
+
+    def test_load_idx_data_compatible(self):
+        """测试load_idx_data与逐条解析结果一致"""
+        idx_df = load_idx_data(self.idx_path)
+        expected = pd.DataFrame(parse_binary_file(self.idx_path, IDX_RECORD_SIZE, '<H7s16xI', lambda i, p, r: {
+            'i': i, 'market_code': p[0], 'stock_code': p[1].decode('gb2312').rstrip('\x00'), 'record_count': p[2]}))
+        expected['cum_sum'] = expected['record_count'].cumsum().shift(1).fillna(0).astype(int)
+        pd.testing.assert_frame_equal(idx_df, expected, check_dtype=False)
+        self.assertEqual(parse_file_idx(self.idx_path), expected.drop(columns='cum_sum').to_dict('records'))
+
+    def test_load_stock_data_optimized(self):
+        """测试按代码集合加载"""
+        idx_df = load_idx_data(self.idx_path)
+        stock_data = load_stock_data_optimized(self.dat_path, idx_df, {'300750', '600010', '999999'})
+        self.assertEqual(sorted(stock_data.keys()), ['300750', '600010'])
+        self.assertEqual(stock_data['300750']['value_f'].tolist(), [4.0, 5.0, 6.0])
+
+
+class TestExtDataWriter(unittest.TestCase):
+    """批量写入与逐条struct写入的结果必须逐字节一致"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dat_data = {
+            '600010': pd.DataFrame({'date_int': [20230101, 20230102], 'time_int': [0, 0], 'value_f': [0.1, 2.5]}),
+            '000001': pd.DataFrame({'date_int': [20230101.0], 'value_f': [np.float32(-3.3)]}),
+            '000002': pd.DataFrame(),
+        }
+        self.idx_df = pd.DataFrame({
+            'market_code': [1, 0, 0],
+            'stock_code': ['600010', '000001', '000002'],
+            'record_count': [2, 1, 0],
+        })
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_generate_dat_file_identical(self):
+        """测试dat文件与逐条写入一致"""
+        expected = b''.join(
+            struct.pack('IIf', int(row['date_int']), int(row.get('time_int', 0)), float(row['value_f']))
+            for df in self.dat_data.values() for _, row in df.iterrows())
+        self.assertTrue(generate_dat_file(self.dat_data, self._path("test.dat")))
+        self.assertEqual(self._read(self._path("test.dat")), expected)
+
+    def test_generate_file_dat_identical(self):
+        """测试单个DataFrame写入与逐条写入一致"""
+        df = self.dat_data['600010']
+        expected = b''.join(struct.pack('IIf', d, t, v) for d, t, v in zip(df['date_int'], df['time_int'], df['value_f']))
+        self.assertTrue(generate_file_dat(df, self._path("single.dat")))
+        self.assertEqual(self._read(self._path("single.dat")), expected)
+
+    def test_merge_dat_files(self):
+        """测试合并多日dat文件，同一日期以后面的文件为准"""
+        first = pd.DataFrame({'date_int': [20230101, 20230102], 'value_f': [1.0, 2.0]})
+        second = pd.DataFrame({'date_int': [20230102, 20230103], 'value_f': [2.5, 3.0]})
+        generate_file_dat(first, self._path("d1.dat"))
+        generate_file_dat(second, self._path("d2.dat"))
+        paths = [self._path("d1.dat"), self._path("d2.dat"), self._path("missing.dat")]
+        self.assertTrue(merge_dat_files(paths, self._path("merged.dat")))
+        merged = read_dat_frame(self._path("merged.dat"))
+        self.assertEqual(merged['date_int'].tolist(), [20230101, 20230102, 20230103])
+        self.assertEqual(merged['value_f'].tolist(), [1.0, 2.5, 3.0])
+        self.assertFalse(merge_dat_files([self._path("missing.dat")], self._path("none.dat")))
+
+    def test_generate_idx_file_identical(self):
+        """测试idx文件与逐条写入一致，并可被重新解析"""
+        expected = b''.join(
+            struct.pack('<H7s16xI', row['market_code'], row['stock_code'].encode('gb2312').ljust(7, b'\x00'),
+                        row['record_count'])
+            for _, row in self.idx_df.iterrows())
+        self.assertTrue(generate_idx_file(self.idx_df, self._path("test.idx")))
+        self.assertEqual(self._read(self._path("test.idx")), expected)
+        self.assertEqual(load_idx_data(self._path("test.idx"))['cum_sum'].tolist(), [0, 2, 3])
+
+
+class TestStageFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.src_dir = os.path.join(self.temp_dir.name, "src")
+        self.dst_dir = os.path.join(self.temp_dir.name, "dst")
+        os.makedirs(self.src_dir)
+        self.paths = []
+        for i in range(5):
+            path = os.path.join(self.src_dir, f"extdata_{i}.dat")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(1000 * (i + 1)))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_cancelled(self):
+        """已取消时不再复制"""
+        def check_cancelled():
+            raise RuntimeError("cancelled")
+
+        with self.assertRaises(RuntimeError):
+            stage_files(self.paths, self.dst_dir, max_workers=2, check_cancelled=check_cancelled)
+        self.assertEqual(os.listdir(self.dst_dir), [])
+
+    def test_stage_and_skip(self):
+        """测试并发复制，未变化的文件第二次跳过"""
+        summary = stage_files(self.paths, self.dst_dir, max_workers=3)
+        self.assertEqual((summary['copied'], summary['skipped']), (5, 0))
+        self.assertEqual(summary['bytes_copied'], 15000)
+        for path in self.paths:
+            target = os.path.join(self.dst_dir, os.path.basename(path))
+            self.assertEqual(file_digest(target), file_digest(path))
+            self.assertEqual(os.stat(target).st_mtime_ns, os.stat(path).st_mtime_ns)
+        self.assertEqual(sorted(os.listdir(self.dst_dir)), sorted(os.path.basename(p) for p in self.paths))
+
+        summary = stage_files(self.paths, self.dst_dir)
+        self.assertEqual((summary['copied'], summary['skipped'], summary['bytes_skipped']), (0, 5, 15000))
+
+    def test_changed_file(self):
+        """测试大小、修改时间一致时默认跳过，verify_hash时比较sha1后重新复制内容不同的文件"""
+        stage_files(self.paths, self.dst_dir)
+        target = os.path.join(self.dst_dir, os.path.basename(self.paths[0]))
+        stat = os.stat(target)
+        with open(target, 'r+b') as f:
+            f.write(b'\x00' * 10)
+        os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertTrue(stage_file(self.paths[0], self.dst_dir)['skipped'])
+        self.assertEqual(stage_files(self.paths, self.dst_dir)['skipped'], 5)
+        summary = stage_files(self.paths, self.dst_dir, verify_hash=True)
+        self.assertEqual((summary['copied'], summary['skipped']), (1, 4))
+        self.assertEqual(file_digest(target), file_digest(self.paths[0]))
+
+    def test_missing_file(self):
+        """测试源文件不存在时记录错误，其余文件正常复制"""
+        missing = os.path.join(self.src_dir, "missing.dat")
+        summary = stage_files(self.paths + [missing], self.dst_dir)
+        self.assertEqual(summary['copied'], 5)
+        self.assertEqual(list(summary['errors']), [missing])
+
+
+class TestMergeExtDataBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.old_records = {}
+        self.new_records = {}
+        for i in range(30):
+            code = f"{600000 + i:06d}"
+            old_dates = 20200101 + np.sort(rng.choice(1000, size=rng.integers(0, 600), replace=False))
+            new_dates = 20200101 + np.sort(rng.choice(1100, size=rng.integers(1, 30), replace=False))
+            if i % 7 != 3:
+                self.old_records[code] = [(int(d), 0, float(rng.integers(100))) for d in old_dates]
+            if i % 5 != 2:
+                self.new_records[code] = [(int(d), 0, float(rng.integers(100, 200))) for d in new_dates]
+
+        self.paths = {name: os.path.join(self.temp_dir.name, name)
+                      for name in ('old.idx', 'old.dat', 'new.idx', 'new.dat', 'out.idx', 'out.dat')}
+        write_test_extdata(self.paths['old.idx'], self.paths['old.dat'], self.old_records)
+        write_test_extdata(self.paths['new.idx'], self.paths['new.dat'], self.new_records)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_bulk_merge_matches_per_stock(self):
+        """测试整文件合并与逐只股票合并（同日期以增量数据为准，保留最新500条）结果一致"""
+        success = process_incremental_update_files_optimized(
+            self.paths['old.idx'], self.paths['old.dat'], self.paths['new.idx'], self.paths['new.dat'],
+            self.paths['out.idx'], self.paths['out.dat'], bulk=True)
+        self.assertTrue(success)
+
+        columns = ['date_int', 'time_int', 'value_f']
+        idx_df = load_idx_data(self.paths['out.idx'])
+        self.assertEqual(idx_df['stock_code'].tolist(), sorted(set(self.old_records) | set(self.new_records)))
+        result = load_dat_data(self.paths['out.dat'], idx_df)
+        for stock_code, df in result.items():
+            old_df = pd.DataFrame(self.old_records.get(stock_code, []), columns=columns)
+            new_df = pd.DataFrame(self.new_records.get(stock_code, []), columns=columns)
+            expected = pd.concat([old_df, new_df], ignore_index=True).sort_values('date_int', kind='stable')
+            expected = expected.drop_duplicates(subset='date_int', keep='last').tail(500).reset_index(drop=True)
+            self.assertLessEqual(len(df), 500)
+            pd.testing.assert_frame_equal(df.reset_index(drop=True), expected, check_dtype=False)
+
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _assert_matches_full_merge(self, args):
+        """输出与不使用校验和的整文件合并逐字节一致"""
+        ref_idx, ref_dat = (os.path.join(self.temp_dir.name, name) for name in ('ref.idx', 'ref.dat'))
+        self.assertTrue(process_incremental_update_files_bulk(*args[:4], ref_idx, ref_dat))
+        self.assertEqual(self._read(self.paths['out.idx']), self._read(ref_idx))
+        self.assertEqual(self._read(self.paths['out.dat']), self._read(ref_dat))
+
+    def test_checksum_skip(self):
+        """增量数据段未变化、且现有数据就是上次输出的股票在下次运行时跳过，输出内容不变"""
+        checksum_path = os.path.join(self.temp_dir.name, 'checksum.csv')
+        idx_df = load_idx_data(self.paths['new.idx'], dat_path=self.paths['new.dat'])
+        self.assertEqual(idx_df['checksum'].tolist(), compute_segment_checksums(self.paths['new.dat'], idx_df).tolist())
+
+        args = [self.paths[name] for name in ('old.idx', 'old.dat', 'new.idx', 'new.dat', 'out.idx', 'out.dat')]
+        report = {}
+        self.assertTrue(process_incremental_update_files_optimized(*args, bulk=True, checksum_path=checksum_path,
+                                                                   report=report))
+        self.assertEqual(report['skipped'], 0)
+        self._assert_matches_full_merge(args)
+        code = idx_df['stock_code'].iloc[0]
+        self.assertEqual(load_segment_checksums(checksum_path)[code][:2],
+                         (int(idx_df['record_count'].iloc[0]), int(idx_df['checksum'].iloc[0])))
+
+        # 上次的输出没有复制回现有数据，增量数据虽未变化也必须重新合并
+        report = {}
+        self.assertTrue(process_incremental_update_files_bulk(*args, checksum_path=checksum_path, report=report))
+        self.assertEqual(report['skipped'], 0)
+        self._assert_matches_full_merge(args)
+
+        # 输出复制回现有数据后修改一只股票的增量数据，其余股票全部跳过
+        shutil.copy(self.paths['out.idx'], self.paths['old.idx'])
+        shutil.copy(self.paths['out.dat'], self.paths['old.dat'])
+        self.assertTrue(process_incremental_update_files_bulk(*args, checksum_path=checksum_path))
+        changed_code = next(iter(self.new_records))
+        self.new_records[changed_code][-1] = (self.new_records[changed_code][-1][0], 0, 999.0)
+        write_test_extdata(self.paths['new.idx'], self.paths['new.dat'], self.new_records)
+        report = {}
+        self.assertTrue(process_incremental_update_files_bulk(*args, checksum_path=checksum_path, report=report))
+        self.assertEqual((report['skipped'], report['merged']), (len(self.new_records) - 1, 1))
+        self._assert_matches_full_merge(args)
+        result = load_dat_data(self.paths['out.dat'], load_idx_data(self.paths['out.idx']))
+        self.assertIn(999.0, result[changed_code]['value_f'].tolist())
+
+    def test_merge_skipping(self):
+        """跳过的股票沿用现有数据段，其余股票合并，结果与整文件合并一致"""
+        with ExtDataStore(self.paths['old.idx'], self.paths['old.dat']) as old_store, \
+                ExtDataStore(self.paths['new.idx'], self.paths['new.dat']) as new_store:
+            # 没有增量数据且不超过500条的股票再次合并的结果就是现有数据段
+            skipped = {code for code, records in self.old_records.items()
+                       if code not in self.new_records and len(records) <= 500}
+            self.assertTrue(skipped)
+            expected = merge_extdata_bulk(old_store.index, old_store.records, new_store.index, new_store.records)
+            idx_records, dat_records, known_slots = merge_extdata_skipping(
+                old_store.index, old_store.records, new_store.index, new_store.records, skipped)
+            self.assertEqual(idx_records.tobytes(), expected[0].tobytes())
+            self.assertEqual(dat_records.tobytes(), expected[1].tobytes())
+            codes = decode_stock_codes(idx_records['stock_code'])
+            self.assertEqual(set(codes[known_slots >= 0].tolist()), skipped)
+            self.assertEqual(old_store.index.stock_code[known_slots[known_slots >= 0]].tolist(),
+                             codes[known_slots >= 0].tolist())
+
+    def test_bulk_report(self):
+        """整文件合并的report包含dat文件复制和重新编码的字节数"""
+        args = [self.paths[name] for name in ('old.idx', 'old.dat', 'new.idx', 'new.dat', 'out.idx', 'out.dat')]
+        report = {}
+        self.assertTrue(process_incremental_update_files_bulk(*args, report=report))
+        dat_size = os.path.getsize(self.paths['out.dat'])
+        # 没有增量数据的股票原样复制
+        self.assertGreater(report['copied_bytes'], 0)
+        self.assertGreater(report['encoded_bytes'], 0)
+        self.assertEqual(report['copied_bytes'] + report['encoded_bytes'], dat_size)
+        self.assertGreater(report['copy_ops'], 0)
+
+        report = {}
+        self.assertTrue(process_incremental_update_files_bulk(*args, segment_copy=False, report=report))
+        self.assertEqual((report['copied_bytes'], report['encoded_bytes']), (0, dat_size))
+
+    def test_segment_copy(self):
+        """测试分段复制：输出与整体重新编码逐字节一致，未变化的股票按原字节复制"""
+        full_dat = os.path.join(self.temp_dir.name, 'full.dat')
+        with ExtDataStore(self.paths['old.idx'], self.paths['old.dat']) as old_store, \
+                ExtDataStore(self.paths['new.idx'], self.paths['new.dat']) as new_store:
+            idx_records, dat_records = merge_extdata_bulk(old_store.index, old_store.records,
+                                                          new_store.index, new_store.records)
+            report = write_dat_segments(self.paths['old.dat'], old_store.index, old_store.records,
+                                        idx_records, dat_records, self.paths['out.dat'])
+            unchanged = find_unchanged_segments(old_store.index, old_store.records, idx_records, dat_records)
+
+        write_dat_array(full_dat, dat_records)
+        with open(self.paths['out.dat'], 'rb') as f1, open(full_dat, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+        # 没有增量数据且不超过500条的股票保持不变
+        codes = decode_stock_codes(idx_records['stock_code']).tolist()
+        for code, old_slot in zip(codes, unchanged.tolist()):
+            if code in self.old_records and code not in self.new_records and len(self.old_records[code]) <= 500:
+                self.assertGreaterEqual(old_slot, 0)
+            elif code not in self.old_records:
+                self.assertEqual(old_slot, -1)
+        self.assertEqual(report['copied_bytes'] + report['encoded_bytes'], len(dat_records) * DAT_RECORD_SIZE)
+        self.assertGreater(report['copied_bytes'], 0)
+        self.assertGreater(report['encoded_bytes'], 0)
+
+
+class TestExtDataInfo(unittest.TestCase):
+    """info文件编辑与write_file_info_batch、parse_file_info结果一致"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.names = ['个股月多标记', '新高标记', '新低标记', '二阶段标记']
+        self.info_path = os.path.join(self.temp_dir.name, 'extdata.info')
+        with open(self.info_path, 'wb') as f:
+            for i, name in enumerate(self.names):
+                f.write(struct.pack('<H64sIII82xbII124x', i + 10, name.encode('gb2312'),
+                                    20230101, 150000, 0, 0, 20220101, 20221231))
+        self.expected_path = os.path.join(self.temp_dir.name, 'expected.info')
+        with open(self.info_path, 'rb') as src, open(self.expected_path, 'wb') as dst:
+            dst.write(src.read())
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_fields(self):
+        with ExtDataInfo(self.info_path, writable=False) as info:
+            self.assertEqual(len(info), 4)
+            self.assertEqual(info.names, self.names)
+            self.assertEqual(info.seq.tolist(), [10, 11, 12, 13])
+            self.assertEqual(info.date_start.tolist(), [20220101] * 4)
+            self.assertEqual(info.index_of(['新低标记', '不存在', '个股月多标记']), [2, 0])
+            pd.testing.assert_frame_equal(info.to_frame(), pd.DataFrame(parse_file_info(self.info_path)))
+
+    def test_flush_identical(self):
+        with ExtDataInfo(self.info_path) as info:
+            info.stage(info.index_of(['个股月多标记', '二阶段标记']), period=1, date_start=20230301, date_end=20240101)
+            info.stage(info.index_of(['新高标记']), period=1, date_start=20230601, date_end=20240101)
+            self.assertEqual(info.pending, 9)
+            self.assertTrue(info.flush())
+            self.assertEqual(info.pending, 0)
+            self.assertEqual(info.date_start.tolist(), [20230301, 20230601, 20220101, 20230301])
+
+        write_file_info_batch(self.expected_path, [0, 3], 0xA0, '<bII', [1, 20230301, 20240101])
+        write_file_info_batch(self.expected_path, [1], 0xA0, '<bII', [1, 20230601, 20240101])
+        with open(self.info_path, 'rb') as f1, open(self.expected_path, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_stage_invalid(self):
+        with ExtDataInfo(self.info_path) as info:
+            with self.assertRaises(ValueError):
+                info.stage([0], name=1)
+            with self.assertRaises(IndexError):
+                info.stage([4], period=1)
+
+
+class TestExtDataCube(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dir = self.temp_dir.name
+        write_test_extdata(*extdata_file_paths(self.dir, 11), {
+            '600010': [(20230101, 0, 1.0), (20230102, 0, 2.0)],
+            '000001': [(20230102, 0, 3.0)],
+        })
+        write_test_extdata(*extdata_file_paths(self.dir, 42), {
+            '000001': [(20230101, 0, 5.0), (20230103, 0, float('nan'))],
+            '300750': [(20230103, 0, 6.0)],
+        })
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_load_cube(self):
+        cube = load_extdata_cube(self.dir, [11, 42, 99], max_workers=2)
+        self.assertEqual(cube.shape, (3, 3, 3))
+        self.assertEqual(cube.stock_codes.tolist(), ['000001', '300750', '600010'])
+        self.assertEqual(cube.dates.tolist(), [20230101, 20230102, 20230103])
+        self.assertEqual(cube.values.dtype, np.float32)
+
+        s, d = cube.stock_index('600010'), cube.date_index(20230102)
+        self.assertEqual(cube[11][s, d], 2.0)
+        self.assertTrue(np.isnan(cube[11][cube.stock_index('300750')]).all())
+        # 原始数据为NaN时mask仍为True
+        nan_pos = (cube.slot_index(42), cube.stock_index('000001'), cube.date_index(20230103))
+        self.assertTrue(np.isnan(cube.values[nan_pos]))
+        self.assertTrue(cube.mask[nan_pos])
+        # 文件缺失的序号整层为空
+        self.assertFalse(cube.mask[cube.slot_index(99)].any())
+        self.assertEqual(int(cube.mask.sum()), 6)
+
+    def test_load_cube_filter(self):
+        cube = load_extdata_cube(self.dir, [11, 42], stock_codes=['600010', '000001'], start_date=20230102)
+        self.assertEqual(cube.stock_codes.tolist(), ['600010', '000001'])
+        self.assertEqual(cube.dates.tolist(), [20230102, 20230103])
+        self.assertEqual(cube.frame(11).loc['000001', 20230102], 3.0)
+        with self.assertRaises(KeyError):
+            cube.date_index(20230101)
+
+
+class TestIterExtData(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.idx_path = os.path.join(self.temp_dir.name, 'extdata_1.idx')
+        self.dat_path = os.path.join(self.temp_dir.name, 'extdata_1.dat')
+        self.stock_records = {
+            '600010': [(20230101 + i, 0, float(i)) for i in range(5)],
+            '000001': [(20230101, 0, 7.0)],
+            '000002': [],
+            '300750': [(20230101 + i, 0, float(-i)) for i in range(3)],
+        }
+        write_test_extdata(self.idx_path, self.dat_path, self.stock_records)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_iter(self):
+        for chunk_records in (1, 4, 100):
+            items = list(iter_extdata(self.idx_path, self.dat_path, chunk_records=chunk_records))
+            self.assertEqual([code for code, _ in items], list(self.stock_records))
+            for code, records in items:
+                self.assertEqual(records['value_f'].tolist(), [r[2] for r in self.stock_records[code]])
+
+    def test_iter_codes(self):
+        items = list(iter_extdata(self.idx_path, self.dat_path, codes={'300750', '600010', '999999'}))
+        self.assertEqual([code for code, _ in items], ['600010', '300750'])
+
+    def test_map_reduce(self):
+        lengths = map_reduce(self.idx_path, self.dat_path, lambda code, records: len(records))
+        self.assertEqual(lengths, {'600010': 5, '000001': 1, '000002': 0, '300750': 3})
+        total = map_reduce(self.idx_path, self.dat_path, lambda code, records: float(records['value_f'].sum()),
+                           lambda acc, code, value: acc + value, initial=0.0, chunk_records=2)
+        self.assertEqual(total, 14.0)
+
+
+class TestDiffExtData(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.paths = {name: os.path.join(self.temp_dir.name, name)
+                      for name in ('base.idx', 'base.dat', 'work.idx', 'work.dat')}
+        write_test_extdata(self.paths['base.idx'], self.paths['base.dat'], {
+            '600010': [(20230101, 0, 1.0), (20230102, 0, 2.0), (20230103, 0, float('nan'))],
+            '000001': [(20230101, 0, 5.0)],
+            '000002': [(20230101, 0, 6.0)],
+        })
+        write_test_extdata(self.paths['work.idx'], self.paths['work.dat'], {
+            '000001': [(20230101, 0, 5.0000001), (20230102, 0, 5.5)],
+            '600010': [(20230101, 0, 1.0), (20230102, 0, 2.5), (20230103, 0, float('nan'))],
+            '300750': [(20230101, 0, 9.0)],
+        })
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_diff(self):
+        result = diff_extdata(self.paths['base.idx'], self.paths['base.dat'],
+                              self.paths['work.idx'], self.paths['work.dat'])
+        self.assertEqual(result['summary'], {'left_total': 5, 'right_total': 6, 'same': 3, 'changed': 1,
+                                             'added': 2, 'removed': 1, 'stocks_changed': 4})
+
+        stocks = result['stocks'].set_index('stock_code')
+        self.assertEqual(stocks.loc['000001'].to_dict(),
+                         {'left_count': 1, 'right_count': 2, 'same': 1, 'changed': 0, 'added': 1, 'removed': 0})
+        self.assertEqual(stocks.loc['000002', 'removed'], 1)
+        self.assertEqual(stocks.loc['300750', 'added'], 1)
+
+        changed = result['changed']
+        self.assertEqual(changed[['stock_code', 'date_int']].values.tolist(), [['600010', 20230102]])
+        self.assertAlmostEqual(changed['diff'].iloc[0], 0.5)
+
+    def test_diff_identical(self):
+        result = diff_extdata(self.paths['base.idx'], self.paths['base.dat'],
+                              self.paths['base.idx'], self.paths['base.dat'])
+        self.assertEqual(result['summary']['same'], 5)
+        self.assertEqual(result['summary']['stocks_changed'], 0)
+        self.assertTrue(result['changed'].empty)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,195 @@
+import unittest
+import tempfile
+import os
+import bisect
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from tdx.trade_calendar import *
+
+
+class TestTradingCalendar(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, 'trade_dates.txt')
+        self.trade_dates = ['2025-08-25', '2025-08-26', '2025-08-27', '2025-08-28', '2025-08-29',
+                            '2025-09-01', '2025-09-02']
+        self._write(self.trade_dates)
+        self.calendar = TradingCalendar(self.file_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, dates):
+        with open(self.file_path, 'w') as f:
+            f.write('\n'.join(dates) + '\n')
+
+    def test_convert(self):
+        self.assertEqual(date_to_int('2025-08-29'), 20250829)
+        self.assertEqual(date_to_int('20250829'), 20250829)
+        self.assertEqual(date_to_int(date(2025, 8, 29)), 20250829)
+        self.assertEqual(date_to_int(pd.Timestamp('2025-08-29 15:00')), 20250829)
+        self.assertEqual(date_to_int(np.datetime64('2025-08-29')), 20250829)
+        self.assertEqual(int_to_str(20250829), '2025-08-29')
+        ints = np.array([19901219, 20240229, 20251231])
+        np.testing.assert_array_equal(datetime64_to_ints(ints_to_datetime64(ints)), ints)
+
+    def test_load(self):
+        self.assertEqual(self.calendar.dates.dtype, np.int32)
+        self.assertEqual(len(self.calendar), 7)
+        self.assertEqual(str(self.calendar.datetime64[0]), '2025-08-25')
+        self.assertTrue(self.calendar.is_trading_day('2025-08-29'))
+        self.assertNotIn('2025-08-30', self.calendar)
+
+    def test_nearest(self):
+        self.assertEqual(self.calendar.nearest('2025-08-29'), 20250829)
+        self.assertEqual(self.calendar.nearest('2025-08-31'), 20250829)
+        self.assertEqual(self.calendar.nearest('2025-12-31'), 20250902)
+        self.assertIsNone(self.calendar.nearest('2025-01-01'))
+
+    def test_offset(self):
+        self.assertEqual(self.calendar.offset(20250829, 1), 20250901)
+        self.assertEqual(self.calendar.offset(20250830, -1), 20250829)
+        self.assertIsNone(self.calendar.offset(20250829, 10))
+        # 与原bisect实现一致：往前数第n个交易日包含date本身
+        for day in ('2025-08-27', '2025-08-30', '2025-09-02'):
+            for n in (1, 2, 3):
+                index = bisect.bisect_left(self.trade_dates, day) - n + 1
+                self.assertEqual(int_to_str(self.calendar.n_days_before(day, n)), self.trade_dates[index])
+        self.assertIsNone(self.calendar.n_days_before('2025-08-26', 5))
+
+    def test_range(self):
+        # 与原实现的切片语义一致
+        for start in ('2025-08-24', '2025-08-27', '2025-08-30', '2025-09-02'):
+            for n in (-10, -2, 0, 2, 10):
+                start_index = bisect.bisect_left(self.trade_dates, start)
+                if n >= 0:
+                    expected = self.trade_dates[start_index:start_index + n]
+                else:
+                    begin = max(0, start_index + n)
+                    expected = self.trade_dates[begin:begin - n]
+                self.assertEqual(self.calendar.to_str_list(self.calendar.range(start, n)), expected)
+        self.assertEqual(len(self.calendar.range('2026-01-01', 5)), 0)
+
+    def test_between(self):
+        self.assertEqual(self.calendar.to_str_list(self.calendar.between('2025-08-28', '2025-09-01')),
+                         ['2025-08-28', '2025-08-29', '2025-09-01'])
+        self.assertEqual(len(self.calendar.between(20250830, 20250831)), 0)
+
+    def test_reload(self):
+        reloaded = []
+        self.calendar.add_reload_hook(lambda calendar: reloaded.append(len(calendar.dates)))
+        self.assertEqual(self.calendar.nearest('2025-09-05'), 20250902)
+        self._write(self.trade_dates + ['2025-09-03', '2025-09-04'])
+        os.utime(self.file_path, ns=(1, 1))
+        self.assertEqual(self.calendar.nearest('2025-09-05'), 20250904)
+        self.assertEqual(reloaded, [7, 9])
+        self.assertFalse(self.calendar.reload_if_changed())
+
+    def test_batch_shift(self):
+        days = np.array([20250827, 20250830, 20250902])
+        for n in (-3, -1, 0, 1, 3):
+            expected = [self.calendar.offset(day, n) or INVALID_DATE for day in days.tolist()]
+            np.testing.assert_array_equal(self.calendar.shift(days, n), expected)
+        # 日期与偏移广播
+        np.testing.assert_array_equal(self.calendar.shift(20250829, np.array([-1, 0, 1])),
+                                      [20250828, 20250829, 20250901])
+        np.testing.assert_array_equal(shift_trading_days(days, [1, 1, 1], calendar=self.calendar),
+                                      [20250828, 20250902, INVALID_DATE])
+        # datetime64输入返回datetime64，越界为NaT
+        result = self.calendar.shift(np.array(['2025-08-30', '2025-09-02'], dtype='datetime64[D]'), 1)
+        self.assertEqual(str(result[0]), '2025-09-02')
+        self.assertTrue(np.isnat(result[1]))
+        self.assertEqual(self.calendar.shift('2025-08-29', -1), 20250828)
+
+    def test_batch_snap(self):
+        days = np.array([20250824, 20250829, 20250830, 20250903])
+        np.testing.assert_array_equal(snap_to_trading_day(days, calendar=self.calendar),
+                                      [INVALID_DATE, 20250829, 20250829, 20250902])
+        np.testing.assert_array_equal(snap_to_trading_day(days, 'forward', calendar=self.calendar),
+                                      [20250825, 20250829, 20250901, INVALID_DATE])
+        snapped = self.calendar.snap(np.array(['2025-08-31'], dtype='datetime64[D]'))
+        self.assertEqual(snapped.dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(str(snapped[0]), '2025-08-29')
+        with self.assertRaises(ValueError):
+            self.calendar.snap(days, 'nearest')
+
+    def test_batch_between(self):
+        starts = np.array([20250825, 20250829, 20250830])
+        counts = trading_days_between(starts, 20250902, calendar=self.calendar)
+        np.testing.assert_array_equal(counts, [6, 2, 2])
+        self.assertEqual(self.calendar.count_between(20250902, 20250825), -6)
+        # 交易日之间：shift(start, count) == end
+        for start in (20250825, 20250828):
+            count = self.calendar.count_between(start, 20250901)
+            self.assertEqual(self.calendar.shift(start, count), 20250901)
+
+    def test_instance(self):
+        self.assertIs(TradingCalendar.instance(self.file_path), TradingCalendar.instance(self.file_path))
+        self.assertGreater(len(get_calendar()), 8000)
+
+
+class TestCalendarRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, 'trade_dates.txt')
+        self.source_path = os.path.join(self.temp_dir.name, 'source.txt')
+        with open(self.file_path, 'w') as f:
+            f.write('2025-08-28\n2025-08-29\n')
+        with open(self.source_path, 'w') as f:
+            f.write('2025-08-27\n2025-08-29\n2025-09-01\n')
+        self.calls = 0
+        refresher = FileRefresher(self.source_path)
+
+        def counting_refresher():
+            self.calls += 1
+            return refresher()
+
+        self.calendar = TradingCalendar(self.file_path, refresher=counting_refresher)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_refresh_merges(self):
+        self.assertEqual(self.calendar.previous('2025-09-01'), 20250829)
+        self.assertTrue(self.calendar.refresh())
+        self.assertEqual(self.calendar.to_str_list(self.calendar.dates), ['2025-08-27', '2025-08-28', '2025-08-29',
+                                                                          '2025-09-01'])
+        with open(self.file_path, 'r') as f:
+            self.assertEqual(f.read().split(), ['2025-08-27', '2025-08-28', '2025-08-29', '2025-09-01'])
+        self.assertEqual(self.calendar.last_refresh(), date_to_int(date.today()))
+        self.assertEqual([name for name in os.listdir(self.temp_dir.name) if name.endswith('.tmp')], [])
+
+    def test_refresh_once_per_day(self):
+        self.calendar.refresh()
+        self.assertFalse(self.calendar.refresh())
+        # 新实例读取同一个更新标记，不会再次获取
+        other = TradingCalendar(self.file_path, refresher=self.calendar.refresher)
+        self.assertFalse(other.refresh())
+        self.assertEqual(self.calls, 1)
+        self.calendar.refresh(force=True)
+        self.assertEqual(self.calls, 2)
+
+    def test_ensure_covers(self):
+        self.assertTrue(self.calendar.ensure_covers('2025-08-29'))
+        self.assertEqual(self.calls, 0)
+        self.assertTrue(self.calendar.ensure_covers('2025-09-01'))
+        self.assertFalse(self.calendar.ensure_covers('2025-09-02'))
+        self.assertEqual(self.calls, 1)
+
+    def test_refresh_failure_keeps_local(self):
+        def failing_refresher():
+            raise ConnectionError("network down")
+
+        self.calendar.refresher = failing_refresher
+        self.assertFalse(self.calendar.refresh())
+        self.assertEqual(len(self.calendar), 2)
+        self.assertIsNone(self.calendar.last_refresh())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,750 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from tdx.extdata_util import DAT_DTYPE, read_dat_array, write_dat_array
+
+from tdx.workflow import (Backfill, BaseProcessor, CheckpointStore, Config, ProcessorTimeout, Workflow, WorkflowCancelled,
+                          WorkflowLogger, WorkflowTimeout, compare_reports, load_report)
+
+
+class RecordProcessor(BaseProcessor):
+    """记录执行顺序，按声明写入键值"""
+
+    def __init__(self, config, logger, name, reads=None, writes=None, sleep=0.0, continue_flag=True, events=None):
+        super().__init__(config, logger)
+        self.name = name
+        self.reads = reads
+        self.writes = writes
+        self.sleep = sleep
+        self.continue_flag = continue_flag
+        self.events = events if events is not None else []
+
+    def process(self, data):
+        self.events.append(('start', self.name))
+        for key in self.reads or ():
+            if key not in data:
+                raise KeyError(key)
+        time.sleep(self.sleep)
+        data = dict(data or {})
+        for key in self.writes or ():
+            data[key] = self.name
+        data.setdefault('visited', []).append(self.name)
+        self.events.append(('end', self.name))
+        return data, self.continue_flag
+
+
+class CountingProcessor(BaseProcessor):
+    reads = ()
+    writes = ('values',)
+
+    def process(self, data):
+        values = [i * i for i in range(100000)]
+        self.report_records(len(values))
+        self.report_records(3, key='files')
+        data['values'] = len(values)
+        return data, True
+
+
+class FailingProcessor(BaseProcessor):
+    reads = ()
+    writes = ()
+
+    def process(self, data):
+        raise RuntimeError("boom")
+
+
+class TestWorkflowDag(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        self.logger = WorkflowLogger(name="test_workflow", log_level="WARNING")
+        self.events = []
+
+    def _processor(self, name, reads=None, writes=None, **kwargs):
+        return RecordProcessor(self.config, self.logger, name, reads=reads, writes=writes, events=self.events,
+                               **kwargs)
+
+    def _workflow(self, processors, **kwargs):
+        workflow = Workflow(self.config, self.logger, **kwargs)
+        for processor in processors:
+            workflow.add_processor(processor)
+        return workflow
+
+    def _indicator_processors(self, sleep=0.0):
+        return [
+            self._processor('pre', reads=(), writes=('today_int',)),
+            self._processor('temp', reads=('today_int',), writes=('temp_dir_path',)),
+            self._processor('stocks', reads=('temp_dir_path',), writes=('stock_list',)),
+            self._processor('crowd', reads=('temp_dir_path', 'stock_list'), writes=(), sleep=sleep),
+            self._processor('nlnh', reads=('temp_dir_path', 'stock_list'), writes=(), sleep=sleep),
+            self._processor('ma50', reads=('temp_dir_path', 'stock_list'), writes=(), sleep=sleep),
+            self._processor('end', reads=(), writes=('stock_list',)),
+        ]
+
+    def test_levels(self):
+        workflow = self._workflow(self._indicator_processors(), scheduler='dag')
+        self.assertEqual(workflow.topological_levels(), [[0], [1], [2], [3, 4, 5], [6]])
+        # 未声明读写的处理器与前后所有处理器串行
+        workflow.processors.insert(4, self._processor('legacy'))
+        self.assertEqual(workflow.topological_levels(), [[0], [1], [2], [3], [4], [5, 6], [7]])
+
+    def test_parallel_branches(self):
+        workflow = self._workflow(self._indicator_processors(sleep=0.3), scheduler='dag', max_workers=3)
+        start = time.perf_counter()
+        result = workflow.execute()
+        elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 0.8)
+        self.assertEqual(result['stock_list'], 'end')
+        self.assertEqual(result['temp_dir_path'], 'temp')
+        # end写入stock_list，必须在所有读取stock_list的处理器结束后执行
+        self.assertEqual(self.events[-2:], [('start', 'end'), ('end', 'end')])
+        starts = [name for event, name in self.events if event == 'start']
+        self.assertEqual(starts[:3], ['pre', 'temp', 'stocks'])
+
+    def test_linear_compatible(self):
+        processors = [self._processor('a'), self._processor('b'), self._processor('c')]
+        linear = self._workflow(processors).execute({})
+        self.events.clear()
+        dag = self._workflow(processors, scheduler='dag').execute({})
+        self.assertEqual(linear['visited'], ['a', 'b', 'c'])
+        self.assertEqual(dag['visited'], ['a', 'b', 'c'])
+
+    def test_interrupt(self):
+        processors = [
+            self._processor('a', reads=(), writes=('x',), continue_flag=False),
+            self._processor('b', reads=('x',), writes=('y',)),
+        ]
+        workflow = self._workflow(processors, scheduler='dag')
+        result = workflow.execute()
+        self.assertFalse(workflow.should_continue)
+        self.assertNotIn('y', result)
+        self.assertNotIn(('start', 'b'), self.events)
+
+    def test_failure(self):
+        processors = [FailingProcessor(self.config, self.logger), self._processor('b', reads=(), writes=())]
+        workflow = self._workflow(processors, scheduler='dag')
+        with self.assertRaises(RuntimeError):
+            workflow.execute()
+
+    def test_config(self):
+        config = Config()
+        config.set('workflow', {'scheduler': 'dag', 'max_workers': 2})
+        workflow = Workflow(config, self.logger)
+        self.assertEqual((workflow.scheduler, workflow.max_workers, workflow.executor), ('dag', 2, 'thread'))
+        with self.assertRaises(ValueError):
+            Workflow(self.config, self.logger, scheduler='parallel')
+
+
+class TestWorkflowInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.logger = WorkflowLogger(name="test_instrument", log_level="WARNING")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _config(self, **workflow):
+        config = Config()
+        config.set('workflow', dict({'name': 'nightly', 'report_dir': self.temp_dir.name}, **workflow))
+        return config
+
+    def _run(self, config, processors, **kwargs):
+        workflow = Workflow(config, self.logger, **kwargs)
+        for processor in processors:
+            workflow.add_processor(processor)
+        workflow.execute({})
+        return workflow
+
+    def test_report(self):
+        for scheduler in ('linear', 'dag'):
+            config = self._config(tracemalloc=True)
+            workflow = self._run(config, [CountingProcessor(config, self.logger),
+                                          CountingProcessor(config, self.logger)], scheduler=scheduler)
+            report = load_report(workflow.report_path)
+            self.assertEqual(report['status'], 'completed')
+            self.assertEqual(sorted(item['name'] for item in report['processors']),
+                             ['CountingProcessor', 'CountingProcessor#2'])
+            item = report['processors'][0]
+            self.assertEqual(item['records'], {'records': 100000, 'files': 3})
+            self.assertGreater(item['wall'], 0)
+            self.assertGreaterEqual(item['cpu'], 0)
+            self.assertGreater(item['throughput']['records'], 0)
+            self.assertGreater(item['tracemalloc_peak_kb'], 0)
+            os.remove(workflow.report_path)
+        tracemalloc.stop()
+
+    def test_failed_report(self):
+        config = self._config()
+        workflow = Workflow(config, self.logger)
+        workflow.add_processor(CountingProcessor(config, self.logger))
+        workflow.add_processor(FailingProcessor(config, self.logger))
+        with self.assertRaises(RuntimeError):
+            workflow.execute({})
+        report = load_report(workflow.report_path)
+        self.assertEqual(report['status'], 'failed')
+        self.assertEqual([item['status'] for item in report['processors']], ['ok', 'failed'])
+
+    def test_profile(self):
+        config = self._config(profile='cprofile')
+        workflow = self._run(config, [CountingProcessor(config, self.logger)])
+        profile_path = workflow.run_report.processors[0]['profile']
+        self.assertTrue(profile_path.endswith('.prof'))
+        self.assertTrue(os.path.exists(profile_path))
+
+    def test_no_report_dir(self):
+        config = Config()
+        workflow = self._run(config, [CountingProcessor(config, self.logger)])
+        self.assertIsNone(workflow.report_path)
+        self.assertEqual(len(workflow.run_report.processors), 1)
+
+    def test_compare(self):
+        base = {'processors': [{'name': 'A', 'wall': 1.0}, {'name': 'B', 'wall': 1.0}, {'name': 'C', 'wall': 1.0},
+                               {'name': 'D', 'wall': 0.001}]}
+        current = {'processors': [{'name': 'A', 'wall': 2.0}, {'name': 'B', 'wall': 0.5}, {'name': 'D', 'wall': 0.005},
+                                  {'name': 'E', 'wall': 1.0}]}
+        comparison = compare_reports(base, current)
+        self.assertEqual({name: item['status'] for name, item in comparison.items()},
+                         {'A': 'regression', 'B': 'improved', 'C': 'removed', 'D': 'ok', 'E': 'new'})
+
+
+class DirProcessor(BaseProcessor):
+    reads = ()
+    writes = ('temp_dir_path',)
+
+    def process(self, data):
+        data['temp_dir_path'] = self.config.get('temp_dir')
+        return data, True
+
+
+class ExpensiveProcessor(BaseProcessor):
+    """读取输入文件，生成输出文件并记录执行次数"""
+    reads = ('temp_dir_path',)
+    writes = ('total',)
+    cacheable = True
+    runs = 0
+
+    def input_files(self, data):
+        return [os.path.join(data['temp_dir_path'], 'input.txt')]
+
+    def output_files(self, data):
+        return [os.path.join(data['temp_dir_path'], 'output.txt')]
+
+    def process(self, data):
+        ExpensiveProcessor.runs += 1
+        with open(self.input_files(data)[0]) as f:
+            total = sum(int(line) for line in f)
+        with open(self.output_files(data)[0], 'w') as f:
+            f.write(str(total))
+        data['total'] = total
+        return data, True
+
+
+class FlakyCopyProcessor(BaseProcessor):
+    reads = ('total',)
+    writes = ('copied',)
+    fail = True
+
+    def process(self, data):
+        if FlakyCopyProcessor.fail:
+            raise IOError("copy failed")
+        data['copied'] = data['total']
+        return data, True
+
+
+class TestWorkflowResume(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.logger = WorkflowLogger(name="test_resume", log_level="WARNING")
+        self.config = Config()
+        self.config.set('temp_dir', self.temp_dir.name)
+        self.config.set('path', {'append_list': [42]})
+        self.input_path = os.path.join(self.temp_dir.name, 'input.txt')
+        with open(self.input_path, 'w') as f:
+            f.write('1\n2\n3\n')
+        ExpensiveProcessor.runs = 0
+        FlakyCopyProcessor.fail = True
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _workflow(self, resume, scheduler='linear'):
+        workflow = Workflow(self.config, self.logger, resume=resume, scheduler=scheduler)
+        workflow.add_processor(DirProcessor(self.config, self.logger))
+        workflow.add_processor(ExpensiveProcessor(self.config, self.logger))
+        workflow.add_processor(FlakyCopyProcessor(self.config, self.logger))
+        return workflow
+
+    def test_resume_after_failure(self):
+        for scheduler in ('linear', 'dag'):
+            shutil.rmtree(os.path.join(self.temp_dir.name, '.checkpoints'), ignore_errors=True)
+            ExpensiveProcessor.runs = 0
+            FlakyCopyProcessor.fail = True
+            with self.assertRaises(IOError):
+                self._workflow(resume=True, scheduler=scheduler).execute({})
+            self.assertEqual(ExpensiveProcessor.runs, 1)
+
+            FlakyCopyProcessor.fail = False
+            workflow = self._workflow(resume=True, scheduler=scheduler)
+            result = workflow.execute({})
+            self.assertEqual(ExpensiveProcessor.runs, 1)
+            self.assertEqual(result['copied'], 6)
+            self.assertIn('cached', [item['status'] for item in workflow.run_report.processors])
+
+    def test_input_changed(self):
+        FlakyCopyProcessor.fail = False
+        self._workflow(resume=True).execute({})
+        with open(self.input_path, 'w') as f:
+            f.write('10\n')
+        os.utime(self.input_path, ns=(1, 1))
+        result = self._workflow(resume=True).execute({})
+        self.assertEqual(ExpensiveProcessor.runs, 2)
+        self.assertEqual(result['copied'], 10)
+
+    def test_output_removed(self):
+        FlakyCopyProcessor.fail = False
+        self._workflow(resume=True).execute({})
+        os.remove(os.path.join(self.temp_dir.name, 'output.txt'))
+        self._workflow(resume=True).execute({})
+        self.assertEqual(ExpensiveProcessor.runs, 2)
+
+    def test_without_resume(self):
+        FlakyCopyProcessor.fail = False
+        self._workflow(resume=False).execute({})
+        self._workflow(resume=False).execute({})
+        self.assertEqual(ExpensiveProcessor.runs, 2)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir.name, '.checkpoints')))
+
+    def test_key(self):
+        processor = ExpensiveProcessor(self.config, self.logger)
+        data = {'temp_dir_path': self.temp_dir.name}
+        key = CheckpointStore.key(processor, data)
+        self.assertEqual(key, CheckpointStore.key(processor, dict(data)))
+        self.config.set('path', {'append_list': [43]})
+        self.assertNotEqual(key, CheckpointStore.key(processor, data))
+
+    def test_key_cache_inputs(self):
+        """无法JSON序列化的输入须由cache_inputs转换为简单值，否则抛出TypeError"""
+        class Stock:
+            def __init__(self, code):
+                self.code = code
+
+        processor = ExpensiveProcessor(self.config, self.logger)
+        processor.reads = ('temp_dir_path', 'stock_list')
+        data = {'temp_dir_path': self.temp_dir.name, 'stock_list': [Stock('600000'), Stock('000001')]}
+        with self.assertRaises(TypeError):
+            CheckpointStore.key(processor, data)
+
+        processor.cache_inputs = lambda data: {'stock_codes': sorted(stk.code for stk in data['stock_list'])}
+        key = CheckpointStore.key(processor, data)
+        self.assertEqual(key, CheckpointStore.key(processor, dict(data, stock_list=[Stock('000001'), Stock('600000')])))
+        self.assertNotEqual(key, CheckpointStore.key(processor, dict(data, stock_list=[Stock('000001')])))
+
+
+class FlakyProcessor(BaseProcessor):
+    """前failures次执行抛出异常（returns_false时像业务处理器一样捕获异常并返回False）"""
+    reads = ()
+    writes = ('flaky',)
+
+    def __init__(self, config, logger, failures, idempotent=True, returns_false=False):
+        super().__init__(config, logger)
+        self.failures = failures
+        self.idempotent = idempotent
+        self.returns_false = returns_false
+        self.calls = 0
+
+    def process(self, data):
+        self.calls += 1
+        if self.calls <= self.failures:
+            if self.returns_false:
+                return data, False
+            raise IOError(f"file locked ({self.calls})")
+        data['flaky'] = self.calls
+        return data, True
+
+
+class SlowProcessor(BaseProcessor):
+    """循环等待并检查取消标志"""
+    reads = ()
+    writes = ()
+
+    def __init__(self, config, logger, seconds, timeout=None):
+        super().__init__(config, logger)
+        self.seconds = seconds
+        self.timeout = timeout
+        self.observed_cancel = threading.Event()
+
+    def process(self, data):
+        deadline = time.perf_counter() + self.seconds
+        while time.perf_counter() < deadline:
+            if self.cancelled:
+                self.observed_cancel.set()
+            self.check_cancelled()
+            time.sleep(0.01)
+        return data, True
+
+
+class TestWorkflowTimeoutRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = WorkflowLogger(name="test_timeout", log_level="CRITICAL")
+
+    def _config(self, **workflow):
+        config = Config()
+        config.set('workflow', dict({'retry_backoff': 0.01}, **workflow))
+        return config
+
+    def _workflow(self, config, processors, scheduler='linear'):
+        workflow = Workflow(config, self.logger, scheduler=scheduler)
+        for processor in processors:
+            workflow.add_processor(processor)
+        return workflow
+
+    def test_retry_idempotent(self):
+        for scheduler in ('linear', 'dag'):
+            config = self._config(max_retries=3)
+            processor = FlakyProcessor(config, self.logger, failures=2)
+            workflow = self._workflow(config, [processor], scheduler)
+            self.assertEqual(workflow.execute({})['flaky'], 3)
+            metrics = workflow.run_report.processors[0]
+            self.assertEqual(metrics['attempts'], 3)
+            self.assertEqual(len(metrics['errors']), 2)
+
+    def test_retry_returns_false(self):
+        """idempotent处理器返回False也重试，重试次数用完后中断工作流"""
+        for scheduler in ('linear', 'dag'):
+            config = self._config(max_retries=3)
+            processor = FlakyProcessor(config, self.logger, failures=2, returns_false=True)
+            workflow = self._workflow(config, [processor], scheduler)
+            self.assertEqual(workflow.execute({})['flaky'], 3)
+            metrics = workflow.run_report.processors[0]
+            self.assertEqual((metrics['attempts'], len(metrics['errors'])), (3, 2))
+
+        config = self._config(max_retries=2)
+        processor = FlakyProcessor(config, self.logger, failures=5, returns_false=True)
+        workflow = self._workflow(config, [processor])
+        workflow.execute({})
+        self.assertEqual(processor.calls, 3)
+        self.assertEqual(workflow.run_report.status, 'interrupted')
+
+        processor = FlakyProcessor(config, self.logger, failures=1, idempotent=False, returns_false=True)
+        self._workflow(config, [processor]).execute({})
+        self.assertEqual(processor.calls, 1)
+
+    def test_no_retry(self):
+        config = self._config(max_retries=3)
+        processor = FlakyProcessor(config, self.logger, failures=1, idempotent=False)
+        workflow = self._workflow(config, [processor])
+        with self.assertRaises(IOError):
+            workflow.execute({})
+        self.assertEqual(processor.calls, 1)
+        failure = workflow.run_report.failure
+        self.assertEqual((failure['processor'], failure['status'], failure['retryable']),
+                         ('FlakyProcessor', 'failed', False))
+
+    def test_retries_exhausted(self):
+        config = self._config(max_retries=2)
+        processor = FlakyProcessor(config, self.logger, failures=5)
+        workflow = self._workflow(config, [processor])
+        with self.assertRaises(IOError):
+            workflow.execute({})
+        self.assertEqual(processor.calls, 3)
+        self.assertEqual(workflow.run_report.failure['attempts'], 3)
+        self.assertTrue(workflow.run_report.failure['retryable'])
+
+    def test_processor_timeout(self):
+        for scheduler in ('linear', 'dag'):
+            config = self._config(max_retries=3)
+            slow = SlowProcessor(config, self.logger, seconds=5, timeout=0.2)
+            slow.idempotent = True
+            workflow = self._workflow(config, [slow], scheduler)
+            start = time.perf_counter()
+            with self.assertRaises(ProcessorTimeout):
+                workflow.execute({})
+            self.assertLess(time.perf_counter() - start, 1.5)
+            self.assertEqual(workflow.run_report.status, 'timeout')
+            self.assertEqual(workflow.run_report.failure['type'], 'ProcessorTimeout')
+            self.assertTrue(workflow.run_report.failure['retryable'])
+            # 超时不重试，处理器检查到取消标志后退出
+            self.assertTrue(slow.observed_cancel.wait(1))
+
+    def test_workflow_timeout(self):
+        for scheduler in ('linear', 'dag'):
+            config = self._config(timeout=0.3, max_workers=1)
+            processors = [SlowProcessor(config, self.logger, seconds=0.2) for _ in range(3)]
+            workflow = self._workflow(config, processors, scheduler)
+            with self.assertRaises(WorkflowTimeout):
+                workflow.execute({})
+            self.assertEqual(workflow.run_report.status, 'timeout')
+
+    def test_cancel(self):
+        config = self._config()
+        workflow = self._workflow(config, [])
+
+        class CancellingProcessor(BaseProcessor):
+            def process(self, data):
+                workflow.cancel("manual")
+                return data, True
+
+        workflow.add_processor(CancellingProcessor(config, self.logger))
+        workflow.add_processor(FlakyProcessor(config, self.logger, failures=0))
+        with self.assertRaises(WorkflowCancelled):
+            workflow.execute({})
+        self.assertEqual(workflow.run_report.status, 'cancelled')
+        self.assertEqual(workflow.processors[1].calls, 0)
+
+
+
+class DayDirProcessor(BaseProcessor):
+    """按日执行：创建日期目录"""
+    reads = ('target_date',)
+    writes = ('temp_dir_path',)
+
+    def process(self, data):
+        if data['target_date'] == data.get('fail_date'):
+            raise RuntimeError("bad day")
+        data['temp_dir_path'] = os.path.join(data['root'], str(data['target_date']))
+        os.makedirs(data['temp_dir_path'], exist_ok=True)
+        data['pid'] = os.getpid()
+        return data, data['target_date'] != data.get('stop_date')
+
+
+class SharedListProcessor(BaseProcessor):
+    reads = ()
+    writes = ('stock_list',)
+    shared = True
+
+    def __init__(self, config, logger):
+        super().__init__(config, logger)
+        self.calls = 0
+
+    def process(self, data):
+        self.calls += 1
+        data['stock_list'] = ['600000', '000001']
+        data['ignored'] = True
+        return data, True
+
+
+class RangeSumProcessor(BaseProcessor):
+    """一次计算所有日期：每天写入截至当天的累计值"""
+    reads = ('temp_dir_path', 'stock_list')
+    writes = ('total',)
+
+    def __init__(self, config, logger):
+        super().__init__(config, logger)
+        self.range_calls = 0
+
+    def process(self, data):
+        data['total'] = data['target_date'] * len(data['stock_list'])
+        return data, True
+
+    def process_range(self, days_data):
+        self.range_calls += 1
+        for day, data in days_data.items():
+            data['total'] = day * len(data['stock_list'])
+            with open(os.path.join(data['temp_dir_path'], 'total.txt'), 'w') as f:
+                f.write(str(data['total']))
+        return days_data, True
+
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.logger = WorkflowLogger(name="test_backfill", log_level="CRITICAL")
+        self.config = Config()
+        self.days = [20250825, 20250826, 20250827]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _backfill(self, executor='thread'):
+        backfill = Backfill(self.config, self.logger, list(reversed(self.days)), max_workers=2, executor=executor)
+        self.shared = SharedListProcessor(self.config, self.logger)
+        self.range = RangeSumProcessor(self.config, self.logger)
+        for processor in (DayDirProcessor(self.config, self.logger), self.shared, self.range):
+            backfill.add_processor(processor)
+        return backfill
+
+    def test_default_executor(self):
+        """默认使用线程执行，hikyuu对象无法在进程间传递"""
+        self.assertEqual(Backfill(self.config, self.logger, self.days).executor, 'thread')
+        self.assertFalse(DayDirProcessor(self.config, self.logger).supports_range)
+        self.assertTrue(RangeSumProcessor(self.config, self.logger).supports_range)
+
+    def test_stages(self):
+        backfill = self._backfill()
+        backfill.add_processor(DayDirProcessor(self.config, self.logger))
+        backfill.add_processor(DayDirProcessor(self.config, self.logger))
+        self.assertEqual(backfill.stages(), [('daily', [0]), ('shared', [1]), ('range', [2]), ('daily', [3, 4])])
+
+    def test_backfill(self):
+        for executor in ('thread', 'process'):
+            backfill = self._backfill(executor)
+            result = backfill.execute({'root': self.temp_dir})
+            self.assertEqual(list(result), self.days)
+            self.assertEqual(self.shared.calls, 1)
+            self.assertEqual(self.range.range_calls, 1)
+            for day in self.days:
+                self.assertEqual(result[day]['stock_list'], ['600000', '000001'])
+                self.assertNotIn('ignored', result[day])
+                with open(os.path.join(self.temp_dir, str(day), 'total.txt')) as f:
+                    self.assertEqual(f.read(), str(day * 2))
+            self.assertEqual(backfill.failed_days, {})
+            self.assertEqual(backfill.run_report.status, 'completed')
+            if executor == 'process':
+                self.assertNotIn(os.getpid(), {data['pid'] for data in result.values()})
+
+    def test_failed_days(self):
+        backfill = self._backfill()
+        result = backfill.execute({'root': self.temp_dir, 'fail_date': 20250826, 'stop_date': 20250827})
+        self.assertEqual(list(result), [20250825])
+        self.assertEqual(set(backfill.failed_days), {20250826, 20250827})
+        self.assertEqual(backfill.run_report.status, 'interrupted')
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, '20250826')))
+
+    def test_daily_retry(self):
+        """按日处理器与Workflow一样重试，运行报告按 处理器名@日期 记录"""
+        self.config.set('workflow', {'max_retries': 2, 'retry_backoff': 0.01})
+        backfill = Backfill(self.config, self.logger, self.days, max_workers=1, executor='thread')
+        backfill.add_processor(FlakyProcessor(self.config, self.logger, failures=1))
+        result = backfill.execute({})
+        self.assertEqual(list(result), self.days)
+        metrics = {item['name']: item for item in backfill.run_report.processors}
+        self.assertEqual(set(metrics), {f"FlakyProcessor@{day}" for day in self.days})
+        self.assertEqual(metrics['FlakyProcessor@20250825']['attempts'], 2)
+
+    def test_daily_timeout(self):
+        """挂起的日期按处理器超时或回补总超时终止，不会一直等待"""
+        for workflow_config, processor_timeout, error in (({}, 0.2, ProcessorTimeout),
+                                                          ({'timeout': 0.3}, None, WorkflowTimeout)):
+            with self.subTest(error=error.__name__):
+                self.config.set('workflow', workflow_config)
+                backfill = Backfill(self.config, self.logger, self.days, max_workers=2, executor='thread')
+                slow = SlowProcessor(self.config, self.logger, seconds=5, timeout=processor_timeout)
+                backfill.add_processor(slow)
+                start = time.perf_counter()
+                with self.assertRaises(error):
+                    backfill.execute({})
+                self.assertLess(time.perf_counter() - start, 2)
+                self.assertEqual(backfill.run_report.status, 'timeout')
+                self.assertTrue(slow.observed_cancel.wait(1))
+
+
+
+class TestPreprocessor(unittest.TestCase):
+    """超出交易日历范围的日期无法对齐，中断工作流"""
+
+    def setUp(self):
+        from tdx.ma50.preprocessor import Preprocessor
+        self.processor = Preprocessor(Config(), WorkflowLogger(name="test_preprocessor", log_level="CRITICAL"))
+
+    def test_invalid_date(self):
+        data = {'target_date': 19910101}
+        self.assertEqual(self.processor.process(data), (data, False))
+
+    def test_invalid_date_range(self):
+        days_data = {19910101: {}, 20250829: {}}
+        self.assertEqual(self.processor.process_range(days_data), ({19910101: {}, 20250829: {}}, False))
+
+    def test_align_dates(self):
+        aligned = self.processor._align_dates([19910101, 20250830])
+        self.assertEqual(self.processor._invalid_days([19910101, 20250830], aligned), [19910101])
+        self.assertEqual(int(aligned[0][1]), 20250829)
+
+
+class StubProcessor(BaseProcessor):
+    """替换工作流入口中的处理器，记录执行顺序（类名、回补日期）"""
+    calls = []
+    temp_dir = None
+    file_names = ()
+
+    def process(self, data):
+        data = data if isinstance(data, dict) else {}
+        StubProcessor.calls.append((self.__class__.__name__, data.get('target_date')))
+        day = data.get('target_date') or 20250829
+        if 'today_int' in (self.writes or ()):
+            data['today_int'] = day
+        if 'temp_dir_path' in (self.writes or ()):
+            data['temp_dir_path'] = os.path.join(StubProcessor.temp_dir, str(day))
+            os.makedirs(data['temp_dir_path'], exist_ok=True)
+        for name in self.file_names:
+            records = np.zeros(1, dtype=DAT_DTYPE)
+            records['date_int'] = day
+            write_dat_array(data['temp_dir_path'] + "\\" + f"{name}.dat", records)
+        return data, True
+
+
+def stub(name, **attrs):
+    return type(name, (StubProcessor,), dict({'reads': (), 'writes': ()}, **attrs))
+
+
+class TestWorkflowEntryPoints(unittest.TestCase):
+    """以替换的处理器执行工作流入口main"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        StubProcessor.calls = []
+        StubProcessor.temp_dir = self.temp_dir
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _write_config(self, file_name):
+        with open(os.path.join(self.temp_dir, file_name), 'w', encoding='utf-8') as f:
+            f.write('logging:\n  level: "CRITICAL"\n')
+
+    def test_combine_workflow_main(self):
+        from tdx.ma50 import combine_workflow
+        self._write_config('ma50_config.yaml')
+        stubs = {'Preprocessor': stub('Preprocessor', writes=('today_int',)),
+                 'TempDirProcessor': stub('TempDirProcessor', writes=('temp_dir_path',)),
+                 'ApppendProcessor': stub('ApppendProcessor')}
+        with mock.patch.multiple(combine_workflow, **stubs):
+            combine_workflow.main([])
+            expected = [('Preprocessor', None), ('TempDirProcessor', None), ('ApppendProcessor', None)]
+            self.assertEqual(StubProcessor.calls, expected)
+
+            StubProcessor.calls = []
+            combine_workflow.main(['--resume'])
+            self.assertEqual(StubProcessor.calls, expected)
+
+    @unittest.skipUnless(importlib.util.find_spec('hikyuu'), "需要hikyuu")
+    def test_extdata_workflow_main(self):
+        from tdx.ind import extdata_workflow
+        self._write_config('ind_config.yaml')
+        stubs = {'Preprocessor': stub('Preprocessor', writes=('today_int',)),
+                 'TempDirProcessor': stub('TempDirProcessor', writes=('temp_dir_path',)),
+                 'StockListProcessor': stub('StockListProcessor', shared=True),
+                 'NLNHProcessor': stub('NLNHProcessor', file_names=('extdata_65',)),
+                 'EndProcessor': stub('EndProcessor', shared=True)}
+        with mock.patch.multiple(extdata_workflow, **stubs):
+            extdata_workflow.main([])
+            self.assertEqual([name for name, _ in StubProcessor.calls],
+                             ['Preprocessor', 'TempDirProcessor', 'StockListProcessor', 'NLNHProcessor',
+                              'EndProcessor'])
+
+            StubProcessor.calls = []
+            output_dir = os.path.join(self.temp_dir, 'consolidated')
+            extdata_workflow.main(['--start', '20250825', '--end', '20250827', '--consolidate', output_dir])
+            self.assertEqual(sorted(day for name, day in StubProcessor.calls if name == 'NLNHProcessor'),
+                             [20250825, 20250826, 20250827])
+            records = read_dat_array(os.path.join(output_dir, 'extdata_65.dat'))
+            self.assertEqual(records['date_int'].tolist(), [20250825, 20250826, 20250827])
+
+
+if __name__ == '__main__':
+    unittest.main()